@@ -1 +1,4 @@
-__all__ = ["ant"]
+__all__ = ["ant", "simdisplay", "scores", "store", "asynclog", "fliptiming", "timeline", "stimcache", "benchstartup",
+           "participant", "logarchive", "gaze", "epochs", "responses", "adaptive",
+           "design", "benchtiming", "collector", "runstats",
+           "clocksync", "profiler", "render", "calibration", "codes"]
@@ -0,0 +1,102 @@
+"""
+Adaptive, early stopping scheduling of ANT procedures
+
+The AdaptiveScheduler keeps running estimates (a runstats.RunningStats of the correct RTs per
+warning type and per congruency) of the three network scores and their standard errors, and runs
+procedures in rounds until all of them are estimated to within the requested precision. Every
+procedure is run once per round, in a fresh random order, and the estimates are only checked at
+the end of a round, so the design stays balanced across cue, location, direction and flankers and
+conditions don't cluster within a round: the estimates only decide how many rounds are run.
+
+    scheduler = AdaptiveScheduler(exp.procedures, precision=0.010)
+    data = exp.adaptiveExperiment(scheduler)
+"""
+import numpy as np
+
+from ant import Bunch
+from codes import warningCodes, congruencyCodes
+from runstats import RunningStats
+
+# The two warning types and two congruencies whose mean RT difference make up each network score
+_alerting = (warningCodes['no'], warningCodes['double'])
+_orienting = (warningCodes['center'], warningCodes['spatial'])
+_executive = (congruencyCodes['incongruent'], congruencyCodes['congruent'])
+
+
+class AdaptiveScheduler(object):
+    """Chooses the next procedure and decides when the network scores are known well enough
+
+    procedures -- the procedures to choose from (ANTExp.procedures)
+    precision -- target standard error (s) of every network score
+    minTrials -- never stop before this many trials
+    maxTrials -- always stop after this many trials (a multiple of the number of procedures keeps the
+                 last round complete)
+    rng -- a numpy RandomState used to order the procedures of each round (default is the global numpy
+           random state)
+    """
+    def __init__(self, procedures, precision=0.010, minTrials=48, maxTrials=6*48, rng=None):
+        self.procedures = procedures
+        self.precision = precision
+        self.minTrials = minTrials
+        self.maxTrials = maxTrials
+        self.rng = rng if rng is not None else np.random
+
+        self.warning = np.array([p.warning for p in procedures])
+        self.congruency = np.array([p.congruency for p in procedures])
+        self.runs = np.zeros(len(procedures), dtype=np.int64)
+        self.nTrials = 0
+        self.round = []             # the procedures still to run in this round, last one first
+
+        # Running statistics of correct RTs, per warning type and per congruency
+        self.stats = RunningStats()
+
+    def update(self, index, rt, correct):
+        """Add the outcome of running procedure index"""
+        self.runs[index] += 1
+        self.nTrials += 1
+        self.stats.update(self.warning[index], self.congruency[index], rt, correct)
+
+    def _groups(self, factor):
+        return self.stats.byWarning if factor == 'warning' else self.stats.byCongruency
+
+    def _count(self, factor):
+        """Number of correct trials of each warning type or congruency"""
+        return np.array([g.moments.n for g in self._groups(factor)], dtype=np.float64)
+
+    def _varianceOfMean(self, factor):
+        """Variance of each cell mean (infinite until a cell has 2 correct trials)"""
+        n = self._count(factor)
+        var = np.array([g.moments.variance() if g.moments.n > 1 else np.inf for g in self._groups(factor)])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(n > 0, var / n, np.inf)
+
+    def estimates(self):
+        """Return a Bunch of the current network scores and their standard errors (s)"""
+        vw = self._varianceOfMean('warning')
+        vc = self._varianceOfMean('congruency')
+        mw = np.array([g.moments.mean for g in self.stats.byWarning])
+        mc = np.array([g.moments.mean for g in self.stats.byCongruency])
+        return Bunch(alerting=mw[_alerting[0]] - mw[_alerting[1]],
+                     orienting=mw[_orienting[0]] - mw[_orienting[1]],
+                     executive=mc[_executive[0]] - mc[_executive[1]],
+                     alertingSE=np.sqrt(vw[_alerting[0]] + vw[_alerting[1]]),
+                     orientingSE=np.sqrt(vw[_orienting[0]] + vw[_orienting[1]]),
+                     executiveSE=np.sqrt(vc[_executive[0]] + vc[_executive[1]]),
+                     nTrials=self.nTrials)
+
+    def done(self):
+        """True at the end of a round once all network scores are precise enough, or when we have run
+        maxTrials
+        """
+        if self.nTrials >= self.maxTrials:
+            return True
+        if self.nTrials < self.minTrials or self.runs.min() != self.runs.max():
+            return False
+        e = self.estimates()
+        return max(e.alertingSE, e.orientingSE, e.executiveSE) <= self.precision
+
+    def next(self):
+        """Return the index of the procedure to run next"""
+        if not self.round:
+            self.round = list(self.rng.permutation(len(self.procedures)))
+        return int(self.round.pop())
@@ -32,16 +32,99 @@ __status__ = "Beta"
 
 import sys
 
-from psychopy import visual, core, event, monitors, tools
-import pyglet
 import time
 import numpy as np
-import random as random
+
+from asynclog import AsyncLogWriter
+from codes import warningCodes, congruencyCodes, locationCodes, directionCodes, keyDirections
+from fliptiming import FlipMonitor, CUE, FIXATION, TARGET, END
+from timeline import blockTimeline
+from stimcache import crop
+from runstats import RunningStats
 
 class Bunch(object):
     def __init__(self, **kwds):
         self.__dict__.update(kwds)
 
+# The (12) targets, as (location, direction, flankers); a Procedure refers to its target by index
+targets = [(tloc, tdir, flank) for tloc in ('top', 'bottom') for tdir in ('left', 'right')
+           for flank in ('incongruent', 'neutral', 'congruent')]
+targetNames = [tloc+tdir+flank for tloc, tdir, flank in targets]
+
+class Procedure(object):
+    """One combination of cue, target location, direction and flankers
+
+    Besides the names (cue, tloc, tdir, flank) it holds their integer codes (warning, location,
+    direction, congruency), its index, the index of its target in targets and the names as they
+    are logged (text), so nothing needs to be looked up or formatted by name during a trial
+    """
+    __slots__ = ('cue', 'tloc', 'tdir', 'flank', 'index', 'warning', 'location', 'direction', 'congruency',
+                 'target', 'text')
+
+    def __init__(self, cue, tloc, tdir, flank, index):
+        self.cue = cue
+        self.tloc = tloc
+        self.tdir = tdir
+        self.flank = flank
+        self.index = index
+        self.warning = warningCodes[cue]
+        self.location = locationCodes[tloc]
+        self.direction = directionCodes[tdir]
+        self.congruency = congruencyCodes[flank]
+        self.target = targets.index((tloc, tdir, flank))
+        self.text = "%s;%s;%s;%s" % (cue, tloc, tdir, flank)
+
+def allProcedures():
+    """Return a list of all (48) combinations of cue, location, direction and flankers"""
+    procedures = [None] * 48
+    i = 0
+    for cue in ('no', 'spatial', 'center', 'double'):
+        for tloc, tdir, flank in targets:
+            procedures[i] = Procedure(cue, tloc, tdir, flank, i)
+            i += 1
+    return procedures
+
+class PsychoPyBackend(object):
+    """The default backend, running the experiment on a real PsychoPy window, clock and keyboard
+
+    A backend bundles everything ANTExp needs from PsychoPy apart from the window and the clock
+    (which are passed to ANTExp directly): a visual module to create stimuli from, waiting, keyboard
+    handling and unit conversion. See simdisplay.SimBackend for a headless alternative.
+
+    PsychoPy is only imported when the backend is created, so importing this module stays cheap.
+    """
+    def __init__(self):
+        from psychopy import visual, core, event
+        self.visual = visual
+        self.core = core
+        self.event = event
+
+    def startTrial(self, condition):
+        """Called at the start of every procedure; a real participant doesn't need to be told"""
+        pass
+
+    def wait(self, secs, hogCPUperiod=0.2):
+        self.core.wait(secs, hogCPUperiod)
+
+    def waitKeys(self, maxWait=float('inf'), timeStamped=False):
+        return self.event.waitKeys(maxWait=maxWait, timeStamped=timeStamped)
+
+    def clearEvents(self, eventType=None):
+        self.event.clearEvents(eventType=eventType)
+
+    def deg2pix(self, degrees, mon):
+        from psychopy.tools.monitorunittools import deg2pix
+        return deg2pix(degrees, mon)
+
+    def bufferImage(self, stim):
+        """Return the pixels (RGBA, rows from the top) captured by a BufferImageStim"""
+        return np.asarray(stim.image)
+
+    def imageStim(self, win, image, pos):
+        """Return a stimulus showing image (as returned by bufferImage) centered at pos (pixels)"""
+        from PIL import Image
+        return self.visual.ImageStim(win, image=Image.fromarray(image), units='pix', pos=pos, size=image.shape[1::-1])
+
 # Experimental setup
 class ANTExp:
     """This class implements the ANT (Attention Network Test) in PsychoPy2
@@ -74,6 +157,9 @@ class ANTExp:
             else:
                 allData = np.concatenate((allData, block))
 
+        # Write any pending log records
+        exp.close()
+
         # do something with allData
 
 
@@ -88,11 +174,11 @@ class ANTExp:
         a = self.cueSize/2.
         vertices = [[0,0], [0,a], [0,-a], [0,0], [-a,0], [a,0], [0,0]]
 
-        return visual.ShapeStim(self.win, fillColor=None, lineColor='black', 
+        return self.backend.visual.ShapeStim(self.win, fillColor=None, lineColor='black', 
                 lineWidth=self.allWidthPix, units='deg', vertices=vertices)
 
-    def _cueStim(self):
-        """Returns a cue '*' (as a visual) to be drawn later"""
+    def _cueStim(self, pos=(0, 0)):
+        """Returns a cue '*' (as a visual) at pos to be drawn later"""
         a = self.cueSize/2.
         w = self.cueSize/20.
         c1 = a*0.9511
@@ -102,8 +188,8 @@ class ANTExp:
 
         vertices = [[0,0], [0,a], [0,0], [c1, s1], [0,0], [c2, -s2], [0,0], [-c2, -s2], [0,0], [-c1, s1], [0,0]]
 
-        return visual.ShapeStim(self.win, fillColor=None, lineColor='black', 
-                lineWidth=self.allWidthPix, units='deg', vertices=vertices)
+        return self.backend.visual.ShapeStim(self.win, fillColor=None, lineColor='black', 
+                lineWidth=self.allWidthPix, units='deg', vertices=vertices, pos=pos)
 
     def _drawLine(self, pos, sz, pw, short, tdir):
         """Return a tdir (left or right) line of width pw at pos of given sz, 
@@ -116,7 +202,7 @@ class ANTExp:
             vertices = [[-a, pw], [a/3.0, pw], [a/3.0, -pw], [-a, -pw]]
         else:
             vertices = [[-a, pw], [a, pw], [a, -pw], [-a, -pw]]
-        return visual.ShapeStim(self.win, pos=pos, lineColor=None, fillColor='black', units='deg', vertices=vertices)
+        return self.backend.visual.ShapeStim(self.win, pos=pos, lineColor=None, fillColor='black', units='deg', vertices=vertices)
 
     def _drawHead(self, pos, sz, pw, tdir):
         """Return an arrowhead (left or right, depending on tdir) fitting with a short line"""
@@ -125,7 +211,7 @@ class ANTExp:
             vertices = [[-a/3.0, a/3.0], [-a, 0], [-a/3.0, -a/3.0]]
         elif tdir=='right':
             vertices = [[a/3.0, a/3.0], [a, 0], [a/3.0, -a/3.0]]
-        return visual.ShapeStim(self.win, pos=pos, lineColor=None, fillColor='black', units='deg', vertices=vertices)
+        return self.backend.visual.ShapeStim(self.win, pos=pos, lineColor=None, fillColor='black', units='deg', vertices=vertices)
 
 
     def _targetStim(self, tloc, tdir, flank):
@@ -156,9 +242,66 @@ class ANTExp:
             lines = lines + [ self._drawLine((0, y), sz, pw, True, tdir) ]
             heads = heads + [ self._drawHead((0, y), sz, pw, tdir) ]
 
-        return visual.BufferImageStim(self.win, stim=(lines + heads))
+        # When precomposing, the fixation cross is part of the target screen
+        fixation = [self.visFix] if self.precompose and self.original else []
+
+        return self.backend.visual.BufferImageStim(self.win, stim=(lines + heads + fixation))
 
-    def __init__(self, mon, win, winsize, refreshRate, clock, startTime, logfile=None, runDummy=False, original=True):
+    def _buildTargets(self):
+        """Generator building all (12) targets into self.visTarget (indexed as targets), one for each step
+
+        The targets are loaded from the stimulus cache if possible, and otherwise saved to it together
+        with the last target
+        """
+        if self.stimCache is not None:
+            params = self.stimCache.params(self)
+            cached = self.stimCache.load(params)
+            if cached is not None:
+                for t, name in enumerate(targetNames):
+                    image, pos = cached[name]
+                    self.visTarget[t] = self._profiled(self.backend.imageStim(self.win, image, pos))
+                return
+
+        for t, (tloc, tdir, flank) in enumerate(targets):
+            # No step after the last target, so the cache is saved by whichever call builds it
+            if t > 0:
+                yield
+            self.visTarget[t] = self._profiled(self._targetStim(tloc, tdir, flank))
+
+        if self.stimCache is not None or self.precompose:
+            # Use the targets cropped to the arrows from now on (same as when loaded from the cache), so
+            # a flip only draws the pixels they cover rather than a full window texture
+            textures = [crop(self.backend.bufferImage(stim)) for stim in self.visTarget]
+            if self.stimCache is not None:
+                self.stimCache.save(params, dict(zip(targetNames, textures)))
+            for t, (image, pos) in enumerate(textures):
+                self.visTarget[t] = self._profiled(self.backend.imageStim(self.win, image, pos))
+
+    def _compose(self, stims):
+        """Render stims into a single image stimulus, cropped to the pixels they cover"""
+        image, pos = crop(self.backend.bufferImage(self.backend.visual.BufferImageStim(self.win, stim=stims)))
+        return self.backend.imageStim(self.win, image, pos)
+
+    def _profiled(self, stim):
+        """Have the profiler (if any) time the drawing of stim; returns stim"""
+        if self.profiler is not None:
+            self.profiler.wrap(stim, 'draw', 'draw')
+        return stim
+
+    def _buildNextTarget(self):
+        """Build one more target if they are built lazily; returns False once all targets are ready"""
+        if self._targetBuilder is None:
+            return False
+        try:
+            next(self._targetBuilder)
+            return True
+        except StopIteration:
+            self._targetBuilder = None
+            return False
+
+    def __init__(self, mon, win, winsize, refreshRate, clock, startTime, logfile=None, runDummy=False, original=True,
+                 backend=None, store=None, logFlips=False, stimCache=None, lazyTargets=False,
+                 gaze=None, responses=None, precompose=False, clockSync=None, profiler=None, calibration=None, rng=None):
         """Create an ANTExp class at the specified monitor/window of given size and refreshrate
 
         mon -- the (PsychoPy) monitor spec; needed to determine correct scale
@@ -170,6 +313,27 @@ class ANTExp:
         logFile -- an open file that is used for printing results to (if not given, then stdout is used)
         runDummy -- removes arrowheads; can be used when no response is solicited from the user
         original -- can be set to False to remove fixation crosses after the user has replied
+        backend -- provides stimuli, waiting and keyboard handling (default is PsychoPyBackend); use
+                   simdisplay.SimBackend together with a SimWindow and SimClock to run without a display
+        store -- an optional store.SessionStore, to which every completed trial is written in place
+        logFlips -- write a summary of the flip timing (see fliptiming) to the log after each block
+        stimCache -- an optional stimcache.StimCache, used to load (or store) the rendered targets
+        lazyTargets -- don't build the targets up front, but while waiting for keys in displayText
+                       (e.g. during the instructions); a procedure only waits for its own target
+        gaze -- an optional (started) gaze.GazeRecorder on the same clock; each procedure's result then
+                holds the range of sample indices recorded during it as gaze=(start, stop)
+        responses -- an optional (started) responses.ResponseCollector on the same clock, used instead of the
+                     backend to collect responses (timestamped on detection by a polling thread)
+        precompose -- render every cue and target screen (with its fixation cross) into a single image
+                      up front, cropped to the stimuli, so every flip of a procedure takes exactly one
+                      (small) draw call
+        clockSync -- an optional (started) clocksync.ClockSync with clock as its reference and a 'wall' source;
+                     wall times are then mapped through its drift model rather than offset by startTime
+        profiler -- an optional profiler.Profiler, recording how long each phase of every procedure takes
+        calibration -- an optional calibration.RefreshCalibration giving refreshRate from its cache; the rate is
+                       verified (and if needed recalibrated and taken into use) while text is displayed
+        rng -- a numpy RandomState drawing both the procedure orders and the random timings (default is a new,
+               randomly seeded one); seed it to make a session reproducible
 
         """
         self.mon = mon
@@ -182,11 +346,28 @@ class ANTExp:
         self.logfile = logfile
         self.runDummy = runDummy
         self.original = original
-
-        if logfile:
-            logfile.write("wallt;t0;warning;position;direction;congruency;d1;ct;d2;rt;tf;response\n")
-        else:
-            print("wallt;t0;warning;position;direction;congruency;d1;ct;d2;rt;tf;response")
+        self.backend = backend if backend is not None else PsychoPyBackend()
+        self.store = store
+        self.blockN = 0
+        self.logFlips = logFlips
+        self.flips = FlipMonitor(self.frameTime)
+        self.stimCache = stimCache
+        self.gaze = gaze
+        self.responses = responses
+        self.keyboard = responses if responses is not None else self.backend
+        self.precompose = precompose
+        self.clockSync = clockSync
+        self.profiler = profiler
+        self.calibration = calibration
+        self.rng = rng if rng is not None else np.random.RandomState()
+
+        # Running statistics of the session, and who to tell after every trial
+        self.stats = RunningStats()
+        self.subscribers = []
+
+        # All logging is done from a background thread, so it never delays a trial
+        self.log = AsyncLogWriter(logfile if logfile else sys.stdout)
+        self.log.text("wallt;t0;warning;position;direction;congruency;d1;ct;d2;rt;tf;response")
 
 
         ### BEGIN Semi-configurable values
@@ -199,38 +380,108 @@ class ANTExp:
         self.tDummy = 700                   # TIme to show target when running dummy
         self.tExp   = 4000                  # Total procedure time
 
+        # Waiting for a flip
+        self.flipMargin = 0.5               # Stop waiting this many frames before the flip deadline
+        self.hogCPUframes = 0.5             # Busy-wait (rather than sleep) for the last this many frames of a wait
+
         # Visual setup
         self.arrowSize  = 0.55              # Size of an arrow (visual angle)
         self.arrowSep   = 0.06              # Separation between arrows (visual angle)
         self.cueSize    = 0.35              # Size of the fixation and the cue (size from opensesame implementation)
         self.allWidthDeg  = 0.04            # Linewidth of stimuli (visual angle)
-        self.allWidthPix  = tools.monitorunittools.deg2pix(self.allWidthDeg, mon) # Linewidth of stimuli (in pixels!)
+        self.allWidthPix  = self.backend.deg2pix(self.allWidthDeg, mon) # Linewidth of stimuli (in pixels!)
 
         self.targetDist = 1.06              # Vertical distance from fixation center to target center
         ### END (Semi-)configurable options
 
-        # Set up the experimental combinations, creating a list of all combinations of cue, location, direction and flankers
-        self.procedures = [Bunch()] * 48
-        i = 0
-        for cue in ('no', 'spatial', 'center', 'double'):
-            for tloc in ('top', 'bottom'):
-                for tdir in ('left', 'right'):
-                    for flank in ('incongruent', 'neutral', 'congruent'):
-                        self.procedures[i] = Bunch(cue=cue, tloc=tloc, tdir=tdir, flank=flank)
-                        i += 1
+        # Set up the experimental combinations
+        self.procedures = allProcedures()
+
+        # Result buffer reused by every fullExperiment call
+        self.expData = np.zeros((len(self.procedures), 11))
 
         # Create visual stimuli to be used (fixation cross and cues and all targets)
         self.visFix = self._fixStim()
         self.visCue = self._cueStim()
+        visCueTop = self._cueStim((0, self.targetDist))
+        visCueBottom = self._cueStim((0, -self.targetDist))
+
+        # The stimuli making up the cue screen of each warning type and target location
+        fix = [self.visFix] if self.original else []
+        self.cueScreens = [None] * len(warningCodes)
+        self.cueScreens[warningCodes['no']] = [[self.visFix], [self.visFix]]
+        self.cueScreens[warningCodes['center']] = [[self.visCue], [self.visCue]]
+        self.cueScreens[warningCodes['double']] = [fix + [visCueTop, visCueBottom]] * 2
+        self.cueScreens[warningCodes['spatial']] = [fix + [visCueTop], fix + [visCueBottom]]
+        if precompose:
+            composed = {}
+            for screens in self.cueScreens:
+                for i, stims in enumerate(screens):
+                    if len(stims) > 1:
+                        key = tuple(id(s) for s in stims)
+                        if key not in composed:
+                            composed[key] = self._compose(stims)
+                        screens[i] = [composed[key]]
+
+        self.visTarget = [None] * len(targets)
+        self._targetBuilder = self._buildTargets()
+        if not lazyTargets:
+            while self._buildNextTarget():
+                pass
+
+        # The window, backend and keyboard calls made by procedures; timed versions when profiling, so
+        # the objects themselves (which belong to the caller) are left alone
+        self._wait, self._flip = self.backend.wait, self.win.flip
+        self._clearEvents, self._waitKeys = self.keyboard.clearEvents, self.keyboard.waitKeys
+        if profiler is not None:
+            for screens in self.cueScreens:
+                for stims in screens:
+                    for stim in stims:
+                        self._profiled(stim)
+            profiler.wrap(self, '_oneProcedure', 'trial')
+            profiler.wrap(self, '_recordTrial', 'record')
+            self._wait = profiler.timed(self._wait, 'wait')
+            self._flip = profiler.timed(self._flip, 'flip')
+            self._clearEvents = profiler.timed(self._clearEvents, 'clearEvents')
+            self._waitKeys = profiler.timed(self._waitKeys, 'waitKeys')
+
+
+    def _stepCalibration(self, stims=()):
+        """Redraw stims and flip one frame of any pending refresh rate check; returns False when done"""
+        if self.calibration is None:
+            return False
 
-        self.visTarget ={}
-        for tloc in ('top', 'bottom'):
-            for tdir in ('left', 'right'):
-                for flank in ('incongruent', 'neutral', 'congruent'):
-                    self.visTarget[tloc+tdir+flank] = self._targetStim(tloc, tdir, flank)
-
-
-    def _oneProcedure(self, condition, short=False):
+        def draw():
+            for stim in stims:
+                stim.draw()
+        if self.calibration.step(draw):
+            return True
+        self._setRefreshRate(self.calibration.refreshRate)
+        return False
+
+    def _setRefreshRate(self, refreshRate):
+        """Take a (re)calibrated refresh rate into use; only done before the first block is run"""
+        if refreshRate is None or refreshRate == self.refreshRate:
+            return
+        self.log.message("Refresh rate recalibrated to %0.3f Hz (was %0.3f Hz)", refreshRate, self.refreshRate)
+        self.refreshRate = refreshRate
+        self.frameTime = 1.0 / refreshRate
+        # Keep the flips (and block number) recorded so far
+        self.flips.setFrameTime(self.frameTime)
+
+    def _timeline(self, order, rng=None):
+        """Precompute the frame timing (see timeline.blockTimeline) of running the procedures in order"""
+        # The frame timing depends on the refresh rate, so any check of it still running is completed first
+        if self.calibration is not None and self.calibration.pending:
+            wait = self.backend.visual.TextStim(self.win, alignHoriz='center', wrapWidth=12, height=0.01, color='black',
+                                                text="Please wait (checking screen timing)...")
+            while self._stepCalibration([wait]):
+                pass
+        return blockTimeline(order, self.frameTime, self.tD1min, self.tD1max, self.tCue, self.tNoCue,
+                             self.tDummy if self.runDummy else self.tOut, self.tExp,
+                             rng if rng is not None else self.rng)
+
+    def _oneProcedure(self, condition, short=False, frames=None):
         """Presents one complete 'procedure' of (initial fixation, cue, wait, target and response and final delay)
 
         Returns the timing for said procedure, using the clock set up initially or None if the user halted!
@@ -245,140 +496,180 @@ class ANTExp:
             Flip window and wait until retrace
             (Repeat for next stimuli)
 
-        condition -- the condition requested (cue, tloc, pos)
+        condition -- the condition requested (a Procedure)
         short -- can be used to shorten the waiting time after the user has replied;
                  this can be helpful in the practice rounds (but was likely not present in the original experiment).
+        frames -- this procedure's row of a precomputed block timeline (see _timeline); if not given,
+                  one is drawn for this procedure alone
 
         """
 
-        def waitAndFlip(t):
-            """Wait until next flip after time t (offset to self.clock) has passed, then flip (once only!)
+        def waitAndFlip(t, phase):
+            """Wait until flipMargin frames before time t (offset to self.clock), then flip (once only!)
+            so the flip happens at the retrace due at t
+
+            The flip is recorded (as the given phase) against its deadline t in self.flips
 
             Returns time of flip (also offset to self.clock)
             """
 
-            core.wait(t - self.clock.getTime() - self.frameTime, self.frameTime/2.0)
+            self._wait(t - self.clock.getTime() - self.flipMargin*self.frameTime, self.hogCPUframes*self.frameTime)
 
-            self.win.flip()
+            self._flip()
 
-            return self.clock.getTime()
+            now = self.clock.getTime()
+            self.flips.record(phase, condition.index, t, now)
+            return now
+
+        # Make sure our target is ready (only needed if targets are built lazily)
+        target = condition.target
+        while self.visTarget[target] is None and self._buildNextTarget():
+            pass
 
         quit = False
+        self.backend.startTrial(condition)
 
         # Draw initial fixation cross and get start-time from the global clock (no previous stimuli)
         self.visFix.draw()
-        self.win.flip()
+        self._flip()
         t0 = self.clock.getTime()
+        gazeStart = self.gaze.n if self.gaze is not None else None
 
-        # Pull a random waiting time
-        r = random.randrange(self.tD1min, self.tD1max, 10)
+        if frames is None:
+            frames = self._timeline([condition.index])[0]
+        f = self.frameTime
 
         # Draw cue (if any)
-        if condition.cue != 'no':
-            if condition.cue == 'double' or (condition.cue == 'spatial' and condition.tloc == 'top'):
-                if self.original:
-                    self.visFix.draw()
-                self.visCue.pos = (0,  self.targetDist)
-                self.visCue.draw()
-            if condition.cue == 'double' or (condition.cue == 'spatial' and condition.tloc == 'bottom'):
-                if self.original:
-                    self.visFix.draw()
-                self.visCue.pos = (0, -self.targetDist)
-                self.visCue.draw()
-            if condition.cue == 'center':
-                self.visCue.pos = (0, 0)
-                self.visCue.draw()
-        else:
-            self.visFix.draw()
+        for stim in self.cueScreens[condition.warning][condition.location]:
+            stim.draw()
 
-        # Wait random time and Present cue when ready
-        d1 = waitAndFlip(t0 + r/1000.0) - t0
+        # Wait the random fixation time and present cue when ready
+        d1 = waitAndFlip(t0 + frames['cue']*f, CUE) - t0
 
         # Draw fixation cross again
         self.visFix.draw()
 
         # Wait for cue time and present fixation cross again when ready
-        ct = waitAndFlip(t0 + d1 + 0.1) - t0 - d1
+        ct = waitAndFlip(t0 + frames['fixation']*f, FIXATION) - t0 - d1
 
         # Draw target
-        self.visTarget[condition.tloc+condition.tdir+condition.flank].draw()
-        if self.original:
+        self.visTarget[target].draw()
+        if self.original and not self.precompose:
             self.visFix.draw()
 
         # Wait for 2nd fixation time and Present target when ready
-        d2 = waitAndFlip(t0 + d1 + 0.1 + 0.4) - t0 - d1 - ct
+        d2 = waitAndFlip(t0 + frames['target']*f, TARGET) - t0 - d1 - ct
 
         # Discard any buffered events (we don't accept extremely fast reaction times here!)
-        event.clearEvents(eventType='keyboard')
+        self._clearEvents(eventType='keyboard')
 
-        # Wait for user response or timeout
-        if self.runDummy:
-            keys = event.waitKeys(maxWait = self.tDummy/1000.0-self.frameTime, timeStamped=self.clock)
-        else:
-            keys = event.waitKeys(maxWait = self.tOut/1000.0-self.frameTime, timeStamped=self.clock)
+        # Wait for user response or timeout (one frame before the timeout, so the blank flip happens on time)
+        keys = self._waitKeys(maxWait = t0 + (frames['timeout']-1)*f - self.clock.getTime(), timeStamped=self.clock)
         if keys is not None:
-            print("Got %s at %s expecting %s" % (keys[0][0], keys[0][1], condition.tdir))
+            self.log.message("Got %s at %s expecting %s", keys[0][0], keys[0][1], condition.tdir)
             if keys[0][0] == 'escape':
                 quit = True
                 resp = 'QUIT'
             elif keys[0][0] == '0':
-                core.wait(100)
-            elif ((keys[0][0] == ('%s' % condition.tdir)) or
-                  (keys[0][0] in ['f', 'a', 'z', 'q'] and condition.tdir=='left') or
-                  (keys[0][0] in ['j', 'm', 'l', 'p'] and condition.tdir=='right')):
+                self.backend.wait(100)
+            elif keyDirections.get(keys[0][0]) == condition.direction:
                 resp = 'OK'
             else:
                 resp = 'NOK'
+            # Use the time the key was registered, not the time we got to look at it
+            rt = keys[0][1] - t0 - d2 - ct - d1
         else:
-            print("TIMEOUT")
+            self.log.message("TIMEOUT")
             resp = None
-        rt = self.clock.getTime() - t0 - d2 - ct - d1
+            rt = self.clock.getTime() - t0 - d2 - ct - d1
 
         # 'Blank' the screen and wait until we're done with this trial (minus one final flip)
         if self.original:
             self.visFix.draw()
-        self.win.flip()
+        self._flip()
         if self.original:
             self.visFix.draw()
         if not short:
-            tf = waitAndFlip(t0 + 4.0) - t0
+            tf = waitAndFlip(t0 + frames['end']*f, END) - t0
         else:
             tf = self.clock.getTime() - t0
 
         # print("At %0.3f/%0.3f [%s, %s, %s, %s]: d1=%0.3f, ct=%0.3f, d2=%0.3f, rt=%0.3f, tf=%0.3f, resp=%s" % 
         #         (self.startTime+t0, t0, condition.cue, condition.tloc, condition.tdir, condition.flank, d1, ct, d2, rt, tf, resp))
 
+        gazeStop = self.gaze.n if self.gaze is not None else None
+
         if quit:
             return None
         else:
-            return (Bunch(condition=condition, wt=self.startTime+t0, t0=t0, d1=d1, ct=ct, d2=d2, rt=rt, tf=tf, resp=resp))
+            wt = self.startTime+t0 if self.clockSync is None else float(self.clockSync.convert(t0, 'clock', 'wall'))
+            return (Bunch(condition=condition, wt=wt, t0=t0, d1=d1, ct=ct, d2=d2, rt=rt, tf=tf, resp=resp,
+                          gaze=(gazeStart, gazeStop)))
 
     def practiceBlock(self, maxrun=24):
         """Run a practice block with maxrun=24 (no more than 48!) procedures"""
-        for i in random.sample(xrange(len(self.procedures)), len(self.procedures)):
-            res = self._oneProcedure(self.procedures[i], True)  # True is probably not as original experiment
+        self.flips.block = -1
+        plan = self._timeline(self.rng.permutation(len(self.procedures)))
+        for frames in plan:
+            res = self._oneProcedure(self.procedures[frames['procedure']], True, frames)  # True is probably not as original experiment
 
             if res is None:
+                self.log.flush()
                 return False
 
             self.win.flip()
             if res.resp=='OK':
-                visual.TextStim(self.win, color='black', text="Correct reply (%0.3fs)" % (res.rt)).draw()
+                self.backend.visual.TextStim(self.win, color='black', text="Correct reply (%0.3fs)" % (res.rt)).draw()
             elif res.resp=='NOK':
-                visual.TextStim(self.win, color='red', text="Incorrect reply (%0.3fs)" % (res.rt)).draw()
+                self.backend.visual.TextStim(self.win, color='red', text="Incorrect reply (%0.3fs)" % (res.rt)).draw()
             else:
-                visual.TextStim(self.win, color='orange', text="No timely response recorded").draw()
+                self.backend.visual.TextStim(self.win, color='orange', text="No timely response recorded").draw()
             self.win.flip()
-            core.wait(2)
+            self.backend.wait(2)
 
             maxrun -= 1
             if maxrun==0:
                 return True
 
-    def fullExperiment(self, maxrun=None):
+    def _recordTrial(self, i, res):
+        """Log (and store) the result res of running procedure i; returns it as a row of results"""
+        self.log.trial(res)
+
+        cond = self.procedures[i]
+        row = (res.t0, i, cond.warning, cond.congruency, res.d1, res.ct, res.d2, res.rt, res.tf, 1 if res.resp=='OK' else 0, 1)
+        if self.store is not None:
+            self.store.append(self.blockN, i, cond.warning, cond.congruency, res)
+
+        self.stats.update(cond.warning, cond.congruency, res.rt, res.resp=='OK')
+        for callback in self.subscribers:
+            callback(res, self.stats)
+
+        return row
+
+    def _endBlock(self):
+        """Write block summaries and make sure everything from this block is logged and stored"""
+        if self.logFlips:
+            self.log.message("Block %d flip timing: %s", self.blockN, self.flips.summary(self.blockN))
+        if self.responses is not None:
+            stats = self.responses.pollStats()
+            self.log.message("Block %d response polling: %d polls, interval mean %0.3f ms, 99%% %0.3f ms, max %0.3f ms",
+                             self.blockN, stats.nPolls, 1000*stats.mean, 1000*stats.p99, 1000*stats.max)
+        self.blockN += 1
+        self.log.flush()
+        if self.store is not None:
+            self.store.flush()
+
+    def _abortBlock(self):
+        """Make sure everything is logged and stored when the user quits"""
+        self.log.flush()
+        if self.store is not None:
+            self.store.flush()
+
+    def fullExperiment(self, maxrun=None, order=None):
         """Run half of a real experiment in a random sequence (in total 48 target presentation)
 
-        Use maxrun to limit the number of runs (mainly useful for testing)
+        Use maxrun to limit the number of runs (mainly useful for testing), and order to run the
+        procedures in a given order (e.g. from design.generateOrders) rather than a random one
 
         Returns a numpy array of (completed) procedures -- not in the order executed -- each row containing
 
@@ -395,54 +686,81 @@ class ANTExp:
             * 1 indicating a completed experiment; should always be 1 in the returned array
 
         """
-        expData = np.zeros((len(self.procedures), 11))
-
-        def c2s(condition, sep=';'):
-            return "%s%s%s%s%s%s%s" % (condition.cue, sep, condition.tloc, sep, condition.tdir, sep, condition.flank)
-
-        for i in random.sample(xrange(len(self.procedures)), len(self.procedures)):
-            res = self._oneProcedure(self.procedures[i])
+        expData = self.expData
+        expData.fill(0)
+        self.flips.block = self.blockN
+
+        # Draw all random timings up front, quantized to whole frames
+        if order is None:
+            order = self.rng.permutation(len(self.procedures))
+        plan = self._timeline(order)
+
+        for frames in plan:
+            i = int(frames['procedure'])
+            res = self._oneProcedure(self.procedures[i], frames=frames)
             if res is None:
+                self._abortBlock()
                 return None
 
-            if self.logfile:
-                self.logfile.write("%0.3f;%0.3f;%s;%0.3f;%0.3f;%0.3f;%0.3f;%0.3f;%s\n" %
-                    (res.wt, res.t0, c2s(res.condition), res.d1, res.ct, res.d2, res.rt, res.tf, res.resp))
-            else:
-                print("%0.3f;%0.3f;%s;%0.3f;%0.3f;%0.3f;%0.3f;%0.3f;%s" %
-                    (res.wt, res.t0, c2s(res.condition), res.d1, res.ct, res.d2, res.rt, res.tf, res.resp))
-
-            cond = self.procedures[i]
-
-            if cond.cue=='no':
-                warningType = 0
-            elif cond.cue=='center':
-                warningType = 1
-            elif cond.cue=='double':
-                warningType = 2
-            elif cond.cue=='spatial':
-                warningType = 3
-            else:
-                sys.stderr.write("ERROR: Unknown cue '%s' in experiment. Programming error. Halting execution.\n" % cond.cue)
-
-            if cond.flank=='congruent':
-                congruency = 0
-            elif cond.flank=='incongruent':
-                congruency = 1
-            elif cond.flank=='neutral':
-                congruency = 2
-            else:
-                sys.stderr.write("ERROR: Unknown flank '%s' in experiment. Programming error. Halting execution.\n" % cond.flank)
-
-            expData[i] = (res.t0, i, warningType, congruency, res.d1, res.ct, res.d2, res.rt, res.tf, 1 if res.resp=='OK' else 0, 1)
+            expData[i] = self._recordTrial(i, res)
 
             if maxrun is not None:
                 maxrun -= 1
                 if maxrun==0:
                     break
 
+        self._endBlock()
+
         return expData[expData[:,10]==1]
 
+    def adaptiveExperiment(self, scheduler):
+        """Run procedures chosen by an adaptive.AdaptiveScheduler until it is done, as one block
+
+        Returns a numpy array with a row (as in fullExperiment) per procedure, in the order executed,
+        or None if the user quit
+        """
+        rows = np.zeros((scheduler.maxTrials, 11))
+        self.flips.block = self.blockN
+
+        # Draw all random timings up front; the procedure of each trial is filled in as we go
+        plan = self._timeline(np.zeros(scheduler.maxTrials, dtype=int))
+
+        n = 0
+        while not scheduler.done():
+            i = scheduler.next()
+            plan['procedure'][n] = i
+            res = self._oneProcedure(self.procedures[i], frames=plan[n])
+            if res is None:
+                self._abortBlock()
+                return None
+
+            rows[n] = self._recordTrial(i, res)
+            scheduler.update(i, res.rt, res.resp=='OK')
+            n += 1
+
+        self._endBlock()
+
+        return rows[:n]
+
+    def subscribe(self, callback):
+        """Call callback(res, stats) after every trial of fullExperiment and adaptiveExperiment, with
+        the result of the trial and the running statistics of the session (a runstats.RunningStats)
+
+        Callbacks run between trials, so they should return quickly
+        """
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def flipSummary(self, block=None):
+        """Return a fliptiming.FlipSummary of the flip timing of a block (-1 for practice) or the whole session"""
+        return self.flips.summary(block)
+
+    def close(self):
+        """Write any pending log records and stop the log writer; call when done with the experiment"""
+        self.log.close()
+
     # The following text is adapted from the original (Visual Basic?) experiment
     # For the validity of the rule of thumb, see
     #    Robert P O'Shea: "Thumb's rule tested: visual angle of thumb's width is about 2 deg."
@@ -509,18 +827,30 @@ class ANTExp:
         Returns True if the user hit 'escape' (presumably to abort/interrupt the run)
         """
         self.win.flip()
-        visual.TextStim(self.win, alignHoriz='center', wrapWidth=12, height=0.01, color='black', text=text).draw()
+        stims = [self.backend.visual.TextStim(self.win, alignHoriz='center', wrapWidth=12, height=0.01, color='black', text=text)]
         if showLine:
-            visual.Line(self.win, start=(-7,-1), end=(-7,1), lineColor='black').draw()
-            visual.Line(self.win, start=(-7.1,-1), end=(-6.9,-1), lineColor='black').draw()
-            visual.Line(self.win, start=(-7.1,1), end=(-6.9,1), lineColor='black').draw()
+            stims.append(self.backend.visual.Line(self.win, start=(-7,-1), end=(-7,1), lineColor='black'))
+            stims.append(self.backend.visual.Line(self.win, start=(-7.1,-1), end=(-6.9,-1), lineColor='black'))
+            stims.append(self.backend.visual.Line(self.win, start=(-7.1,1), end=(-6.9,1), lineColor='black'))
+        for stim in stims:
+            stim.draw()
         self.win.flip()
         if noWait:
-            core.wait(time)
+            self.backend.wait(time)
             self.win.flip()
             return False
         else:
-            keys = event.waitKeys()
+            # Build any outstanding targets while the user is reading
+            keys = None
+            while keys is None and self._buildNextTarget():
+                keys = self.backend.waitKeys(maxWait=0.001)
+            # Then check the refresh rate, redrawing the text for every frame
+            while keys is None and self._stepCalibration(stims):
+                keys = self.backend.waitKeys(maxWait=0.001)
+            if self.calibration is not None:
+                self.calibration.pause()
+            if keys is None:
+                keys = self.backend.waitKeys()
             self.win.flip()
             return keys[0]=='escape'
 
@@ -0,0 +1,134 @@
+"""
+Asynchronous logging for the ANT, keeping file I/O and formatting off the timing critical path
+
+The experiment only puts raw records on a bounded queue; a writer thread drains it in batches,
+formats the records and writes them. flush() blocks until everything queued has been written,
+which ANTExp does at the end of every block and when the user quits. Once closed, records are
+written directly (in the calling thread).
+"""
+import sys
+import threading
+import atexit
+import weakref
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# Record kinds
+_TEXT, _TRIAL, _MESSAGE, _STOP = range(4)
+
+
+# Writers still open; those left open are closed (and their records written) when the interpreter exits
+_open = weakref.WeakSet()
+
+
+@atexit.register
+def _closeAll():
+    for writer in list(_open):
+        writer.close()
+
+
+class AsyncLogWriter(object):
+    """Writes ANT log records from a background thread
+
+    stream -- where trial records (and plain text) go, e.g. an open logfile or sys.stdout
+    console -- where messages (e.g. keypresses) go; defaults to sys.stdout
+    maxQueue -- size of the queue; when full, the experiment waits for the writer to catch up
+    batchSize -- maximum number of records written (and flushed) together
+    """
+    def __init__(self, stream, console=None, maxQueue=4096, batchSize=64):
+        self.stream = stream
+        self.console = console if console is not None else sys.stdout
+        self.batchSize = batchSize
+        self.queue = queue.Queue(maxQueue)
+        self.closed = False
+        self.lock = threading.Lock()
+
+        self.thread = threading.Thread(target=self._run, name='AsyncLogWriter')
+        self.thread.daemon = True
+        self.thread.start()
+        _open.add(self)
+
+    def _put(self, rec):
+        # Wait for room on a full queue in short slices, releasing the lock in between so close() can get in
+        while True:
+            with self.lock:
+                if self.closed:
+                    break
+                try:
+                    self.queue.put(rec, timeout=0.01)
+                    return
+                except queue.Full:
+                    pass
+        # Closed: wait for the records queued before, then write this one here
+        self.thread.join()
+        self._write([rec])
+
+    def text(self, text):
+        """Queue a line of text (without newline) for the log stream"""
+        self._put((_TEXT, text))
+
+    def trial(self, res):
+        """Queue a trial result (as returned by ANTExp._oneProcedure) for the log stream"""
+        self._put((_TRIAL, res))
+
+    def message(self, fmt, *args):
+        """Queue a message for the console; it is formatted as fmt % args by the writer thread"""
+        self._put((_MESSAGE, fmt, args))
+
+    def flush(self):
+        """Block until every record queued so far has been written and flushed"""
+        if not self.closed:
+            self.queue.join()
+
+    def close(self):
+        """Write everything queued and stop the writer thread"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put((_STOP,))
+        self.thread.join()
+        _open.discard(self)
+
+    def _format(self, rec):
+        if rec[0] == _TRIAL:
+            res = rec[1]
+            return ("%0.3f;%0.3f;%s;%0.3f;%0.3f;%0.3f;%0.3f;%0.3f;%s\n" %
+                    (res.wt, res.t0, res.condition.text, res.d1, res.ct, res.d2, res.rt, res.tf, res.resp))
+        elif rec[0] == _TEXT:
+            return rec[1] + "\n"
+        else:
+            return (rec[1] % rec[2]) + "\n"
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            while len(batch) < self.batchSize:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                stop = any(rec[0] == _STOP for rec in batch)
+                self._write([rec for rec in batch if rec[0] != _STOP])
+            finally:
+                for rec in batch:
+                    self.queue.task_done()
+
+    def _write(self, batch):
+        try:
+            # Group lines per target stream, keeping order when both go to the same stream
+            out = {}
+            for rec in batch:
+                target = self.console if rec[0] == _MESSAGE else self.stream
+                out.setdefault(id(target), (target, []))[1].append(self._format(rec))
+            for target, lines in out.values():
+                target.write("".join(lines))
+                target.flush()
+        except Exception as e:
+            sys.stderr.write("ERROR: Failed to write log records: %s\n" % e)
@@ -0,0 +1,87 @@
+"""
+Startup benchmark for the ANT module
+
+Measures (in fresh interpreters) how long importing ant takes, and how long it takes to construct
+an ANTExp and get to the first trial, with and without lazily built targets. The experiment runs
+on the headless simdisplay backend, so this only measures our own overhead, not PsychoPy's.
+
+Results are printed as JSON; give a previous result file with --baseline to fail (exit code 1) if
+any measurement got more than --tolerance slower:
+
+    python benchstartup.py > startup.json
+    python benchstartup.py --baseline startup.json
+"""
+import sys
+import os
+import json
+import argparse
+import subprocess
+
+_here = os.path.dirname(os.path.abspath(__file__))
+
+_importScript = """
+import time
+t = time.time()
+import ant
+print(time.time() - t)
+"""
+
+_startupScript = """
+import io, time
+t = time.time()
+from ant import ANTExp
+from simdisplay import SimMonitor, SimWindow, SimClock, SimBackend
+mon = SimMonitor()
+clock = SimClock()
+win = SimWindow(clock, 60, monitor=mon)
+exp = ANTExp(mon, win, win.size, 60, clock, 0.0, io.StringIO(), backend=SimBackend(clock), lazyTargets=%s)
+t1 = time.time()
+exp._oneProcedure(exp.procedures[0], True)
+t2 = time.time()
+exp.close()
+print('%%r %%r' %% (t1 - t, t2 - t))
+"""
+
+
+def _run(script):
+    out = subprocess.check_output([sys.executable, '-c', script], cwd=_here)
+    # Timings are on the last line (the experiment may print key presses before it)
+    return [float(v) for v in out.decode('ascii').strip().splitlines()[-1].split()]
+
+
+def measure(repeat=5):
+    """Return a dict of the best (minimum) times in seconds over repeat fresh interpreters"""
+    results = {'importAnt': [], 'construct': [], 'firstTrial': [], 'constructLazy': [], 'firstTrialLazy': []}
+    for i in range(repeat):
+        results['importAnt'].append(_run(_importScript)[0])
+        construct, first = _run(_startupScript % False)
+        results['construct'].append(construct)
+        results['firstTrial'].append(first)
+        construct, first = _run(_startupScript % True)
+        results['constructLazy'].append(construct)
+        results['firstTrialLazy'].append(first)
+    return dict((k, min(v)) for k, v in results.items())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ANT import and startup time")
+    parser.add_argument('--repeat', type=int, default=5, help="number of fresh interpreters per measurement")
+    parser.add_argument('--baseline', help="JSON file with earlier results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative slowdown (default 0.25)")
+    args = parser.parse_args(argv)
+
+    results = measure(args.repeat)
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = [k for k in sorted(results) if k in baseline and results[k] > baseline[k]*(1 + args.tolerance)]
+        for k in slower:
+            sys.stderr.write("REGRESSION: %s took %0.4fs (baseline %0.4fs)\n" % (k, results[k], baseline[k]))
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+Timing accuracy benchmark for ANT procedures under synthetic system load
+
+Runs procedures in real time against a window that blocks on a simulated retrace (like a real
+buffer swap with vsync), with the waiting done the way PsychoPy's core.wait does it (sleep, then
+busy-wait for the last hogCPUperiod). Meanwhile synthetic load competes for the machine:
+
+    cpu -- one spinning process per CPU
+    gil -- a Python thread competing for the interpreter lock
+    gc  -- a thread producing cyclic garbage, so the collector keeps running
+    io  -- a thread writing (and syncing) a scratch file
+
+For every scenario it reports the error distribution of d1, ct, d2 and tf against their planned
+(frame quantized) durations and against the nominal ones (100 ms cue, 400 ms cue to target and
+4 s total; d1 is random), plus the flip summary of fliptiming. Results are printed as JSON, and
+--baseline fails (exit code 1) if the 99th percentile error of anything got worse by more than
+--tolerance (and at least --slack ms):
+
+    python benchtiming.py --scenarios none,cpu,gc > timing.json
+    python benchtiming.py --scenarios none,cpu,gc --hog 0.25 --baseline timing.json
+
+With --scale below 1 all durations are shortened, so benchmarks take less time; the errors are
+still reported in ms.
+"""
+import sys
+import os
+import json
+import time
+import tempfile
+import argparse
+import threading
+import multiprocessing
+import numpy as np
+
+from ant import ANTExp
+from simdisplay import SimMonitor, SimWindow, SimBackend
+
+try:
+    _timer = time.perf_counter
+except AttributeError:
+    _timer = time.time
+
+scenarios = {
+    'none': (),
+    'cpu': ('cpu',),
+    'gil': ('gil',),
+    'gc': ('gc',),
+    'io': ('io',),
+    'all': ('cpu', 'gil', 'gc', 'io'),
+}
+
+intervals = ('d1', 'ct', 'd2', 'tf')
+
+
+def _sleepUntil(t, timer=_timer):
+    """Sleep until (timer) time t; the last millisecond is spent busy-waiting"""
+    remaining = t - timer()
+    if remaining > 0.001:
+        time.sleep(remaining - 0.001)
+    while timer() < t:
+        pass
+
+
+class WallClock(object):
+    """A clock like psychopy.core.Clock (seconds since creation or reset) on a high resolution timer
+
+    advance() waits in real time, so it can be used with simdisplay.SimBackend
+    """
+    def __init__(self):
+        self.t0 = _timer()
+
+    def getTime(self):
+        return _timer() - self.t0
+
+    def reset(self, newT=0.0):
+        self.t0 = _timer() - newT
+
+    def advance(self, dt):
+        if dt > 0:
+            _sleepUntil(_timer() + dt)
+
+
+class VsyncWindow(SimWindow):
+    """A SimWindow whose flip blocks (in real time) until the next retrace, like a swap with vsync"""
+    def flip(self, clearBuffer=True):
+        t = self.clock.getTime()
+        frame = int(t / self.frameTime) + 1
+        _sleepUntil(frame * self.frameTime, self.clock.getTime)
+        self.frameN += 1
+        self.lastDraws = self.nDraws
+        if clearBuffer:
+            self.nDraws = 0
+
+
+class RealTimeBackend(SimBackend):
+    """A SimBackend that waits like psychopy.core.wait: sleeping, then busy-waiting for hogCPUperiod"""
+    def wait(self, secs, hogCPUperiod=0.2):
+        end = self.clock.getTime() + secs
+        if secs > hogCPUperiod:
+            time.sleep(secs - hogCPUperiod)
+        while self.clock.getTime() < end:
+            pass
+
+
+def _spin(stop):
+    while not stop.is_set():
+        for i in range(10000):
+            pass
+
+
+def _gil(stop):
+    x = 0
+    while not stop.is_set():
+        for i in range(10000):
+            x += i*i
+
+
+def _garbage(stop):
+    while not stop.is_set():
+        for i in range(1000):
+            a = []
+            b = [a]
+            a.append(b)
+
+
+def _io(stop):
+    chunk = os.urandom(1 << 20)
+    fd, path = tempfile.mkstemp(prefix='antbench')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while not stop.is_set():
+                for i in range(16):
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+                f.seek(0)
+    finally:
+        os.remove(path)
+
+
+class Load(object):
+    """Synthetic load of the given kinds ('cpu', 'gil', 'gc', 'io') running until stopped"""
+    def __init__(self, kinds):
+        self.kinds = kinds
+        self.workers = []
+
+    def start(self):
+        self.stopThreads = threading.Event()
+        self.stopProcesses = multiprocessing.Event()
+        for kind in self.kinds:
+            if kind == 'cpu':
+                for i in range(multiprocessing.cpu_count()):
+                    self.workers.append(multiprocessing.Process(target=_spin, args=(self.stopProcesses,)))
+            else:
+                target = {'gil': _gil, 'gc': _garbage, 'io': _io}[kind]
+                self.workers.append(threading.Thread(target=target, args=(self.stopThreads,)))
+        for w in self.workers:
+            w.daemon = True
+            w.start()
+
+    def stop(self):
+        self.stopThreads.set()
+        self.stopProcesses.set()
+        for w in self.workers:
+            w.join()
+        self.workers = []
+
+
+def _stats(error):
+    """Summary (in ms) of an array of errors (in seconds)"""
+    e = 1000*np.asarray(error)
+    a = np.abs(e)
+    return {'mean': float(e.mean()), 'sd': float(e.std()), 'p50': float(np.percentile(a, 50)),
+            'p95': float(np.percentile(a, 95)), 'p99': float(np.percentile(a, 99)), 'max': float(a.max())}
+
+
+def runScenario(kinds, nTrials=24, refreshRate=60, scale=1.0, flipMargin=0.5, hogCPUframes=0.5, seed=0):
+    """Run nTrials random procedures under the given load; returns a dict of timing statistics"""
+    rng = np.random.RandomState(seed)
+    mon = SimMonitor()
+    clock = WallClock()
+    win = VsyncWindow(clock, refreshRate, monitor=mon)
+    rt = 0.450*scale
+    backend = RealTimeBackend(clock, responder=lambda condition: (condition.tdir, rt))
+
+    with open(os.devnull, 'w') as devnull:
+        exp = ANTExp(mon, win, win.size, refreshRate, clock, time.time(), devnull, backend=backend)
+        exp.log.console = devnull
+        for name in ('tD1min', 'tD1max', 'tCue', 'tNoCue', 'tOut', 'tDummy', 'tExp'):
+            setattr(exp, name, getattr(exp, name)*scale)
+        exp.flipMargin = flipMargin
+        exp.hogCPUframes = hogCPUframes
+
+        plan = exp._timeline(rng.randint(0, len(exp.procedures), nTrials), rng)
+        actual = np.zeros((nTrials, 4))
+
+        load = Load(kinds)
+        load.start()
+        try:
+            win.flip()
+            for n, frames in enumerate(plan):
+                res = exp._oneProcedure(exp.procedures[frames['procedure']], frames=frames)
+                actual[n] = (res.d1, res.ct, res.d2, res.tf)
+        finally:
+            load.stop()
+            exp.close()
+
+    f = exp.frameTime
+    planned = np.column_stack((plan['cue'], plan['fixation'] - plan['cue'], plan['target'] - plan['fixation'],
+                               plan['end']))*f
+    nominal = np.column_stack((plan['d1'], np.full(nTrials, exp.tCue), np.full(nTrials, exp.tNoCue),
+                               np.full(nTrials, exp.tExp)))/1000.0
+    flips = exp.flips.summary()
+
+    result = {'flips': {'nFlips': flips.nFlips, 'onTime': flips.onTime, 'late': flips.late,
+                        'early': flips.early, 'droppedFrames': flips.droppedFrames}}
+    for k, name in enumerate(intervals):
+        result[name] = {'planned': _stats(actual[:, k] - planned[:, k]),
+                        'nominal': _stats(actual[:, k] - nominal[:, k])}
+    return result
+
+
+def measure(names, nTrials=24, refreshRate=60, scale=1.0, flipMargin=0.5, hogCPUframes=0.5, seed=0):
+    """Run the named scenarios; returns a dict with the configuration and the results of each"""
+    config = {'trials': nTrials, 'refreshRate': refreshRate, 'scale': scale, 'flipMargin': flipMargin,
+              'hogCPUframes': hogCPUframes, 'seed': seed, 'cpus': multiprocessing.cpu_count(),
+              'python': sys.version.split()[0]}
+    results = {}
+    for name in names:
+        results[name] = runScenario(scenarios[name], nTrials, refreshRate, scale, flipMargin, hogCPUframes, seed)
+    return {'config': config, 'scenarios': results}
+
+
+def regressions(results, baseline, tolerance=0.25, slack=0.5):
+    """Return a list of (scenario, interval, p99, baseline p99) where the planned p99 error got worse"""
+    worse = []
+    for name in sorted(results['scenarios']):
+        if name not in baseline.get('scenarios', {}):
+            continue
+        for interval in intervals:
+            p99 = results['scenarios'][name][interval]['planned']['p99']
+            old = baseline['scenarios'][name][interval]['planned']['p99']
+            if p99 > old*(1 + tolerance) and p99 > old + slack:
+                worse.append((name, interval, p99, old))
+    return worse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ANT flip timing accuracy under synthetic load")
+    parser.add_argument('--scenarios', default='none,cpu,gil,gc,io,all',
+                        help="comma separated scenarios (%s)" % ', '.join(sorted(scenarios)))
+    parser.add_argument('--trials', type=int, default=24, help="procedures per scenario (default 24)")
+    parser.add_argument('--refresh', type=float, default=60, help="simulated refresh rate in Hz (default 60)")
+    parser.add_argument('--scale', type=float, default=0.25, help="scale all durations by this (default 0.25)")
+    parser.add_argument('--margin', type=float, default=0.5, help="ANTExp.flipMargin, in frames (default 0.5)")
+    parser.add_argument('--hog', type=float, default=0.5, help="ANTExp.hogCPUframes, in frames (default 0.5)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', help="JSON file with earlier results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative increase of p99 errors")
+    parser.add_argument('--slack', type=float, default=0.5, help="allowed absolute increase of p99 errors (ms)")
+    args = parser.parse_args(argv)
+
+    names = args.scenarios.split(',')
+    for name in names:
+        if name not in scenarios:
+            parser.error("unknown scenario '%s'" % name)
+
+    results = measure(names, args.trials, args.refresh, args.scale, args.margin, args.hog, args.seed)
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        worse = regressions(results, baseline, args.tolerance, args.slack)
+        for name, interval, p99, old in worse:
+            sys.stderr.write("REGRESSION: %s %s p99 error %0.2f ms (baseline %0.2f ms)\n" % (name, interval, p99, old))
+        return 1 if worse else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
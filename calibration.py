@@ -0,0 +1,201 @@
+"""
+Cached refresh rate calibration per monitor profile
+
+Measuring the refresh rate (e.g. with win.getActualFrameRate) takes up to 15 seconds at every
+launch. A RefreshCalibration keeps the measured rate, together with the distribution of the
+inter-frame intervals it was measured from and when, in a JSON cache keyed by host, monitor name,
+resolution and window configuration, so a station can start with the rate it measured last time:
+
+    calib = RefreshCalibration(win, displayKey(mon, win))
+    refresh = calib.refreshRate             # the cached rate, or None
+    if refresh is None:
+        refresh = calib.calibrate()         # full measurement (blocking) and stored in the cache
+    exp = ANTExp(mon, win, winsize, refresh, globalClock, startTime, alog, calibration=calib)
+
+Given to ANTExp, a cached rate is verified with a short run of frames while the instructions are
+displayed (the text is redrawn and flipped every frame while waiting for keys). Only when those
+intervals disagree with the cached rate is a full calibration run, also during the instructions,
+after which the new rate is stored and taken into use; anything still left to do when the first
+block starts is finished then.
+"""
+import os
+import time
+import json
+import platform
+import numpy as np
+
+try:
+    _counter = time.perf_counter
+except AttributeError:
+    _counter = time.time
+
+
+def displayKey(mon, win):
+    """Return the cache key of a display: host, monitor name, resolution and window configuration"""
+    size = 'x'.join('%d' % v for v in win.size)
+    fullscr = getattr(win, 'fullscr', getattr(win, '_isFullScr', False))
+    return '%s/%s/%s/%s/%s/screen%s' % (platform.node(), getattr(mon, 'name', 'monitor'), size,
+                                        'fullscr' if fullscr else 'window', getattr(win, 'winType', ''),
+                                        getattr(win, 'screen', 0))
+
+
+def intervalSummary(intervals):
+    """Return a dict describing the distribution of inter-frame intervals (in seconds)"""
+    iv = np.asarray(intervals, dtype=np.float64)
+    p1, p5, p25, p50, p75, p95, p99 = np.percentile(iv, (1, 5, 25, 50, 75, 95, 99))
+    return {'nFrames': int(len(iv)), 'mean': float(iv.mean()), 'sd': float(iv.std()),
+            'min': float(iv.min()), 'max': float(iv.max()),
+            'p1': float(p1), 'p5': float(p5), 'p25': float(p25), 'p50': float(p50),
+            'p75': float(p75), 'p95': float(p95), 'p99': float(p99),
+            'dropped': float(np.mean(iv > 1.5*p50))}
+
+
+def estimateRate(intervals, threshold=0.001):
+    """Return the refresh rate from the intervals within threshold (s) of their median, or None if
+    less than half of them are (the timing was too unstable to tell)
+    """
+    iv = np.asarray(intervals, dtype=np.float64)
+    if len(iv) == 0:
+        return None
+    close = iv[np.abs(iv - np.median(iv)) <= threshold]
+    if len(close) < len(iv) / 2.0:
+        return None
+    return 1.0 / close.mean()
+
+
+class CalibrationCache(object):
+    """Refresh rate calibrations by display key, in a JSON file
+
+    path -- the cache file (default ~/.ant-calibration.json)
+    """
+    def __init__(self, path=None):
+        self.path = path if path is not None else os.path.join(os.path.expanduser('~'), '.ant-calibration.json')
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        """Return the stored calibration of key (a dict), or None"""
+        return self._read().get(key)
+
+    def put(self, key, record):
+        """Store the calibration record of key (replacing the file, so it is never left half written)"""
+        data = self._read()
+        data[key] = record
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        try:
+            os.replace(tmp, self.path)
+        except AttributeError:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(tmp, self.path)
+
+
+class RefreshCalibration(object):
+    """The refresh rate of a display, from the cache when known, verified a frame at a time
+
+    win -- the window to flip
+    key -- the display's key in the cache (see displayKey)
+    cache -- a CalibrationCache (default: the one in the home directory)
+    clock -- callable returning the time in seconds after a flip (default perf_counter)
+    quickFrames -- intervals measured to verify a cached rate
+    fullFrames -- intervals measured by a full calibration
+    warmUpFrames -- intervals ignored before measuring (skipped when a full calibration follows a failed check)
+    tolerance -- relative difference between measured and cached rate that is still taken as agreeing
+    threshold -- how far (s) from the median interval an interval may be to count towards the rate
+    """
+    def __init__(self, win, key, cache=None, clock=None, quickFrames=60, fullFrames=600, warmUpFrames=30,
+                 tolerance=0.005, threshold=0.001):
+        self.win = win
+        self.key = key
+        self.cache = cache if cache is not None else CalibrationCache()
+        self.clock = clock if clock is not None else _counter
+        self.quickFrames = quickFrames
+        self.fullFrames = fullFrames
+        self.warmUpFrames = warmUpFrames
+        self.tolerance = tolerance
+        self.threshold = threshold
+
+        self.record = self.cache.get(key)
+        self.refreshRate = self.record['refreshRate'] if self.record else None
+        self.checkedRate = None             # the rate measured by the quick check
+        self.verified = False               # the quick check agreed with the cached rate
+        self.recalibrated = False           # a full calibration was run (and stored)
+
+        self.phase = None
+        self.intervals = []
+        self._last = None
+        if self.refreshRate is not None:
+            self._begin('verify', warmUpFrames, quickFrames)
+
+    @property
+    def pending(self):
+        """True while a check or calibration still has frames to run"""
+        return self.phase is not None
+
+    def _begin(self, phase, skip, frames):
+        self.phase = phase
+        self.intervals = []
+        self._skip = skip
+        self._needed = skip + frames
+
+    def step(self, draw=None):
+        """Draw (with draw, if given) and flip one frame of the pending check or calibration
+
+        Returns True if there is more to do
+        """
+        if self.phase is None:
+            return False
+        if draw is not None:
+            draw()
+        self.win.flip()
+        now = self.clock()
+        if self._last is not None:
+            self.intervals.append(now - self._last)
+        self._last = now
+        if len(self.intervals) >= self._needed:
+            self._advance()
+        return self.phase is not None
+
+    def pause(self):
+        """Tell that stepping stops for a while; the interval spanning the pause is not counted"""
+        self._last = None
+
+    def finish(self, draw=None):
+        """Run any pending check (and calibration) to the end; returns the refresh rate"""
+        while self.step(draw):
+            pass
+        return self.refreshRate
+
+    def calibrate(self, draw=None):
+        """Run a full calibration now (blocking), store it and return the refresh rate"""
+        self.pause()
+        self._begin('calibrate', self.warmUpFrames, self.fullFrames)
+        return self.finish(draw)
+
+    def _advance(self):
+        measured = self.intervals[self._skip:]
+        if self.phase == 'verify':
+            self.checkedRate = estimateRate(measured, self.threshold)
+            if self.checkedRate is not None and abs(self.checkedRate - self.refreshRate) <= self.tolerance*self.refreshRate:
+                self.verified = True
+                self.record['verified'] = time.time()
+                self.cache.put(self.key, self.record)
+                self.phase = None
+            else:
+                # The display is warmed up by now
+                self._begin('calibrate', 0, self.fullFrames)
+        else:
+            rate = estimateRate(measured, self.threshold)
+            self.refreshRate = rate if rate is not None else 1.0 / np.median(measured)
+            self.record = {'refreshRate': self.refreshRate, 'intervals': intervalSummary(measured),
+                           'time': time.time(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'stable': rate is not None}
+            self.cache.put(self.key, self.record)
+            self.recalibrated = True
+            self.phase = None
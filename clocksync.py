@@ -0,0 +1,176 @@
+"""
+Clock drift modelling and mapping of timestamps between clocks
+
+The experiment clock, the wall clock and the clocks of external devices (e.g. an eye tracker) all
+run at slightly different rates, so a single offset taken at the start of a session (like the
+startTime given to ANTExp) drifts away during a session. A ClockSync samples all clocks together
+on a background thread (taking the reading with the tightest bracket by the reference clock out
+of a few tries), keeps an online least squares fit of each clock against the reference and
+converts whole arrays of timestamps between any two clocks in one vectorized step:
+
+    sync = ClockSync(globalClock.getTime, {'wall': time.time, 'tracker': tracker.getTime})
+    sync.start()
+    exp = ANTExp(mon, win, winsize, refresh, globalClock, startTime, alog, clockSync=sync)
+    ...
+    sync.stop()
+    fixations = sync.convert(trackerTimes, 'tracker', 'clock')     # onto the experiment clock
+    print(sync.diagnostics()['wall'])
+
+The reference clock is called 'clock'; sources are any callables returning a time in seconds.
+"""
+import threading
+import numpy as np
+
+
+class ClockFit(object):
+    """Online least squares fit of one clock (y) against the reference clock (x): y = a + b*x
+
+    Sums are kept relative to the first sample, so epoch sized timestamps don't lose precision
+    """
+    def __init__(self):
+        self.n = 0
+        self.x0 = self.y0 = 0.0
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+        # (a, b) relative to (x0, y0); replaced as a whole, so readers always see a consistent pair
+        self.params = (0.0, 1.0)
+
+    def add(self, x, y):
+        if self.n == 0:
+            self.x0, self.y0 = x, y
+        x -= self.x0
+        y -= self.y0
+        self.n += 1
+        self.sx += x
+        self.sy += y
+        self.sxx += x*x
+        self.sxy += x*y
+        den = self.n*self.sxx - self.sx*self.sx
+        if self.n < 2 or den <= 0:
+            # Not enough spread yet: just an offset, at the nominal rate
+            self.params = ((self.sy - self.sx) / self.n, 1.0)
+        else:
+            b = (self.n*self.sxy - self.sx*self.sy) / den
+            self.params = ((self.sy - b*self.sx) / self.n, b)
+
+    def forward(self, x):
+        """Reference clock time(s) -> this clock"""
+        a, b = self.params
+        return self.y0 + a + b*(np.asarray(x, dtype=np.float64) - self.x0)
+
+    def inverse(self, y):
+        """This clock's time(s) -> reference clock"""
+        a, b = self.params
+        return self.x0 + (np.asarray(y, dtype=np.float64) - self.y0 - a) / b
+
+
+class ClockSync(object):
+    """Samples a reference clock together with other clocks and models the drift between them
+
+    reference -- callable returning the reference (experiment) time, e.g. globalClock.getTime
+    sources -- dict of name -> callable returning that clock's time, e.g. {'wall': time.time}
+    interval -- time (s) between samples on the background thread
+    tries -- readings per sample; the one most tightly bracketed by the reference is kept
+    capacity -- number of samples kept for diagnostics (older ones are overwritten)
+    """
+    def __init__(self, reference, sources, interval=1.0, tries=5, capacity=1 << 16):
+        self.reference = reference
+        self.names = sorted(sources)
+        self.sources = [sources[name] for name in self.names]
+        self.interval = interval
+        self.tries = tries
+        self.capacity = capacity
+        self.fits = dict((name, ClockFit()) for name in self.names)
+        # Columns: reference time, uncertainty (half the bracket), then one per source
+        self.samples = np.zeros((capacity, 2 + len(self.names)))
+        self.n = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        """Take a sample of all clocks now (also done periodically once started)"""
+        best = None
+        for k in range(self.tries):
+            before = self.reference()
+            values = [source() for source in self.sources]
+            after = self.reference()
+            if best is None or after - before < best[0]:
+                best = (after - before, (before + after)/2.0, values)
+        bracket, t, values = best
+
+        with self.lock:
+            row = self.samples[self.n % self.capacity]
+            row[0] = t
+            row[1] = bracket/2.0
+            row[2:] = values
+            self.n += 1
+            for name, value in zip(self.names, values):
+                self.fits[name].add(t, value)
+
+    def start(self):
+        self.sample()
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name='ClockSync')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+            self.sample()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def convert(self, times, source='clock', target='wall'):
+        """Convert time(s) (a number or any array) from one clock to another ('clock' is the reference)"""
+        t = np.asarray(times, dtype=np.float64)
+        if source != 'clock':
+            t = self.fits[source].inverse(t)
+        if target != 'clock':
+            t = self.fits[target].forward(t)
+        return t
+
+    def history(self):
+        """Return the samples kept so far, oldest first, as an (n, 2 + nSources) array of reference
+        time, uncertainty and the time of each source (in the order of names)
+        """
+        with self.lock:
+            n = self.n
+            if n <= self.capacity:
+                return self.samples[:n].copy()
+            i = n % self.capacity
+            return np.concatenate((self.samples[i:], self.samples[:i]))
+
+    def diagnostics(self):
+        """Return a dict of name -> dict describing how that clock drifted against the reference:
+
+            nSamples, span -- number of samples and the reference time they cover (s)
+            offset -- the source time at reference time 0 according to the fit
+            drift -- rate difference in parts per million (positive: the source runs fast)
+            residualSd, maxResidual -- scatter (s) of the samples around the fit
+            maxUncertainty -- the largest half bracket (s) of a sample
+            offsetError -- how far off (s) by the end a single offset taken at the first sample is
+        """
+        h = self.history()
+        result = {}
+        for k, name in enumerate(self.names):
+            fit = self.fits[name]
+            if len(h) == 0:
+                result[name] = {'nSamples': 0}
+                continue
+            x, y = h[:, 0], h[:, 2 + k]
+            residual = y - fit.forward(x)
+            a, b = fit.params
+            result[name] = {'nSamples': int(len(h)),
+                            'span': float(x[-1] - x[0]),
+                            'offset': float(fit.forward(0.0)),
+                            'drift': (b - 1.0)*1e6,
+                            'residualSd': float(residual.std()),
+                            'maxResidual': float(np.abs(residual).max()),
+                            'maxUncertainty': float(h[:, 1].max()),
+                            'offsetError': float((y[-1] - y[0]) - (x[-1] - x[0]))}
+        return result
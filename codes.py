@@ -0,0 +1,17 @@
+"""
+Integer codes of the ANT conditions and responses
+
+The codes used for the warning type, congruency, target location and direction and the response
+in the results of ANTExp.fullExperiment, the session stores and the analysis modules. They are
+kept here, apart from ant, so modules that ant itself imports can use them too.
+"""
+
+# Codes used for the warning type and congruency in the results of fullExperiment
+warningCodes = {'no': 0, 'center': 1, 'double': 2, 'spatial': 3}
+congruencyCodes = {'congruent': 0, 'incongruent': 1, 'neutral': 2}
+locationCodes = {'top': 0, 'bottom': 1}
+directionCodes = {'left': 0, 'right': 1}
+responseCodes = {'OK': 1, 'NOK': 0, None: -1}
+
+# The direction code of every key accepted as a response
+keyDirections = dict([('left', 0), ('right', 1)] + [(k, 0) for k in 'fazq'] + [(k, 1) for k in 'jmlp'])
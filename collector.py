@@ -0,0 +1,428 @@
+"""
+Central collection of trial records from many ANT stations
+
+A Collector service receives trial records from any number of stations over TCP and appends
+them to one columnar store: a directory with a raw little endian file per column, which can be
+memory mapped for analysis without parsing. A CollectorClient is the station side; it has the
+append, flush and close methods ANTExp uses of a store.SessionStore, so it is simply given to
+ANTExp as its store (it keeps nothing locally, so there is no results() or load):
+
+    # On the collecting machine (or the same machine, for testing)
+    collector = Collector('results/', port=5556)
+    collector.start()
+
+    # On every station
+    client = CollectorClient('station-3', host='lab-server', port=5556)
+    exp = ANTExp(mon, win, winsize, refresh, globalClock, startTime, alog, store=client)
+    ...
+    client.close()
+
+    columns = ColumnStore.load('results/')      # dict of column name -> array
+
+Records are sent in batches as binary frames (a header followed by the packed records), and
+every frame is acknowledged, so a slow collector slows down the (background) sender rather than
+the experiment. When the collector can't be reached the records are spooled to a local file and
+sent once it is back. Every record carries its station session and sequence number, so records
+that are sent twice (e.g. when an acknowledgement is lost) are only stored once. Frames of more
+than maxRecords records (which no client with a sane batchSize sends) make the collector drop the
+connection rather than allocate whatever a corrupt header asks for.
+"""
+import os
+import json
+import time
+import errno
+import socket
+import struct
+import tempfile
+import threading
+import numpy as np
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from codes import responseCodes
+from store import trialDtype
+
+# A record as sent: the trial (as in a SessionStore) with the session and sequence number of the station
+recordDtype = np.dtype([('session', np.int64), ('seq', np.int64)] + trialDtype.descr).newbyteorder('<')
+
+# A record as stored: the station number (index in the store's station list) in front
+storedDtype = np.dtype([('station', '<i2')] + recordDtype.descr)
+
+# Frame header: magic, length of the station name (which follows), number of records (which follow that)
+_magic = b'ANT1'
+_header = struct.Struct('<4sHI')
+# Acknowledgement: number of records received
+_ack = struct.Struct('<I')
+
+
+def _recvExactly(sock, n):
+    """Receive exactly n bytes; returns None if the connection is closed first"""
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:], n - got)
+        if k == 0:
+            return None
+        got += k
+    return buf
+
+
+class ColumnStore(object):
+    """An append only store of records, kept as one raw (little endian) file per column
+
+    path -- the directory to keep the store in (created if needed)
+    dtype -- the record dtype (storedDtype); an existing store must have the same one
+
+    Columns are written one after another, so a crash (or a full disk) can leave some longer than
+    others; opening a store cuts every column back to the shortest, and load only returns that many
+    """
+    def __init__(self, path, dtype=storedDtype):
+        self.path = path
+        self.dtype = dtype
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        schemaFile = os.path.join(path, 'schema.json')
+        schema = [[name, dtype[name].str] for name in dtype.names]
+        if os.path.exists(schemaFile):
+            with open(schemaFile) as f:
+                if json.load(f) != schema:
+                    raise ValueError("%s holds records of a different layout" % path)
+        else:
+            with open(schemaFile, 'w') as f:
+                json.dump(schema, f)
+        # Drop any partially appended records
+        n = min(ColumnStore._length(path, name, dtype[name].itemsize) for name in dtype.names)
+        for name in dtype.names:
+            fn = os.path.join(path, name + '.bin')
+            if os.path.exists(fn) and os.path.getsize(fn) != n*dtype[name].itemsize:
+                with open(fn, 'r+b') as f:
+                    f.truncate(n*dtype[name].itemsize)
+        self.files = dict((name, open(os.path.join(path, name + '.bin'), 'ab')) for name in dtype.names)
+
+        self.stationFile = os.path.join(path, 'stations.json')
+        self.stations = []
+        if os.path.exists(self.stationFile):
+            with open(self.stationFile) as f:
+                self.stations = json.load(f)
+
+    def station(self, name):
+        """Return the number of the station with the given name, adding it if it is new"""
+        if name not in self.stations:
+            self.stations.append(name)
+            with open(self.stationFile, 'w') as f:
+                json.dump(self.stations, f)
+        return self.stations.index(name)
+
+    def append(self, records):
+        """Append an array of records (of the store's dtype)"""
+        for name in self.dtype.names:
+            self.files[name].write(np.ascontiguousarray(records[name]).tobytes())
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    @staticmethod
+    def _length(path, name, itemsize):
+        """Number of whole values in the file of a column"""
+        fn = os.path.join(path, name + '.bin')
+        return os.path.getsize(fn) // itemsize if os.path.exists(fn) else 0
+
+    @staticmethod
+    def load(path):
+        """Return a dict of column name -> (read only, memory mapped) array, plus 'stations' with
+        the names of the stations; all columns have the length of the shortest
+        """
+        with open(os.path.join(path, 'schema.json')) as f:
+            schema = json.load(f)
+        n = min(ColumnStore._length(path, name, np.dtype(dtype).itemsize) for name, dtype in schema)
+        columns = {}
+        for name, dtype in schema:
+            fn = os.path.join(path, name + '.bin')
+            if n == 0:
+                columns[name] = np.zeros(0, dtype=dtype)
+            else:
+                columns[name] = np.memmap(fn, dtype=dtype, mode='r', shape=(n,))
+        stations = os.path.join(path, 'stations.json')
+        if os.path.exists(stations):
+            with open(stations) as f:
+                columns['stations'] = json.load(f)
+        else:
+            columns['stations'] = []
+        return columns
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        while True:
+            header = _recvExactly(sock, _header.size)
+            if header is None:
+                return
+            magic, nameLength, count = _header.unpack(bytes(header))
+            if magic != _magic or count > self.server.collector.maxRecords:
+                return
+            name = _recvExactly(sock, nameLength)
+            data = _recvExactly(sock, count*recordDtype.itemsize)
+            if name is None or data is None:
+                return
+            self.server.collector._ingest(bytes(name).decode('utf-8'), np.frombuffer(data, dtype=recordDtype))
+            sock.sendall(_ack.pack(count))
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # Many stations may (re)connect at once, e.g. when the collector comes back; the default backlog of 5
+    # refuses some of them, which then spool until their next retry
+    request_queue_size = 128
+
+
+class Collector(object):
+    """Receives records from CollectorClients and appends them to a ColumnStore
+
+    path -- directory of the ColumnStore
+    host, port -- where to listen (port 0 picks a free port; see address once started)
+    flushInterval -- how often (s) the store is flushed to disk
+    maxRecords -- the most records a frame may hold (a few times the clients' batchSize); a connection
+                  sending a larger frame is dropped
+    """
+    def __init__(self, path, host='127.0.0.1', port=5556, flushInterval=1.0, maxRecords=1024):
+        self.store = ColumnStore(path)
+        self.host = host
+        self.port = port
+        self.flushInterval = flushInterval
+        self.maxRecords = maxRecords
+        self.lock = threading.Lock()
+        self.lastSeq = {}
+        self.nRecords = 0
+        self.nDuplicates = 0
+        self.server = None
+        self.address = None
+
+        # Continue deduplicating where an existing store left off
+        columns = ColumnStore.load(path)
+        if len(columns['seq']):
+            order = np.lexsort((columns['seq'], columns['session'], columns['station']))
+            st, session, seq = columns['station'][order], columns['session'][order], columns['seq'][order]
+            last = np.flatnonzero(np.concatenate(((st[1:] != st[:-1]) | (session[1:] != session[:-1]), [True])))
+            for i in last:
+                self.lastSeq[(int(st[i]), int(session[i]))] = int(seq[i])
+
+    def start(self):
+        self.server = _Server((self.host, self.port), _Handler)
+        self.server.collector = self
+        self.address = self.server.server_address
+        self.running = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='Collector')
+        self.thread.daemon = True
+        self.thread.start()
+        self.flusher = threading.Thread(target=self._flush, name='CollectorFlush')
+        self.flusher.daemon = True
+        self.flusher.start()
+
+    def stop(self):
+        self.running = False
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.flusher.join()
+            self.server = None
+        with self.lock:
+            self.store.flush()
+
+    def close(self):
+        self.stop()
+        self.store.close()
+
+    def _flush(self):
+        while self.running:
+            time.sleep(self.flushInterval)
+            with self.lock:
+                self.store.flush()
+
+    def _ingest(self, name, records):
+        with self.lock:
+            station = self.store.station(name)
+            keep = np.ones(len(records), dtype=bool)
+            for session in np.unique(records['session']):
+                key = (station, int(session))
+                mine = records['session'] == session
+                keep[mine] = records['seq'][mine] > self.lastSeq.get(key, -1)
+                if keep[mine].any():
+                    self.lastSeq[key] = int(records['seq'][mine].max())
+            out = np.zeros(np.count_nonzero(keep), dtype=storedDtype)
+            out['station'] = station
+            for field in recordDtype.names:
+                out[field] = records[field][keep]
+            self.store.append(out)
+            self.nRecords += len(out)
+            self.nDuplicates += len(records) - len(out)
+
+
+class CollectorClient(object):
+    """Sends trials to a Collector in the background; use it as the store of an ANTExp
+
+    Only the append, flush and close methods of a store.SessionStore are provided; the trials are
+    read back from the collector's ColumnStore
+
+    station -- name of this station
+    host, port -- where the collector listens
+    spool -- file to keep records in while the collector can't be reached (default: in the temp dir)
+    session -- identifies this session of the station (default: the current time in microseconds)
+    batchSize -- maximum number of records sent in one frame (at most the collector's maxRecords)
+    maxQueue -- number of records that may be waiting to be sent before append() has to wait
+    timeout -- how long (s) to wait for the collector to connect or acknowledge a frame
+    retryInterval -- how long (s) to wait before trying to reconnect to the collector
+    """
+    def __init__(self, station, host='127.0.0.1', port=5556, spool=None, session=None, batchSize=64,
+                 maxQueue=4096, timeout=1.0, retryInterval=2.0):
+        self.station = station
+        self.name = station.encode('utf-8')
+        self.address = (host, port)
+        self.spool = spool if spool is not None else os.path.join(tempfile.gettempdir(), 'ant-%s.spool' % station)
+        self.session = session if session is not None else int(time.time()*1e6)
+        self.batchSize = batchSize
+        self.timeout = timeout
+        self.retryInterval = retryInterval
+        self.queue = queue.Queue(maxQueue)
+        self.record = np.zeros(1, dtype=recordDtype)
+        self.seq = 0
+        self.sock = None
+        self.lastAttempt = None
+        self.nSent = 0
+        self.nSpooled = 0
+        self.closed = False
+
+        self.thread = threading.Thread(target=self._run, name='CollectorClient')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def append(self, block, index, warning, congruency, res):
+        """Queue a trial (a result from ANTExp._oneProcedure) to be sent"""
+        r = self.record[0]
+        r['session'] = self.session
+        r['seq'] = self.seq
+        r['wallt'] = res.wt
+        r['t0'] = res.t0
+        r['d1'] = res.d1
+        r['ct'] = res.ct
+        r['d2'] = res.d2
+        r['rt'] = res.rt
+        r['tf'] = res.tf
+        r['block'] = block
+        r['index'] = index
+        r['warning'] = warning
+        r['congruency'] = congruency
+        r['location'] = res.condition.location
+        r['direction'] = res.condition.direction
+        r['response'] = responseCodes[res.resp]
+        r['completed'] = 1
+        self.seq += 1
+        self.queue.put(self.record.tobytes())
+
+    def flush(self):
+        """Block until every queued trial has been sent (or spooled)"""
+        if not self.closed:
+            self.queue.join()
+
+    def close(self):
+        """Send (or spool) everything queued and stop the sender thread"""
+        if not self.closed:
+            self.queue.put(None)
+            self.thread.join()
+            self._disconnect()
+            self.closed = True
+
+    def _run(self):
+        while True:
+            items = [self.queue.get()]
+            while items[-1] is not None and len(items) < self.batchSize:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = items[-1] is None
+            records = [i for i in items if i is not None]
+            if records:
+                payload = b''.join(records)
+                if not self._send(payload):
+                    self._spoolWrite(payload)
+            for i in items:
+                self.queue.task_done()
+            if stop:
+                return
+
+    def _connect(self):
+        """Make sure we are connected (retrying at most every retryInterval s); returns True if so"""
+        if self.sock is not None:
+            return True
+        now = time.time()
+        if self.lastAttempt is not None and now - self.lastAttempt < self.retryInterval:
+            return False
+        self.lastAttempt = now
+        try:
+            self.sock = socket.create_connection(self.address, self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (socket.error, socket.timeout):
+            self.sock = None
+            return False
+        # Anything spooled while we were disconnected goes first, to keep records in order
+        return self._sendSpool()
+
+    def _disconnect(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _sendFrame(self, payload):
+        """Send one frame and wait for its acknowledgement; returns True on success"""
+        count = len(payload) // recordDtype.itemsize
+        try:
+            self.sock.sendall(_header.pack(_magic, len(self.name), count) + self.name + payload)
+            ack = _recvExactly(self.sock, _ack.size)
+        except (socket.error, socket.timeout):
+            ack = None
+        if ack is None or _ack.unpack(bytes(ack))[0] != count:
+            self._disconnect()
+            return False
+        self.nSent += count
+        return True
+
+    def _send(self, payload):
+        return self._connect() and self._sendFrame(payload)
+
+    def _spoolWrite(self, payload):
+        with open(self.spool, 'ab') as f:
+            f.write(payload)
+        self.nSpooled += len(payload) // recordDtype.itemsize
+
+    def _sendSpool(self):
+        """Send the spooled records (if any); the spool is removed once they have all been acknowledged"""
+        try:
+            with open(self.spool, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError) as e:
+            if e.errno == errno.ENOENT:
+                return True
+            raise
+        frame = self.batchSize*recordDtype.itemsize
+        n = len(data) // recordDtype.itemsize * recordDtype.itemsize
+        for i in range(0, n, frame):
+            if not self._sendFrame(data[i:min(i + frame, n)]):
+                return False
+        os.remove(self.spool)
+        return True
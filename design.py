@@ -0,0 +1,184 @@
+"""
+Constrained, counterbalanced block orders for large designs
+
+generateOrders builds the procedure orders of many blocks at once. All sequences are extended one
+trial at a time in lock step, with every choice made for the whole batch by vectorized masking
+and weighted random keys, so there are no per-sequence rejection loops:
+
+  * runs of the same cue, target location, target direction (i.e. response) or flanker type
+    can be limited to a maximum length,
+  * first order transitions (e.g. from one cue to the next) can be kept as balanced as possible,
+  * levels with many procedures left are preferred, which keeps the constraints satisfiable
+    until the end of the block.
+
+The few sequences that still end up violating a constraint are regenerated (in a batch). Orders
+are reproducible from their seed and can be exported and loaded again:
+
+    orders = generateOrders(1000, nBlocks=6, maxRepeats={'cue': 2, 'tdir': 3}, seed=42)
+    saveOrders('design.npz', orders, seed=42)
+    ...
+    block = exp.fullExperiment(order=loadOrders('design.npz').orders[participant, b])
+"""
+import json
+import numpy as np
+
+from ant import Bunch, allProcedures, warningCodes, congruencyCodes, locationCodes, directionCodes
+
+factors = ('cue', 'tloc', 'tdir', 'flank')
+_codes = {'cue': warningCodes, 'tloc': locationCodes, 'tdir': directionCodes, 'flank': congruencyCodes}
+
+
+def factorLevels(procedures=None):
+    """Return a dict with the level (code) of each factor for every procedure, as int arrays"""
+    procedures = procedures if procedures is not None else allProcedures()
+    return dict((f, np.array([_codes[f][getattr(p, f)] for p in procedures], dtype=np.intp)) for f in factors)
+
+
+def runLengths(orders, levels):
+    """Length of the longest run of equal levels in each sequence
+
+    orders -- (..., nTrials) procedure indices
+    levels -- the level of each procedure for one factor (see factorLevels)
+    """
+    seq = levels[np.asarray(orders)]
+    shape = seq.shape[:-1]
+    seq = seq.reshape(-1, seq.shape[-1])
+    n, m = seq.shape
+    same = seq[:, 1:] == seq[:, :-1]
+
+    # Position of the most recent change at every trial; run length is the distance to it
+    idx = np.where(np.concatenate((np.ones((n, 1), dtype=bool), ~same), axis=1), np.arange(m), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return (np.arange(m) - idx + 1).max(axis=1).reshape(shape)
+
+
+def transitionCounts(orders, levels):
+    """Count of every first order transition (from level, to level) in each sequence"""
+    seq = levels[np.asarray(orders)]
+    shape = seq.shape[:-1]
+    seq = seq.reshape(-1, seq.shape[-1])
+    nLevels = levels.max() + 1
+    pair = (seq[:, :-1]*nLevels + seq[:, 1:]) + (np.arange(len(seq))*nLevels*nLevels)[:, None]
+    counts = np.bincount(pair.ravel(), minlength=len(seq)*nLevels*nLevels)
+    return counts.reshape(shape + (nLevels, nLevels))
+
+
+def _violations(orders, levels, maxRepeats):
+    bad = np.zeros(len(orders), dtype=bool)
+    for f, m in maxRepeats.items():
+        bad |= runLengths(orders, levels[f]) > m
+    return bad
+
+
+def _generate(n, levels, maxRepeats, balance, rng):
+    """Build n sequences of all procedures in lock step; returns an (n, nProcedures) array"""
+    nProcedures = len(levels['cue'])
+    rows = np.arange(n)
+    remaining = np.ones((n, nProcedures), dtype=bool)
+    orders = np.zeros((n, nProcedures), dtype=np.int16)
+
+    constrained = sorted(maxRepeats)
+    last = dict((f, np.full(n, -1, dtype=np.intp)) for f in constrained)
+    run = dict((f, np.zeros(n, dtype=np.intp)) for f in constrained)
+    left = dict((f, np.tile(np.bincount(levels[f]), (n, 1))) for f in constrained)
+    if balance is not None:
+        bl = levels[balance]
+        nb = bl.max() + 1
+        transitions = np.zeros((n, nb, nb), dtype=np.intp)
+        prev = np.zeros(n, dtype=np.intp)
+
+    for k in range(nProcedures):
+        allowed = remaining.copy()
+        weight = np.ones((n, nProcedures))
+        for f in constrained:
+            lv = levels[f]
+            allowed &= ~((lv[None, :] == last[f][:, None]) & (run[f] >= maxRepeats[f])[:, None])
+            weight *= left[f][:, lv]
+        # Dead end: take any remaining procedure (the sequence is regenerated later)
+        stuck = ~allowed.any(axis=1)
+        allowed[stuck] = remaining[stuck]
+
+        # Weighted random order of the allowed procedures (larger key first), least used transitions first
+        with np.errstate(divide='ignore'):
+            key = rng.random_sample((n, nProcedures)) ** (1.0 / weight)
+        if balance is not None and k > 0:
+            key -= transitions[rows[:, None], prev[:, None], bl[None, :]]
+        key[~allowed] = -np.inf
+        pick = key.argmax(axis=1)
+
+        orders[:, k] = pick
+        remaining[rows, pick] = False
+        for f in constrained:
+            lv = levels[f][pick]
+            run[f] = np.where(lv == last[f], run[f] + 1, 1)
+            last[f] = lv
+            left[f][rows, lv] -= 1
+        if balance is not None:
+            if k > 0:
+                transitions[rows, prev, bl[pick]] += 1
+            prev = bl[pick]
+    return orders
+
+
+def generateOrders(nParticipants, nBlocks=6, procedures=None, maxRepeats=None, balance='cue', seed=None,
+                   maxAttempts=20):
+    """Generate constrained block orders for a whole cohort
+
+    nParticipants, nBlocks -- the number of sequences generated is the product of these
+    procedures -- the procedures to order (default: ant.allProcedures())
+    maxRepeats -- dict of the longest allowed run of equal levels per factor ('cue', 'tloc',
+                  'tdir' or 'flank'); default {'cue': 3, 'tloc': 4, 'tdir': 4}
+    balance -- factor whose first order transitions are balanced within each block (or None)
+    seed -- seed for the random numbers; the same seed gives the same orders
+    maxAttempts -- how often sequences violating a constraint are regenerated before giving up
+
+    Returns an (nParticipants, nBlocks, nProcedures) array of procedure indices; raises
+    ValueError if the constraints could not be met
+    """
+    levels = factorLevels(procedures)
+    maxRepeats = dict(maxRepeats) if maxRepeats is not None else {'cue': 3, 'tloc': 4, 'tdir': 4}
+    for f in list(maxRepeats) + ([balance] if balance is not None else []):
+        if f not in factors:
+            raise ValueError("Unknown factor '%s'; use one of %s" % (f, ', '.join(factors)))
+    rng = np.random.RandomState(seed)
+
+    n = nParticipants*nBlocks
+    orders = _generate(n, levels, maxRepeats, balance, rng)
+    bad = np.flatnonzero(_violations(orders, levels, maxRepeats))
+    for attempt in range(maxAttempts):
+        if len(bad) == 0:
+            break
+        orders[bad] = _generate(len(bad), levels, maxRepeats, balance, rng)
+        bad = bad[_violations(orders[bad], levels, maxRepeats)]
+    if len(bad):
+        raise ValueError("Could not meet the constraints %s for %d of %d blocks" % (maxRepeats, len(bad), n))
+    return orders.reshape(nParticipants, nBlocks, -1)
+
+
+def saveOrders(path, orders, **info):
+    """Save orders (and info, e.g. the seed and constraints used) to a .npz or .csv file
+
+    A .csv file has a row per trial: participant, block, trial, procedure, cue, tloc, tdir, flank
+    """
+    orders = np.asarray(orders)
+    if path.endswith('.csv'):
+        p, b, t = np.indices(orders.shape).reshape(3, -1)
+        procedures = allProcedures()
+        with open(path, 'w') as f:
+            f.write('participant,block,trial,procedure,cue,tloc,tdir,flank\n')
+            for row in zip(p, b, t, orders.ravel()):
+                proc = procedures[row[3]]
+                f.write('%d,%d,%d,%d,%s,%s,%s,%s\n' % (row + (proc.cue, proc.tloc, proc.tdir, proc.flank)))
+    else:
+        np.savez_compressed(path, orders=orders, info=json.dumps(info, sort_keys=True))
+
+
+def loadOrders(path):
+    """Load orders saved by saveOrders; returns a Bunch of orders (and info, for .npz files)"""
+    if path.endswith('.csv'):
+        data = np.loadtxt(path, delimiter=',', skiprows=1, usecols=(0, 1, 2, 3), dtype=np.int64, ndmin=2)
+        orders = np.zeros(tuple(data[:, :3].max(axis=0) + 1), dtype=np.int16)
+        orders[data[:, 0], data[:, 1], data[:, 2]] = data[:, 3]
+        return Bunch(orders=orders, info={})
+    with np.load(path) as f:
+        return Bunch(orders=f['orders'], info=json.loads(str(f['info'])))
@@ -0,0 +1,116 @@
+"""
+Vectorized extraction of eye tracking epochs around ANT events
+
+Given samples timestamped on the experiment clock (e.g. from a gaze.GazeRecorder) and the results
+of fullExperiment, events are aligned to sample indices with searchsorted and all epochs are cut
+out in one go from a strided view of the samples, with optional baseline correction and averaging
+per warning type or congruency, without any per-trial Python code:
+
+    times, samples = gaze.samples(0)
+    ep = epochs(times, samples, eventTimes(allData, 'target'), -0.2, 1.0, baseline=(-0.2, 0))
+    avg, n = groupMeans(ep, allData[:, scores.WARNING], 4)
+"""
+import numpy as np
+
+from scores import T0, D1, CT, D2, RT
+
+events = ('fixation', 'cue', 'target', 'response')
+
+
+def eventTimes(results, event):
+    """Times (on the experiment clock) of an event in each trial of fullExperiment results
+
+    event -- 'fixation' (t0), 'cue' (t0+d1), 'target' (t0+d1+ct+d2) or 'response' (target+rt)
+    """
+    results = np.asarray(results)
+    t = results[:, T0].copy()
+    if event == 'fixation':
+        return t
+    t += results[:, D1]
+    if event == 'cue':
+        return t
+    t += results[:, CT] + results[:, D2]
+    if event == 'target':
+        return t
+    if event == 'response':
+        return t + results[:, RT]
+    raise ValueError("Unknown event '%s'; use one of %s" % (event, ', '.join(events)))
+
+
+def sampleRate(times):
+    """Estimate the sample rate (Hz) from sample times"""
+    return 1.0 / np.median(np.diff(times))
+
+
+def epochs(times, samples, at, tmin, tmax, rate=None, baseline=None):
+    """Cut out a fixed window of samples around every event
+
+    times -- sample times (sorted, on the same clock as the events)
+    samples -- (N,) or (N, nChannels) samples
+    at -- times of the events to align to
+    tmin, tmax -- the window, relative to each event (seconds)
+    rate -- sample rate in Hz (estimated from times if not given)
+    baseline -- optional (b0, b1) window relative to the event whose mean is subtracted per epoch
+
+    Returns an (nEvents, nSamples, nChannels) array; epochs that don't fit within the recording are NaN
+    """
+    times = np.asarray(times)
+    samples = np.asarray(samples, dtype=np.float64)
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    rate = rate if rate is not None else sampleRate(times)
+    n, c = samples.shape
+    length = int(round((tmax - tmin) * rate))
+
+    first = np.asarray(at) + tmin
+    if n < length:
+        return np.full((len(first), length, c), np.nan)
+    start = np.searchsorted(times, first)
+    # Epochs must fit in the recording, and not start (much) later than asked, e.g. before recording began
+    valid = (start + length <= n) & (times[np.minimum(start, n - 1)] - first <= 1.0/rate)
+
+    # A zero-copy view of every possible window, indexed by the start of each epoch
+    windows = np.lib.stride_tricks.as_strided(samples, shape=(n - length + 1, length, c),
+                                              strides=(samples.strides[0],) + samples.strides, writeable=False)
+    out = windows[np.where(valid, start, 0)]
+    out[~valid] = np.nan
+
+    if baseline is not None:
+        b0 = max(int(round((baseline[0] - tmin) * rate)), 0)
+        b1 = min(int(round((baseline[1] - tmin) * rate)), length)
+        out -= out[:, b0:b1].mean(axis=1, keepdims=True)
+    return out
+
+
+def cohortEpochs(sessions, event, tmin, tmax, rate=None, baseline=None):
+    """Epochs of a whole cohort in one batch
+
+    sessions -- a list of (times, samples, results) per session
+    event -- the event to align to (see eventTimes)
+
+    Returns (epochs, results, session) with the epochs of all sessions stacked, the matching rows
+    of the results and the session number of each epoch
+    """
+    ep = [epochs(t, s, eventTimes(r, event), tmin, tmax, rate, baseline) for t, s, r in sessions]
+    results = np.concatenate([np.asarray(r) for t, s, r in sessions])
+    session = np.repeat(np.arange(len(sessions)), [len(e) for e in ep])
+    return np.concatenate(ep), results, session
+
+
+def groupMeans(epochs, codes, nGroups):
+    """Average epochs per condition code (e.g. the WARNING or CONGRUENCY column of the results)
+
+    NaN samples (e.g. epochs outside the recording, or blinks) are left out of the averages
+
+    Returns (means, counts), both of shape (nGroups, nSamples, nChannels)
+    """
+    codes = np.asarray(codes).astype(np.intp)
+    flat = epochs.reshape(len(epochs), -1)
+    ok = ~np.isnan(flat)
+    onehot = np.zeros((nGroups, len(codes)))
+    onehot[codes, np.arange(len(codes))] = 1
+    sums = onehot.dot(np.where(ok, flat, 0))
+    counts = onehot.dot(ok)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    return means.reshape((nGroups,) + epochs.shape[1:]), counts.reshape((nGroups,) + epochs.shape[1:])
@@ -0,0 +1,113 @@
+"""
+Per-flip timing instrumentation and missed frame detection
+
+Every deadline driven flip in ANTExp._oneProcedure is recorded with its intended deadline and the
+actual flip time, and classified as on time, late by N frames or early. Records are kept in
+preallocated arrays; summaries are computed per block with numpy.
+"""
+import math
+import numpy as np
+
+# Phases of a procedure that are flipped at a deadline
+CUE, FIXATION, TARGET, END = range(4)
+phaseNames = ('cue', 'fixation', 'target', 'end')
+
+flipDtype = np.dtype([
+    ('block', np.int16),            # block number (-1 for practice)
+    ('phase', np.int8),             # CUE, FIXATION, TARGET or END
+    ('condition', np.int16),        # index of the procedure
+    ('deadline', np.float64),       # intended time (clock) of the flip
+    ('flip', np.float64),           # actual time (clock) after the flip
+    ('frames', np.int16),           # frames late (>0), 0 when on time and -1 when early
+])
+
+
+class FlipSummary(object):
+    """Timing statistics for a set of flips; all times are in seconds"""
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+    def __str__(self):
+        return ("%d flips: %d on time, %d late (%d dropped frames), %d early; "
+                "error mean %0.2f ms, sd %0.2f ms, max %0.2f ms (worst condition %d in %s phase)" %
+                (self.nFlips, self.onTime, self.late, self.droppedFrames, self.early,
+                 1000*self.meanError, 1000*self.sdError, 1000*self.maxError,
+                 self.worstCondition, phaseNames[self.worstPhase] if self.worstPhase >= 0 else '-'))
+
+
+class FlipMonitor(object):
+    """Records and classifies flips against their deadlines
+
+    ANTExp deadlines are the (frame quantized) times at which a retrace should show the new
+    stimulus, so a flip is on time when it happens at the deadline, give or take the tolerance.
+
+    frameTime -- duration of one frame in seconds
+    tolerance -- how far (seconds) beyond the intended frame a flip may be; defaults to half a frame
+    capacity -- number of flips to preallocate room for (grows if needed)
+    """
+    def __init__(self, frameTime, tolerance=None, capacity=4*48*8):
+        self.fixedTolerance = tolerance
+        self.setFrameTime(frameTime)
+        self.data = np.zeros(capacity, dtype=flipDtype)
+        self.n = 0
+        self.block = -1
+
+    def setFrameTime(self, frameTime):
+        """Classify flips recorded from now on against frames of frameTime (e.g. after a recalibration)"""
+        self.frameTime = frameTime
+        self.tolerance = self.fixedTolerance if self.fixedTolerance is not None else frameTime/2.0
+
+    def record(self, phase, condition, deadline, flip):
+        """Record one flip; returns the number of frames it was late (or -1 if early)"""
+        error = flip - deadline
+        if error > self.tolerance:
+            frames = int(math.ceil((error - self.tolerance) / self.frameTime))
+        elif error < -self.tolerance:
+            frames = -1
+        else:
+            frames = 0
+
+        if self.n == len(self.data):
+            self.data = np.concatenate((self.data, np.zeros(len(self.data), dtype=flipDtype)))
+        self.data[self.n] = (self.block, phase, condition, deadline, flip, frames)
+        self.n += 1
+        return frames
+
+    def flips(self, block=None):
+        """Return the recorded flips, possibly only those of one block"""
+        d = self.data[:self.n]
+        if block is not None:
+            d = d[d['block'] == block]
+        return d
+
+    def summary(self, block=None, binWidth=0.001):
+        """Summarize flip timing (of one block, or everything recorded)
+
+        Returns a FlipSummary with counts of on time, late and early flips, the number of dropped
+        frames, error statistics, a histogram of flip errors (counts and bin edges; binWidth
+        seconds wide) and the condition/phase with the largest error.
+        """
+        d = self.flips(block)
+        error = d['flip'] - d['deadline']
+        frames = d['frames']
+        if len(d):
+            lo = math.floor(error.min() / binWidth) * binWidth
+            hi = math.ceil(error.max() / binWidth) * binWidth + binWidth
+            counts, edges = np.histogram(error, bins=np.arange(lo, hi + binWidth/2, binWidth))
+            worst = int(np.argmax(error))
+            worstCondition, worstPhase, maxError = int(d['condition'][worst]), int(d['phase'][worst]), error[worst]
+        else:
+            counts, edges = np.zeros(0, dtype=np.int64), np.zeros(1)
+            worstCondition, worstPhase, maxError = -1, -1, 0.0
+
+        return FlipSummary(nFlips=len(d),
+                           onTime=int(np.count_nonzero(frames == 0)),
+                           late=int(np.count_nonzero(frames > 0)),
+                           early=int(np.count_nonzero(frames < 0)),
+                           droppedFrames=int(frames[frames > 0].sum()),
+                           meanError=float(error.mean()) if len(d) else 0.0,
+                           sdError=float(error.std()) if len(d) else 0.0,
+                           maxError=float(maxError),
+                           histogram=(counts, edges),
+                           worstCondition=worstCondition,
+                           worstPhase=worstPhase)
@@ -0,0 +1,182 @@
+"""
+Background acquisition of gaze/pupil samples into a preallocated ring buffer
+
+A GazeRecorder runs a thread that reads samples from a source and timestamps them on the same
+clock ANTExp uses (so they line up with t0, d1, ct and d2). Samples are written straight into a
+preallocated numpy ring buffer, and the experiment never waits for the recorder: ANTExp only
+notes the (absolute) sample index at the start and end of each procedure.
+
+    gaze = GazeRecorder(ReplaySource('session.npy', rate=60), globalClock)
+    gaze.start()
+    exp = ANTExp(mon, win, winsize, refresh, globalClock, startTime, alog, gaze=gaze)
+    ...
+    gaze.stop()
+    t, samples = gaze.samples(res.gaze[0], res.gaze[1])
+
+Sources implement readInto(out), filling the first rows of the (k, nChannels) array out with
+new samples and returning how many were written (0 if none arrived within a short timeout).
+"""
+import time
+import socket
+import threading
+import numpy as np
+
+
+class ReplaySource(object):
+    """Replays recorded samples at their original rate
+
+    data -- an (N, nChannels) array, or a .npy/text file holding one
+    rate -- sample rate in Hz
+    loop -- start over when all samples have been replayed
+    """
+    def __init__(self, data, rate=60.0, loop=False):
+        if isinstance(data, str):
+            data = np.load(data) if data.endswith('.npy') else np.loadtxt(data, ndmin=2)
+        self.data = np.asarray(data, dtype=np.float64)
+        self.nChannels = self.data.shape[1]
+        self.rate = float(rate)
+        self.loop = loop
+        self.pos = 0
+        self.startTime = None
+
+    def readInto(self, out):
+        now = time.time()
+        if self.startTime is None:
+            self.startTime = now
+        due = int((now - self.startTime) * self.rate) + 1 - self.pos
+        if due <= 0:
+            # Sleep until the next sample is due (but not too long, so we can be stopped)
+            time.sleep(min(0.01, (self.pos - (now - self.startTime)*self.rate) / self.rate))
+            return 0
+
+        k = min(due, len(out))
+        n = len(self.data)
+        if not self.loop:
+            k = min(k, n - self.pos)
+            if k <= 0:
+                time.sleep(0.01)
+                return 0
+            out[:k] = self.data[self.pos:self.pos + k]
+        else:
+            out[:k] = self.data.take(np.arange(self.pos, self.pos + k), axis=0, mode='wrap')
+        self.pos += k
+        return k
+
+
+class SocketSource(object):
+    """Receives samples as UDP datagrams on a local socket, standing in for an eye tracker
+
+    Each datagram holds one or more samples of nChannels little endian float64 values each.
+
+    nChannels -- number of values per sample
+    port -- UDP port to listen on (at host)
+    """
+    def __init__(self, nChannels=3, port=5555, host='127.0.0.1', maxSamples=64):
+        self.nChannels = nChannels
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.01)
+        self.packet = bytearray(8*nChannels*maxSamples)
+        self.view = np.frombuffer(self.packet, dtype='<f8').reshape(maxSamples, nChannels)
+
+    def readInto(self, out):
+        try:
+            nbytes = self.sock.recv_into(self.packet)
+        except socket.timeout:
+            return 0
+        k = min(nbytes // (8*self.nChannels), len(out))
+        out[:k] = self.view[:k]
+        return k
+
+    def close(self):
+        self.sock.close()
+
+
+class GazeRecorder(object):
+    """Records samples from a source on a background thread into a ring buffer
+
+    source -- where samples come from (see ReplaySource and SocketSource)
+    clock -- the clock to timestamp samples with (the one given to ANTExp)
+    capacity -- number of samples kept; older samples are overwritten
+    rate -- nominal sample rate in Hz, used to spread timestamps when several samples arrive
+            together (the last one gets the time of arrival); default is the source's rate, if any
+    """
+    def __init__(self, source, clock, capacity=1 << 20, rate=None):
+        self.source = source
+        self.clock = clock
+        self.capacity = capacity
+        self.rate = rate if rate is not None else getattr(source, 'rate', None)
+        self.times = np.zeros(capacity)
+        self.data = np.zeros((capacity, source.nChannels))
+        self.n = 0                  # total number of samples received (absolute index of the next one)
+        self.writing = 0            # samples up to this absolute index may be being written
+        self.running = False
+        self.thread = None
+
+        # Scratch space for the source and timestamp offsets, allocated once
+        # (no larger than the ring, so a batch wraps around it at most once)
+        b = min(256, capacity)
+        self._batch = np.zeros((b, source.nChannels))
+        self._offsets = np.arange(1 - b, 1, dtype=np.float64) / self.rate if self.rate else np.zeros(b)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='GazeRecorder')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        batch = self._batch
+        b = len(batch)
+        while self.running:
+            k = self.source.readInto(batch)
+            if k == 0:
+                continue
+            t = self.clock.getTime()
+            i = self.n % self.capacity
+            self.writing = self.n + k
+            first = min(k, self.capacity - i)
+            self.data[i:i + first] = batch[:first]
+            np.add(self._offsets[b - k:b - k + first], t, out=self.times[i:i + first])
+            if first < k:
+                self.data[:k - first] = batch[first:k]
+                np.add(self._offsets[b - k + first:], t, out=self.times[:k - first])
+            self.n += k
+
+    def samples(self, start, stop=None):
+        """Return (times, samples) copies for absolute sample indices start..stop (default: up to now)
+
+        Samples that have already been overwritten are left out
+        """
+        n = self.n
+        stop = n if stop is None else min(stop, n)
+        start = max(start, n - self.capacity)
+        idx = np.arange(start, stop) % self.capacity
+        times, data = self.times[idx], self.data[idx]
+
+        # Drop anything the recorder overwrote (or started overwriting) while we were copying
+        lost = self.writing - self.capacity - start
+        if lost > 0:
+            times, data = times[lost:], data[lost:]
+        return times, data
+
+    def between(self, t0, t1):
+        """Return (times, samples) of the buffered samples with t0 <= time < t1"""
+        n = self.n
+        start = max(0, n - self.capacity)
+        # The buffered samples are (at most) two contiguous runs of the ring, each sorted by time
+        i = start % self.capacity
+        first = self.times[i:i + n - start]
+        second = self.times[:n - start - len(first)]
+
+        def find(t):
+            if len(second) and second[0] <= t:
+                return start + len(first) + int(np.searchsorted(second, t))
+            return start + int(np.searchsorted(first, t))
+        return self.samples(find(t0), find(t1))
@@ -0,0 +1,189 @@
+"""
+Streaming reader and aggregator for large archives of ANT log files
+
+Reads the ';'-separated logs written by ANTExp in chunks of typed numpy columns, so files of any
+size are processed in constant memory, and keeps running per-condition statistics that can be
+merged across files. Lines that are not trial records (e.g. key press messages when logging to
+stdout) are skipped, and a truncated last line from an aborted session is ignored:
+
+    for chunk in readLog('p01.log'):
+        print(chunk['rt'].mean())
+
+    summary = aggregate(glob.glob('archive/*/*.log'))
+    print(summary.total.scores())
+"""
+import functools
+import multiprocessing
+import numpy as np
+
+from ant import Bunch, warningCodes, congruencyCodes, locationCodes, directionCodes
+
+logDtype = np.dtype([
+    ('wallt', np.float64),
+    ('t0', np.float64),
+    ('warning', np.int8),           # 0-3: none, center, double, spatial
+    ('location', np.int8),          # 0: top, 1: bottom
+    ('direction', np.int8),         # 0: left, 1: right
+    ('congruency', np.int8),        # 0-2: congruent, incongruent, neutral
+    ('d1', np.float32),
+    ('ct', np.float32),
+    ('d2', np.float32),
+    ('rt', np.float32),
+    ('tf', np.float32),
+    ('response', np.int8),          # 1: correct, 0: incorrect, -1: no response
+])
+
+_responses = {'OK': 1, 'NOK': 0, 'None': -1}
+
+
+def _parse(line):
+    """Return a tuple for a trial record line, or None if it isn't a (complete) trial record"""
+    if not line.endswith('\n'):
+        return None
+    f = line.rstrip('\r\n').split(';')
+    if len(f) != 12:
+        return None
+    try:
+        return (float(f[0]), float(f[1]), warningCodes[f[2]], locationCodes[f[3]], directionCodes[f[4]],
+                congruencyCodes[f[5]], float(f[6]), float(f[7]), float(f[8]), float(f[9]), float(f[10]),
+                _responses[f[11]])
+    except (KeyError, ValueError):
+        return None
+
+
+def readLog(path, chunkSize=4096, info=None):
+    """Generator yielding the trials of a log file as arrays of logDtype, at most chunkSize rows each
+
+    info -- an optional dict, updated with the number of 'skipped' lines and whether the file was
+            'truncated' (its last line incomplete)
+    """
+    rows = []
+    skipped = 0
+    last = ''
+    with open(path) as f:
+        for line in f:
+            last = line
+            rec = _parse(line)
+            if rec is None:
+                skipped += 1
+                continue
+            rows.append(rec)
+            if len(rows) == chunkSize:
+                yield np.array(rows, dtype=logDtype)
+                rows = []
+    if rows:
+        yield np.array(rows, dtype=logDtype)
+
+    if info is not None:
+        info['truncated'] = bool(last) and not last.endswith('\n')
+        info['skipped'] = skipped
+
+
+class LogStats(object):
+    """Running per-condition statistics (warning type x congruency) that can be updated and merged
+
+    Reaction time sums only include correctly answered trials
+    """
+    def __init__(self):
+        self.count = np.zeros((4, 3), dtype=np.int64)
+        self.correct = np.zeros((4, 3), dtype=np.int64)
+        self.rtSum = np.zeros((4, 3))
+        self.rtSumSq = np.zeros((4, 3))
+
+    def add(self, chunk):
+        """Update with an array of logDtype trials"""
+        cell = chunk['warning'].astype(np.intp)*3 + chunk['congruency']
+        ok = chunk['response'] == 1
+        rt = chunk['rt'][ok].astype(np.float64)
+        self.count += np.bincount(cell, minlength=12).reshape(4, 3)
+        self.correct += np.bincount(cell[ok], minlength=12).reshape(4, 3)
+        self.rtSum += np.bincount(cell[ok], weights=rt, minlength=12).reshape(4, 3)
+        self.rtSumSq += np.bincount(cell[ok], weights=rt*rt, minlength=12).reshape(4, 3)
+
+    def merge(self, other):
+        """Add the statistics of another LogStats to these"""
+        self.count += other.count
+        self.correct += other.correct
+        self.rtSum += other.rtSum
+        self.rtSumSq += other.rtSumSq
+
+    def scores(self):
+        """Return a Bunch of trial counts, accuracy, mean RT (overall, per warning type, per
+        congruency, per cell with its sd) and the network scores based on mean RTs
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            meanRT = self.rtSum / self.correct
+            sdRT = np.sqrt(np.maximum(self.rtSumSq/self.correct - meanRT**2, 0) * self.correct/(self.correct - 1))
+            byWarning = self.rtSum.sum(axis=1) / self.correct.sum(axis=1)
+            byCongruency = self.rtSum.sum(axis=0) / self.correct.sum(axis=0)
+            return Bunch(nTrials=int(self.count.sum()),
+                         accuracy=float(self.correct.sum()) / self.count.sum(),
+                         meanRT=float(self.rtSum.sum() / self.correct.sum()),
+                         cellMeanRT=meanRT,
+                         cellSdRT=sdRT,
+                         byWarning=byWarning,
+                         byCongruency=byCongruency,
+                         alerting=byWarning[warningCodes['no']] - byWarning[warningCodes['double']],
+                         orienting=byWarning[warningCodes['center']] - byWarning[warningCodes['spatial']],
+                         executive=byCongruency[congruencyCodes['incongruent']] - byCongruency[congruencyCodes['congruent']])
+
+
+def summarizeFile(path, chunkSize=4096):
+    """Stream one log file; returns (path, LogStats, info) where info has 'truncated' and 'skipped'"""
+    stats = LogStats()
+    info = {}
+    try:
+        for chunk in readLog(path, chunkSize, info):
+            stats.add(chunk)
+    except (IOError, OSError, UnicodeDecodeError) as e:
+        info['error'] = str(e)
+    return path, stats, info
+
+
+fileDtype = np.dtype([
+    ('nTrials', np.int32),
+    ('accuracy', np.float64),
+    ('meanRT', np.float64),
+    ('alerting', np.float64),
+    ('orienting', np.float64),
+    ('executive', np.float64),
+    ('truncated', np.bool_),
+    ('failed', np.bool_),
+])
+
+
+def aggregate(paths, processes=None, chunkSize=4096):
+    """Summarize many log files in parallel
+
+    paths -- the log files (any iterable; it is consumed lazily)
+    processes -- number of worker processes (default: one per CPU; 1 runs everything in this process)
+
+    Returns a Bunch of
+        paths -- the files, in the order they were summarized
+        files -- an array of fileDtype with the summary of each of these files
+        total -- a LogStats over all files
+    """
+    total = LogStats()
+    done = []
+    rows = []
+
+    def collect(results):
+        for path, stats, info in results:
+            total.merge(stats)
+            s = stats.scores()
+            done.append(path)
+            rows.append((s.nTrials, s.accuracy, s.meanRT, s.alerting, s.orienting, s.executive,
+                         info.get('truncated', False), 'error' in info))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if processes == 1:
+            collect(summarizeFile(p, chunkSize) for p in paths)
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                collect(pool.imap_unordered(functools.partial(summarizeFile, chunkSize=chunkSize), paths, chunksize=16))
+            finally:
+                pool.close()
+                pool.join()
+
+    return Bunch(paths=done, files=np.array(rows, dtype=fileDtype), total=total)
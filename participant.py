@@ -0,0 +1,234 @@
+"""
+Simulated ANT participants and Monte Carlo power analysis
+
+A Population describes how reaction times and errors are distributed across participants: each
+participant gets an ex-Gaussian RT distribution shifted per cue and per flanker condition (giving
+the alerting, orienting and conflict effects), and an error rate that is higher for incongruent
+flankers. From it you can
+
+  * draw a SimParticipant and use it as the responder of simdisplay.SimBackend, running a real
+    ANTExp session in virtual time (runSession), or
+  * simulate whole cohorts directly in the fullExperiment result layout (simulateBlocks), which
+    is vectorized and fast enough for power analysis (powerAnalysis).
+
+    curves = powerAnalysis('orienting', effects=(0.02, 0.04), nParticipants=(10, 20, 40))
+    printPower(curves)
+"""
+import os
+import math
+import multiprocessing
+import numpy as np
+
+from ant import ANTExp, allProcedures, warningCodes, congruencyCodes
+from scores import networkScores
+
+_networks = ('alerting', 'orienting', 'executive')
+
+
+class Population(object):
+    """Distribution of simulated participants; all times are in seconds
+
+    mu, sigma, tau -- ex-Gaussian parameters (mean and sd of the normal part, mean of the exponential)
+    sdMu -- between participant sd of mu
+    alerting, orienting, executive -- mean network effects (defaults roughly as in Fan et al, 2002)
+    sdNetwork -- between participant sd of each network effect
+    errorRate -- probability of pressing the wrong key
+    incongruentErrors -- extra error probability with incongruent flankers
+    tOut -- response timeout; slower responses are recorded as missing
+    """
+    def __init__(self, mu=0.45, sigma=0.04, tau=0.1, sdMu=0.06, alerting=0.047, orienting=0.051,
+                 executive=0.084, sdNetwork=0.02, errorRate=0.01, incongruentErrors=0.04, tOut=1.7):
+        self.mu = mu
+        self.sigma = sigma
+        self.tau = tau
+        self.sdMu = sdMu
+        self.alerting = alerting
+        self.orienting = orienting
+        self.executive = executive
+        self.sdNetwork = sdNetwork
+        self.errorRate = errorRate
+        self.incongruentErrors = incongruentErrors
+        self.tOut = tOut
+
+    def shifts(self, n, rng):
+        """Draw n participants; returns (mu, cueShift (n, 4), flankShift (n, 3)) indexed by the result codes"""
+        mu = self.mu + self.sdMu*rng.standard_normal(n)
+        alerting = self.alerting + self.sdNetwork*rng.standard_normal(n)
+        orienting = self.orienting + self.sdNetwork*rng.standard_normal(n)
+        executive = self.executive + self.sdNetwork*rng.standard_normal(n)
+
+        cueShift = np.zeros((n, 4))
+        cueShift[:, warningCodes['no']] = alerting
+        cueShift[:, warningCodes['spatial']] = -orienting
+        flankShift = np.zeros((n, 3))
+        flankShift[:, congruencyCodes['incongruent']] = executive
+        return mu, cueShift, flankShift
+
+    def participant(self, rng=None):
+        """Draw a single SimParticipant"""
+        rng = rng if rng is not None else np.random.RandomState()
+        mu, cueShift, flankShift = self.shifts(1, rng)
+        return SimParticipant(self, mu[0], cueShift[0], flankShift[0], rng)
+
+
+class SimParticipant(object):
+    """A simulated participant, to be used as the responder of a simdisplay.SimBackend
+
+    Called with a procedure (an ant.Procedure, using its integer warning and congruency codes and its
+    tdir) it returns the key pressed and the reaction time, or None if it doesn't respond in time
+    """
+    def __init__(self, population, mu, cueShift, flankShift, rng):
+        self.population = population
+        self.mu = mu
+        self.cueShift = cueShift
+        self.flankShift = flankShift
+        self.rng = rng
+
+    def __call__(self, condition):
+        p = self.population
+        rt = (self.mu + self.cueShift[condition.warning] + self.flankShift[condition.congruency] +
+              p.sigma*self.rng.standard_normal() + self.rng.exponential(p.tau))
+        if rt >= p.tOut:
+            return None
+        error = p.errorRate + (p.incongruentErrors if condition.congruency == congruencyCodes['incongruent'] else 0)
+        if self.rng.random_sample() < error:
+            return ('left' if condition.tdir == 'right' else 'right', rt)
+        return (condition.tdir, rt)
+
+
+def runSession(participant, nBlocks=6, refreshRate=60):
+    """Run a complete ANTExp session (in virtual time) with a SimParticipant
+
+    The participant's random state also draws the procedure orders and timings, so a seeded
+    participant runs a reproducible session
+
+    Returns the fullExperiment results of all blocks stacked in one array
+    """
+    from simdisplay import SimMonitor, SimWindow, SimClock, SimBackend
+
+    mon = SimMonitor()
+    clock = SimClock()
+    win = SimWindow(clock, refreshRate, monitor=mon)
+    with open(os.devnull, 'w') as devnull:
+        exp = ANTExp(mon, win, win.size, refreshRate, clock, 0.0, devnull,
+                     backend=SimBackend(clock, responder=participant), rng=participant.rng)
+        exp.log.console = devnull
+        blocks = [exp.fullExperiment() for b in range(nBlocks)]
+        exp.close()
+    return np.concatenate(blocks)
+
+
+def simulateBlocks(population, nParticipants, nBlocks=6, rng=None):
+    """Simulate nParticipants each running nBlocks blocks, without running ANTExp
+
+    Returns a (nParticipants, nBlocks*48, 11) array in the layout of fullExperiment results
+    (rows in procedure order within each block), ready for scores.networkScores
+    """
+    rng = rng if rng is not None else np.random.RandomState()
+    procedures = allProcedures()
+    warning = np.array([p.warning for p in procedures])
+    congruency = np.array([p.congruency for p in procedures])
+    nT = nBlocks*len(procedures)
+    warning = np.tile(warning, nBlocks)
+    congruency = np.tile(congruency, nBlocks)
+
+    mu, cueShift, flankShift = population.shifts(nParticipants, rng)
+    rt = (mu[:, None] + cueShift[:, warning] + flankShift[:, congruency] +
+          population.sigma*rng.standard_normal((nParticipants, nT)) +
+          rng.exponential(population.tau, (nParticipants, nT)))
+    error = population.errorRate + np.where(congruency == congruencyCodes['incongruent'], population.incongruentErrors, 0)
+    correct = (rng.random_sample((nParticipants, nT)) >= error) & (rt < population.tOut)
+
+    data = np.empty((nParticipants, nT, 11))
+    data[..., 0] = 4.0*np.arange(nT)
+    data[..., 1] = np.tile(np.arange(len(procedures)), nBlocks)
+    data[..., 2] = warning
+    data[..., 3] = congruency
+    data[..., 4] = 0.01*rng.randint(40, 160, (nParticipants, nT))
+    data[..., 5] = 0.1
+    data[..., 6] = 0.4
+    data[..., 7] = np.minimum(rt, population.tOut)
+    data[..., 8] = 4.0
+    data[..., 9] = correct
+    data[..., 10] = 1
+    return data
+
+
+def tCritical(df, alpha=0.05):
+    """Two sided critical value of Student's t distribution (by numerical integration of its density)"""
+    x = np.linspace(0, 100, 1000001)
+    logc = math.lgamma((df + 1)/2.0) - math.lgamma(df/2.0) - 0.5*math.log(df*math.pi)
+    pdf = np.exp(logc - (df + 1)/2.0*np.log1p(x*x/df))
+    cdf = 0.5 + np.concatenate(([0], np.cumsum(0.5*(pdf[1:] + pdf[:-1])*np.diff(x))))
+    return float(np.interp(1 - alpha/2.0, cdf, x))
+
+
+def _powerCell(args):
+    """Power of detecting a network effect for one (effect, n, blocks) combination"""
+    population, network, effect, n, blocks, nCohorts, alpha, statistic, seed = args
+    rng = np.random.RandomState(seed)
+    pop = Population(**population.__dict__)
+    setattr(pop, network, effect)
+
+    # Simulate in chunks of cohorts to keep memory bounded
+    t = np.empty(nCohorts)
+    chunk = max(1, 2000000 // (n*blocks*48))
+    for c0 in range(0, nCohorts, chunk):
+        c = min(chunk, nCohorts - c0)
+        data = simulateBlocks(pop, c*n, blocks, rng)
+        s = networkScores(data, statistic=statistic)[network].reshape(c, n)
+        t[c0:c0 + c] = s.mean(axis=1) / (s.std(axis=1, ddof=1) / math.sqrt(n))
+
+    return np.mean(np.abs(t) > tCritical(n - 1, alpha))
+
+
+powerDtype = np.dtype([('effect', np.float64), ('nParticipants', np.int32), ('nBlocks', np.int32),
+                       ('power', np.float64)])
+
+
+def powerAnalysis(network, effects, nParticipants, nBlocks=(2, 4, 6), population=None, nCohorts=500,
+                  alpha=0.05, statistic='median', processes=None, seed=0):
+    """Estimate the power of a (two sided, one sample) t-test for a network score being non-zero
+
+    network -- 'alerting', 'orienting' or 'executive'
+    effects -- mean effects (s) to try for that network
+    nParticipants -- cohort sizes to try
+    nBlocks -- number of 48 trial blocks per participant to try
+    population -- the Population to simulate (default Population())
+    nCohorts -- number of simulated cohorts per combination
+    alpha -- significance level
+    statistic -- 'median' or 'mean', as in scores.networkScores
+    processes -- number of worker processes (default: one per CPU; 1 runs everything in this process)
+    seed -- seed for the simulations; every combination is simulated with its own derived seed
+
+    Returns an array of powerDtype with one row per (effect, nParticipants, nBlocks) combination
+    """
+    if network not in _networks:
+        raise ValueError("Unknown network '%s'; use one of %s" % (network, ', '.join(_networks)))
+    population = population if population is not None else Population()
+
+    cells = [(e, n, b) for e in effects for n in nParticipants for b in nBlocks]
+    jobs = [(population, network, e, n, b, nCohorts, alpha, statistic, seed + i) for i, (e, n, b) in enumerate(cells)]
+    if processes == 1:
+        power = [_powerCell(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            power = pool.map(_powerCell, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    out = np.zeros(len(cells), dtype=powerDtype)
+    out['effect'] = [c[0] for c in cells]
+    out['nParticipants'] = [c[1] for c in cells]
+    out['nBlocks'] = [c[2] for c in cells]
+    out['power'] = power
+    return out
+
+
+def printPower(curves):
+    """Print power curves (as returned by powerAnalysis) as a table"""
+    print("effect(ms) participants blocks power")
+    for r in curves:
+        print("%10.1f %12d %6d %5.3f" % (1000*r['effect'], r['nParticipants'], r['nBlocks'], r['power']))
@@ -0,0 +1,158 @@
+"""
+Low overhead profiling of where the time goes within ANT procedures
+
+A Profiler records spans (phase, start, duration; in integer nanoseconds from perf_counter_ns)
+into preallocated arrays. Given to ANTExp, it times the calls a procedure makes (through timed
+versions kept by ANTExp, so the caller's window, backend and keyboard are not patched and calls
+made outside procedures, e.g. by displayText, are not counted); nothing changes (and nothing is
+spent) when no profiler is given:
+
+    trial       -- a complete procedure (_oneProcedure)
+    draw        -- drawing a stimulus
+    wait        -- waiting for a flip deadline (backend.wait)
+    flip        -- win.flip
+    clearEvents -- discarding buffered keys
+    waitKeys    -- waiting for the response
+    record      -- logging and storing a trial (and running any subscribers)
+
+Spans can be exported as Chrome trace events (load the file in chrome://tracing or Perfetto) or
+summarized per phase:
+
+    prof = Profiler()
+    exp = ANTExp(mon, win, winsize, refresh, globalClock, startTime, alog, profiler=prof)
+    ...
+    prof.printSummary()
+    prof.chromeTrace('session-trace.json')
+
+Other code can be profiled too, with prof.timed(func, 'phase'), prof.wrap(obj, 'method', 'phase') or
+`with prof.span('phase'):`.
+"""
+import os
+import sys
+import json
+import time
+import contextlib
+import numpy as np
+
+try:
+    _now = time.perf_counter_ns
+except AttributeError:
+    try:
+        _counter = time.perf_counter
+    except AttributeError:
+        _counter = time.time
+
+    def _now():
+        return int(_counter()*1e9)
+
+spanDtype = np.dtype([
+    ('phase', np.int16),            # index into Profiler.phases
+    ('start', np.int64),            # ns (perf_counter_ns)
+    ('duration', np.int64),         # ns
+])
+
+
+class Profiler(object):
+    """Records timed spans of named phases into a preallocated buffer
+
+    capacity -- the number of spans kept; later spans are counted in dropped, but not kept
+    """
+    def __init__(self, capacity=1 << 16):
+        self.phases = []
+        self.phase = np.zeros(capacity, dtype=np.int16)
+        self.start = np.zeros(capacity, dtype=np.int64)
+        self.duration = np.zeros(capacity, dtype=np.int64)
+        self.n = 0
+        self.dropped = 0
+
+    def phaseId(self, name):
+        """Return the number of a phase, registering it if it is new"""
+        if name not in self.phases:
+            self.phases.append(name)
+        return self.phases.index(name)
+
+    def record(self, phase, start, stop):
+        """Record a span of phase (a number from phaseId) from start to stop (ns)"""
+        n = self.n
+        if n == len(self.start):
+            self.dropped += 1
+            return
+        self.phase[n] = phase
+        self.start[n] = start
+        self.duration[n] = stop - start
+        self.n = n + 1
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """Context manager recording the time spent in its body as phase name"""
+        phase = self.phaseId(name)
+        start = _now()
+        try:
+            yield
+        finally:
+            self.record(phase, start, _now())
+
+    def timed(self, func, name):
+        """Return a function calling func and recording each call as phase name"""
+        if getattr(func, '_profiled', None) is self:
+            return func
+        phase = self.phaseId(name)
+        record = self.record
+
+        def timed(*args, **kwds):
+            start = _now()
+            try:
+                return func(*args, **kwds)
+            finally:
+                record(phase, start, _now())
+        timed._profiled = self
+        return timed
+
+    def wrap(self, obj, attr, name):
+        """Replace the method attr of obj (on the object itself) by one recording each call as phase name"""
+        setattr(obj, attr, self.timed(getattr(obj, attr), name))
+
+    def spans(self):
+        """Return the recorded spans as an array of spanDtype, in the order they ended"""
+        d = np.zeros(self.n, dtype=spanDtype)
+        d['phase'] = self.phase[:self.n]
+        d['start'] = self.start[:self.n]
+        d['duration'] = self.duration[:self.n]
+        return d
+
+    def summary(self):
+        """Return a list of (phase, count, total, mean, p50, p95, p99, max) with times in ms,
+        ordered by total time spent
+        """
+        rows = []
+        phase = self.phase[:self.n]
+        ms = self.duration[:self.n] / 1e6
+        for k, name in enumerate(self.phases):
+            d = ms[phase == k]
+            if len(d) == 0:
+                continue
+            p50, p95, p99 = np.percentile(d, (50, 95, 99))
+            rows.append((name, len(d), float(d.sum()), float(d.mean()), float(p50), float(p95), float(p99),
+                         float(d.max())))
+        rows.sort(key=lambda r: -r[2])
+        return rows
+
+    def printSummary(self, stream=None):
+        """Print the summary as a table (to stdout by default)"""
+        stream = stream if stream is not None else sys.stdout
+        stream.write("%-12s %8s %10s %8s %8s %8s %8s %8s\n" %
+                     ('phase', 'count', 'total ms', 'mean', 'p50', 'p95', 'p99', 'max'))
+        for row in self.summary():
+            stream.write("%-12s %8d %10.1f %8.3f %8.3f %8.3f %8.3f %8.3f\n" % row)
+        if self.dropped:
+            stream.write("(%d spans dropped; the buffer holds %d)\n" % (self.dropped, len(self.start)))
+
+    def chromeTrace(self, path):
+        """Write the spans as Chrome trace event JSON"""
+        pid = os.getpid()
+        t0 = int(self.start[:self.n].min()) if self.n else 0
+        events = [{'name': self.phases[p], 'ph': 'X', 'pid': pid, 'tid': 1,
+                   'ts': (int(s) - t0) / 1000.0, 'dur': int(d) / 1000.0}
+                  for p, s, d in zip(self.phase[:self.n], self.start[:self.n], self.duration[:self.n])]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,283 @@
+"""
+Offline rendering of ANT sessions to video frames, without a display
+
+The stimuli are built by ANTExp itself (the fixation cross, cues and arrows of _fixStim, _cueStim,
+_drawLine and _drawHead), on a backend whose ShapeStims are rasterized with numpy instead of
+OpenGL: every polygon and line is filled by testing all pixel centers in its bounding box at once
+(optionally supersampled). Each distinct screen is rendered once, and a session's trials (from
+its log file or session store) are replayed frame by frame from their t0, d1, ct, d2, rt and tf,
+so a session is written much faster than it ran. What was shown between trials that follow each
+other with a gap (e.g. the text screens between blocks) is not logged, so those frames are drawn
+as a uniform gray screen (SessionRenderer.GAP) rather than guessed:
+
+    renderer = SessionRenderer(mon, (1440, 900), 60, scale=0.5)
+    trials = renderer.load('p01.log')
+    with open('p01.raw', 'wb') as f:
+        renderer.writeRaw(f, trials)
+    # ffmpeg -f rawvideo -pix_fmt gray -s 720x450 -r 60 -i p01.raw p01.mp4
+
+or from the command line:
+
+    python render.py p01.log --size 1440x900 --scale 0.5 | ffmpeg -f rawvideo -pix_fmt gray -s 720x450 -r 60 -i - p01.mp4
+"""
+import os
+import sys
+import math
+import argparse
+import numpy as np
+
+from ant import ANTExp, targets, locationCodes, directionCodes, congruencyCodes
+from simdisplay import SimClock, SimMonitor, SimWindow, SimStim, SimBackend
+from logarchive import readLog
+
+_gray = {'black': 0, 'white': 255}
+
+
+def _fill(canvas, poly, value, aa):
+    """Blend value into canvas wherever the convex polygon poly (pixel coordinates) covers it"""
+    h, w = canvas.shape
+    x0, y0 = np.floor(poly.min(axis=0)).astype(int)
+    x1, y1 = np.ceil(poly.max(axis=0)).astype(int)
+    x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, w), min(y1, h)
+    if x1 <= x0 or y1 <= y0:
+        return
+
+    # Sample points (pixel centers, or aa x aa per pixel) in the bounding box
+    sub = (np.arange(aa) + 0.5) / aa
+    xs = (np.arange(x0, x1)[:, None] + sub).ravel()
+    ys = (np.arange(y0, y1)[:, None] + sub).ravel()
+    px, py = xs[None, None, :], ys[None, :, None]
+
+    # Inside a convex polygon: on the same side of every edge
+    a, b = poly[:, None, None, :], np.roll(poly, -1, axis=0)[:, None, None, :]
+    cross = (b[..., 0] - a[..., 0])*(py - a[..., 1]) - (b[..., 1] - a[..., 1])*(px - a[..., 0])
+    inside = np.all(cross >= 0, axis=0) | np.all(cross <= 0, axis=0)
+    coverage = inside.reshape(y1 - y0, aa, x1 - x0, aa).mean(axis=(1, 3))
+
+    region = canvas[y0:y1, x0:x1]
+    region += (value - region) * coverage
+
+
+class RasterShape(SimStim):
+    """A ShapeStim that can be rasterized into a numpy image"""
+    closeShape = True
+    lineWidth = 1.0
+    lineColor = None
+    fillColor = None
+
+    def rasterize(self, canvas, toPix, scale, aa):
+        """Draw onto canvas; toPix converts (N, 2) positions in degrees to pixel coordinates"""
+        v = np.asarray(self.vertices, dtype=np.float64) + np.asarray(self.pos, dtype=np.float64)
+        pix = toPix(v)
+        if self.fillColor is not None:
+            _fill(canvas, pix, _gray.get(self.fillColor, 0), aa)
+        if self.lineColor is not None:
+            half = self.lineWidth*scale/2.0
+            ends = np.roll(pix, -1, axis=0) if self.closeShape else pix[1:]
+            for p, q in zip(pix, ends):
+                d = q - p
+                length = math.hypot(d[0], d[1])
+                if length == 0:
+                    continue
+                n = np.array((-d[1], d[0])) * half / length
+                _fill(canvas, np.array((p + n, q + n, q - n, p - n)), _gray.get(self.lineColor, 0), aa)
+
+
+class RasterGroup(SimStim):
+    """A BufferImageStim: the stimuli it was made from, rasterized together"""
+    def rasterize(self, canvas, toPix, scale, aa):
+        for stim in self.stim:
+            stim.rasterize(canvas, toPix, scale, aa)
+
+
+class RasterVisual(object):
+    """Replaces the psychopy.visual module; only shapes (and groups of them) are rendered"""
+    ShapeStim = RasterShape
+    BufferImageStim = RasterGroup
+    TextStim = SimStim
+    ImageStim = SimStim
+    Line = SimStim
+
+
+class RasterBackend(SimBackend):
+    visual = RasterVisual
+
+
+class SessionRenderer(object):
+    """Renders the screens of the ANT and replays sessions as frames
+
+    mon -- the monitor spec (distance, width and size in pixels) the session was run on
+    winsize -- the window size in pixels
+    refreshRate -- the refresh rate the session was run at
+    original, runDummy -- as given to ANTExp in the session
+    scale -- scale of the output frames relative to the window (e.g. 0.5 for half the size)
+    aa -- supersampling per pixel axis (1 fills pixels whose center is covered, like OpenGL without
+          multisampling; higher values give antialiased frames)
+    background -- gray level of the window background
+    gap -- gray level of the frames between trials that belong to no trial (what was shown then isn't known)
+    """
+    def __init__(self, mon, winsize, refreshRate, original=True, runDummy=False, scale=1.0, aa=1, background=255,
+                 gap=128):
+        clock = SimClock()
+        win = SimWindow(clock, refreshRate, winsize, mon)
+        with open(os.devnull, 'w') as devnull:
+            exp = ANTExp(mon, win, winsize, refreshRate, clock, 0.0, devnull, runDummy=runDummy,
+                         original=original, backend=RasterBackend(clock))
+            exp.close()
+        self.exp = exp
+        self.frameTime = 1.0 / refreshRate
+        self.original = original
+        self.scale = scale
+        self.aa = aa
+        self.background = background
+        self.size = (int(round(winsize[0]*scale)), int(round(winsize[1]*scale)))
+        self.degToPix = exp.backend.deg2pix(1.0, mon)*scale
+
+        # Every distinct screen, rendered once: blank, fixation, gap, cue screens and target screens
+        fix = [exp.visFix]
+        self.screens = [self._render([]), self._render(fix), np.full(self.size[::-1], gap, dtype=np.uint8)]
+        self.BLANK, self.FIXATION, self.GAP = 0, 1, 2
+        self.cueScreen = np.zeros((len(exp.cueScreens), 2), dtype=np.intp)
+        for w, screens in enumerate(exp.cueScreens):
+            for l, stims in enumerate(screens):
+                self.cueScreen[w, l] = len(self.screens)
+                self.screens.append(self._render(stims))
+        # Target screen by location, direction and congruency code
+        self.targetScreen = np.zeros((2, 2, 3), dtype=np.intp)
+        for t, (tloc, tdir, flank) in enumerate(targets):
+            self.targetScreen[locationCodes[tloc], directionCodes[tdir], congruencyCodes[flank]] = len(self.screens)
+            self.screens.append(self._render([exp.visTarget[t]] + (fix if original else [])))
+
+    def _toPix(self, deg):
+        w, h = self.size
+        return np.column_stack((w/2.0 + deg[:, 0]*self.degToPix, h/2.0 - deg[:, 1]*self.degToPix))
+
+    def _render(self, stims):
+        canvas = np.full(self.size[::-1], float(self.background), dtype=np.float32)
+        for stim in stims:
+            stim.rasterize(canvas, self._toPix, self.scale, self.aa)
+        return np.round(canvas).astype(np.uint8)
+
+    @staticmethod
+    def load(path):
+        """Load the trials of a session from a log file or a session store (.npy)"""
+        if path.endswith('.npy'):
+            from store import SessionStore
+            return np.asarray(SessionStore.load(path))
+        chunks = list(readLog(path))
+        return np.concatenate(chunks) if chunks else np.zeros(0)
+
+    def timeline(self, trials):
+        """Return (frames, screens): the frame number (from the first trial's t0) at which the screen
+        changes, and the index (into self.screens) of the screen shown from then on
+
+        Every trial ends with a change to the GAP screen one frame after its final flip (at tf), which
+        lasts until the next trial starts; within a block that is the same frame, so it isn't shown
+
+        trials -- records with t0, warning, location, direction, congruency, d1, ct, d2 and rt
+                  (as read from a log file or session store)
+        """
+        f = self.frameTime
+        n = len(trials)
+        start = np.round((trials['t0'] - trials['t0'][0]) / f).astype(np.int64)
+        cue = np.round(trials['d1'] / f).astype(np.int64)
+        fixation = np.round((trials['d1'] + trials['ct']) / f).astype(np.int64)
+        target = np.round((trials['d1'] + trials['ct'] + trials['d2']) / f).astype(np.int64)
+        # The screen after the response is flipped at the first retrace strictly after the key (or timeout);
+        # the tolerance covers rt stored as float32, e.g. timeouts that end exactly on a retrace
+        response = target + np.floor(trials['rt'] / f + 1e-3).astype(np.int64) + 1
+        end = np.round(trials['tf'] / f).astype(np.int64) + 1
+
+        frames = np.column_stack((start, start + cue, start + fixation, start + target, start + response, start + end))
+        screens = np.column_stack((
+            np.full(n, self.FIXATION),
+            self.cueScreen[trials['warning'], trials['location']],
+            np.full(n, self.FIXATION),
+            self.targetScreen[trials['location'], trials['direction'], trials['congruency']],
+            np.full(n, self.FIXATION if self.original else self.BLANK),
+            np.full(n, self.GAP)))
+        # Rounding may put a change a frame before the previous one; it then never shows
+        return np.maximum.accumulate(frames.ravel()), screens.ravel()
+
+    def frameScreens(self, trials, end=None):
+        """Return the screen index of every frame, until the end of the last trial (or frame end)"""
+        frames, screens = self.timeline(trials)
+        if end is None:
+            end = int(frames[-1]) if len(trials) else 0
+        lengths = np.diff(np.append(np.minimum(frames, end), end))
+        return np.repeat(screens, lengths)
+
+    def frame(self, trials, n):
+        """Return frame n (a read only view of one of the screens)"""
+        return self.screens[self.frameScreens(trials)[n]]
+
+    def writeRaw(self, stream, trials, start=0, stop=None, chunkBytes=1 << 24):
+        """Write frames start..stop as raw 8 bit gray frames (rows from the top) to a binary stream
+
+        Runs of the same screen are written at most chunkBytes at a time, so long gaps (e.g. breaks
+        between blocks) don't need memory for all their frames
+        """
+        ids = self.frameScreens(trials)[start:stop]
+        if len(ids) == 0:
+            return 0
+        data = [s.tobytes() for s in self.screens]
+        perChunk = max(1, chunkBytes // len(data[0]))
+        change = np.flatnonzero(np.diff(ids)) + 1
+        for first, length in zip(np.append(0, change), np.diff(np.append(np.append(0, change), len(ids)))):
+            frame = data[ids[first]]
+            while length > 0:
+                k = min(length, perChunk)
+                stream.write(frame * k)
+                length -= k
+        return len(ids)
+
+    def writeImages(self, directory, trials, changesOnly=True):
+        """Write frames as PGM images named by frame number; with changesOnly only the frames where
+        the screen changes are written (each is shown until the next one)
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        ids = self.frameScreens(trials)
+        numbers = np.flatnonzero(np.diff(np.append(-1, ids))) if changesOnly else np.arange(len(ids))
+        w, h = self.size
+        header = ('P5\n%d %d\n255\n' % (w, h)).encode('ascii')
+        for n in numbers:
+            with open(os.path.join(directory, 'frame-%07d.pgm' % n), 'wb') as f:
+                f.write(header)
+                f.write(self.screens[ids[n]].tobytes())
+        return len(numbers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render an ANT session (log file or session store) to frames")
+    parser.add_argument('session', help="the session's log file, or its session store (.npy)")
+    parser.add_argument('--size', default='1440x900', help="window size in pixels (default 1440x900)")
+    parser.add_argument('--distance', type=float, default=60, help="viewing distance in cm (default 60)")
+    parser.add_argument('--width', type=float, default=28.5, help="monitor width in cm (default 28.5)")
+    parser.add_argument('--refresh', type=float, default=60, help="refresh rate in Hz (default 60)")
+    parser.add_argument('--scale', type=float, default=1.0, help="output scale (default 1)")
+    parser.add_argument('--aa', type=int, default=1, help="supersampling per pixel axis (default 1)")
+    parser.add_argument('--no-original', dest='original', action='store_false',
+                        help="the session was run with original=False")
+    parser.add_argument('--images', help="write PGM images of the frames where the screen changes to this directory")
+    parser.add_argument('--output', help="write raw gray frames to this file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    size = [int(v) for v in args.size.split('x')]
+    mon = SimMonitor(distance=args.distance, width=args.width, sizePix=size)
+    renderer = SessionRenderer(mon, size, args.refresh, original=args.original, scale=args.scale, aa=args.aa)
+    trials = renderer.load(args.session)
+    if args.images:
+        n = renderer.writeImages(args.images, trials)
+    elif args.output:
+        with open(args.output, 'wb') as f:
+            n = renderer.writeRaw(f, trials)
+    else:
+        stream = getattr(sys.stdout, 'buffer', sys.stdout)
+        n = renderer.writeRaw(stream, trials)
+    sys.stderr.write("%d frames of %dx%d\n" % ((n,) + renderer.size))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
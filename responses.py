@@ -0,0 +1,149 @@
+"""
+Low latency response collection on a dedicated polling thread
+
+A ResponseCollector polls an input source on its own thread and timestamps every key on the
+experiment clock as soon as it is seen, pushing (key, time) onto a deque (appends and pops are
+atomic, so no locks are needed). ANTExp computes the reaction time from that timestamp, so it no
+longer depends on when the main thread gets around to looking. The collector also keeps track of
+how regularly it actually manages to poll.
+
+    responses = ResponseCollector(KeyboardSource(), globalClock)
+    responses.start()
+    exp = ANTExp(mon, win, winsize, refresh, globalClock, startTime, alog, responses=responses)
+    ...
+    responses.stop()
+
+Sources implement poll(), returning a (possibly empty) list of key names pressed since last poll.
+"""
+import threading
+import collections
+import numpy as np
+
+from ant import Bunch
+
+
+class KeyboardSource(object):
+    """Keys from psychopy.hardware.keyboard with its Psychtoolbox backend
+
+    Only that backend may be polled from another thread; the event and iohub fallbacks need window
+    events dispatched on the main thread, which sits waiting while keys are collected. A
+    RuntimeError is raised if Psychtoolbox isn't available.
+    """
+    def __init__(self):
+        from psychopy.hardware import keyboard
+        if not getattr(keyboard, 'havePTB', False):
+            raise RuntimeError("KeyboardSource needs the Psychtoolbox (psychtoolbox package) keyboard backend")
+        self.keyboard = keyboard.Keyboard(backend='ptb')
+        if getattr(self.keyboard, 'backend', 'ptb') != 'ptb':
+            raise RuntimeError("KeyboardSource needs the Psychtoolbox keyboard backend, got %s" % self.keyboard.backend)
+
+    def poll(self):
+        return [k.name for k in self.keyboard.getKeys(waitRelease=False)]
+
+
+class QueueSource(object):
+    """Keys pushed by other code with press(); useful for testing and for other input devices"""
+    def __init__(self):
+        self.keys = collections.deque()
+
+    def press(self, key):
+        self.keys.append(key)
+
+    def poll(self):
+        keys = []
+        while self.keys:
+            keys.append(self.keys.popleft())
+        return keys
+
+
+class ResponseCollector(object):
+    """Polls a source for keys on a background thread, timestamping them on detection
+
+    source -- where keys come from (see KeyboardSource and QueueSource)
+    clock -- the clock to timestamp keys with (the one given to ANTExp); it also times maxWait and the
+             poll intervals, so it must run in real time
+    pollInterval -- time (s) to sleep between polls
+    history -- number of recent poll intervals kept for pollStats
+    """
+    def __init__(self, source, clock, pollInterval=0.0005, history=4096):
+        self.source = source
+        self.clock = clock
+        self.pollInterval = pollInterval
+        self.keys = collections.deque()
+        self.pressed = threading.Event()
+        self.intervals = np.zeros(history)
+        self.nPolls = 0
+        self.running = False
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name='ResponseCollector')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        last = self.clock.getTime()
+        while self.running:
+            keys = self.source.poll()
+            if keys:
+                t = self.clock.getTime()
+                for k in keys:
+                    self.keys.append((k, t))
+                self.pressed.set()
+
+            now = self.clock.getTime()
+            self.intervals[self.nPolls % len(self.intervals)] = now - last
+            self.nPolls += 1
+            last = now
+            self.stopped.wait(self.pollInterval)
+
+    def clearEvents(self, eventType=None):
+        """Discard any keys collected so far"""
+        self.pressed.clear()
+        self.keys.clear()
+
+    def waitKeys(self, maxWait=float('inf'), timeStamped=False):
+        """Wait (at most maxWait seconds) for a key, like psychopy.event.waitKeys
+
+        timeStamped -- False, True (times on the collector's clock) or a clock (anything with getTime)
+                       to give the times on
+
+        The time stamp of a key is the time it was detected, not the time this returns
+        """
+        if not isinstance(timeStamped, bool) and not hasattr(timeStamped, 'getTime'):
+            raise TypeError("timeStamped must be True, False or a clock, not %r" % (timeStamped,))
+
+        deadline = self.clock.getTime() + maxWait
+        while not self.keys:
+            remaining = deadline - self.clock.getTime()
+            if remaining <= 0:
+                return None
+            self.pressed.wait(min(remaining, 1.0))
+            self.pressed.clear()
+
+        key, t = self.keys.popleft()
+        if timeStamped is False:
+            return [key]
+        if timeStamped is not True and timeStamped is not self.clock:
+            # Same moment on the other clock
+            t += timeStamped.getTime() - self.clock.getTime()
+        return [[key, t]]
+
+    def pollStats(self):
+        """Return a Bunch with the number of polls and the mean, 99th percentile and max interval (s)
+        between the recent ones; the interval bounds the delay from key press to time stamp
+        """
+        d = self.intervals[:min(self.nPolls, len(self.intervals))]
+        if len(d) == 0:
+            return Bunch(nPolls=0, mean=0.0, p99=0.0, max=0.0)
+        return Bunch(nPolls=self.nPolls, mean=float(d.mean()), p99=float(np.percentile(d, 99)), max=float(d.max()))
@@ -0,0 +1,193 @@
+"""
+Running per-condition statistics, updated in constant time after every trial
+
+ANTExp keeps a RunningStats with the accuracy and the mean, variance (Welford) and median (a P^2
+streaming quantile estimate, Jain & Chlamtac 1985) of the correct reaction times of every warning
+type x congruency cell, of every warning type, of every congruency and overall. Current estimates,
+including the network scores and their standard errors, can be read at any time without going
+over the trials again, e.g. from a callback subscribed to the experiment:
+
+    def show(res, stats):
+        e = stats.estimates()
+        print("%d trials, executive %0.3f +- %0.3f" % (e.nTrials, e.executive, e.executiveSE))
+
+    exp.subscribe(show)
+"""
+import math
+import numpy as np
+
+from codes import warningCodes, congruencyCodes
+
+
+class Welford(object):
+    """Running mean and variance"""
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else float('nan')
+
+    def sem(self):
+        """Standard error of the mean"""
+        return math.sqrt(self.variance() / self.n) if self.n > 1 else float('nan')
+
+
+class P2Quantile(object):
+    """Streaming estimate of a quantile (default the median) using five markers (the P^2 algorithm)
+
+    Exact for up to five values; after that each value is added in constant time and memory
+    """
+    def __init__(self, p=0.5):
+        self.p = p
+        self.n = 0
+        self.q = []
+        self.pos = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2*p, 1 + 4*p, 3 + 2*p, 5]
+        self.increment = [0, p/2, p, (1 + p)/2, 1]
+
+    def add(self, x):
+        q, pos = self.q, self.pos
+        self.n += 1
+        if self.n <= 5:
+            i = len(q)
+            while i > 0 and q[i - 1] > x:
+                i -= 1
+            q.insert(i, x)
+            return
+
+        # Find the cell x falls in, adjusting the extremes if needed
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            pos[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increment[i]
+
+        # Move the middle markers towards their desired positions
+        for i in (1, 2, 3):
+            d = self.desired[i] - pos[i]
+            if (d >= 1 and pos[i + 1] - pos[i] > 1) or (d <= -1 and pos[i - 1] - pos[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = q[i] + d / float(pos[i + 1] - pos[i - 1]) * (
+                    (pos[i] - pos[i - 1] + d) * (q[i + 1] - q[i]) / float(pos[i + 1] - pos[i]) +
+                    (pos[i + 1] - pos[i] - d) * (q[i] - q[i - 1]) / float(pos[i] - pos[i - 1]))
+                if not q[i - 1] < qp < q[i + 1]:
+                    qp = q[i] + d * (q[i + d] - q[i]) / float(pos[i + d] - pos[i])
+                q[i] = qp
+                pos[i] += d
+
+    def value(self):
+        if self.n == 0:
+            return float('nan')
+        if self.n <= 5:
+            h = self.p * (self.n - 1)
+            lo = int(math.floor(h))
+            hi = min(lo + 1, self.n - 1)
+            return self.q[lo] + (h - lo) * (self.q[hi] - self.q[lo])
+        return self.q[2]
+
+
+class _RT(object):
+    """Mean, variance and median of the correct reaction times of a group of trials"""
+    __slots__ = ('moments', 'median')
+
+    def __init__(self):
+        self.moments = Welford()
+        self.median = P2Quantile(0.5)
+
+    def add(self, rt):
+        self.moments.add(rt)
+        self.median.add(rt)
+
+
+class Estimates(object):
+    """A snapshot of RunningStats; all times are in seconds"""
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+    def __str__(self):
+        return ("%d trials, accuracy %0.3f, median RT %0.3f; alerting %0.3f +- %0.3f, "
+                "orienting %0.3f +- %0.3f, executive %0.3f +- %0.3f" %
+                (self.nTrials, self.accuracy, self.medianRT, self.alerting, self.alertingSE,
+                 self.orienting, self.orientingSE, self.executive, self.executiveSE))
+
+
+class RunningStats(object):
+    """Accuracy and correct reaction time statistics per warning type x congruency, updated per trial"""
+    def __init__(self, nWarnings=len(warningCodes), nCongruencies=len(congruencyCodes)):
+        self.trials = np.zeros((nWarnings, nCongruencies), dtype=np.int64)
+        self.correct = np.zeros((nWarnings, nCongruencies), dtype=np.int64)
+        self.cells = [[_RT() for c in range(nCongruencies)] for w in range(nWarnings)]
+        self.byWarning = [_RT() for w in range(nWarnings)]
+        self.byCongruency = [_RT() for c in range(nCongruencies)]
+        self.overall = _RT()
+
+    def update(self, warning, congruency, rt, correct):
+        """Add a trial; only correct trials count towards the reaction times"""
+        self.trials[warning, congruency] += 1
+        if not correct:
+            return
+        self.correct[warning, congruency] += 1
+        self.cells[warning][congruency].add(rt)
+        self.byWarning[warning].add(rt)
+        self.byCongruency[congruency].add(rt)
+        self.overall.add(rt)
+
+    def _difference(self, groups, a, b):
+        """(mean difference, its standard error, median difference) of two groups"""
+        ga, gb = groups[a].moments, groups[b].moments
+        diff = ga.mean - gb.mean if ga.n and gb.n else float('nan')
+        se = math.sqrt(ga.sem()**2 + gb.sem()**2)
+        return diff, se, groups[a].median.value() - groups[b].median.value()
+
+    def estimates(self):
+        """Return the current Estimates: counts, accuracy, RT means/sds/medians per cell, warning
+        type and congruency, and the (mean based) network scores with standard errors as well as
+        their median based counterparts
+        """
+        nan = float('nan')
+
+        def means(groups):
+            return np.array([g.moments.mean if g.moments.n else nan for g in groups])
+
+        nTrials = int(self.trials.sum())
+        alerting, alertingSE, alertingMedian = self._difference(
+            self.byWarning, warningCodes['no'], warningCodes['double'])
+        orienting, orientingSE, orientingMedian = self._difference(
+            self.byWarning, warningCodes['center'], warningCodes['spatial'])
+        executive, executiveSE, executiveMedian = self._difference(
+            self.byCongruency, congruencyCodes['incongruent'], congruencyCodes['congruent'])
+        return Estimates(nTrials=nTrials,
+                         nCorrect=int(self.correct.sum()),
+                         accuracy=float(self.correct.sum()) / nTrials if nTrials else nan,
+                         meanRT=self.overall.moments.mean if self.overall.moments.n else nan,
+                         medianRT=self.overall.median.value(),
+                         cellTrials=self.trials.copy(),
+                         cellAccuracy=np.where(self.trials > 0, self.correct / np.maximum(self.trials, 1.0), nan),
+                         cellMeanRT=np.array([means(row) for row in self.cells]),
+                         cellSdRT=np.array([[math.sqrt(c.moments.variance()) if c.moments.n > 1 else nan
+                                             for c in row] for row in self.cells]),
+                         cellMedianRT=np.array([[c.median.value() for c in row] for row in self.cells]),
+                         byWarning=means(self.byWarning),
+                         byCongruency=means(self.byCongruency),
+                         medianByWarning=np.array([g.median.value() for g in self.byWarning]),
+                         medianByCongruency=np.array([g.median.value() for g in self.byCongruency]),
+                         alerting=alerting, alertingSE=alertingSE, alertingMedian=alertingMedian,
+                         orienting=orienting, orientingSE=orientingSE, orientingMedian=orientingMedian,
+                         executive=executive, executiveSE=executiveSE, executiveMedian=executiveMedian)
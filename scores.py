@@ -0,0 +1,144 @@
+"""
+Vectorized attention network scores for one or many ANT sessions
+
+Works on the 11 column arrays returned by ANTExp.fullExperiment, computing per participant reaction
+time summaries, accuracy and the three network scores (Fan et al, 2002) in one pass over all rows:
+
+    alerting  = RT(no cue) - RT(double cue)
+    orienting = RT(center cue) - RT(spatial cue)
+    executive = RT(incongruent) - RT(congruent)
+
+There are no Python loops over trials or participants, so it scales linearly to millions of rows.
+"""
+import numpy as np
+
+from codes import warningCodes, congruencyCodes
+
+# Columns of the fullExperiment result array
+T0, INDEX, WARNING, CONGRUENCY, D1, CT, D2, RT, TF, CORRECT, COMPLETED = range(11)
+
+scoreDtype = np.dtype([
+    ('participant', np.int64),
+    ('nTrials', np.int64),          # completed trials
+    ('accuracy', np.float64),       # fraction of completed trials answered correctly
+    ('meanRT', np.float64),
+    ('medianRT', np.float64),
+    ('rtNo', np.float64),
+    ('rtCenter', np.float64),
+    ('rtDouble', np.float64),
+    ('rtSpatial', np.float64),
+    ('rtCongruent', np.float64),
+    ('rtIncongruent', np.float64),
+    ('rtNeutral', np.float64),
+    ('alerting', np.float64),
+    ('orienting', np.float64),
+    ('executive', np.float64),
+])
+
+
+def _flatten(data, participant):
+    """Return (rows, ids) where rows is an (N, 11) array and ids the participant of each row"""
+    if isinstance(data, (list, tuple)):
+        rows = np.concatenate([np.asarray(b, dtype=np.float64).reshape(-1, 11) for b in data])
+        if participant is None:
+            ids = np.zeros(len(rows), dtype=np.int64)
+        else:
+            ids = np.repeat(np.asarray(participant, dtype=np.int64), [len(b) for b in data])
+        return rows, ids
+
+    data = np.asarray(data, dtype=np.float64)
+    if data.ndim == 3:
+        nP, nT = data.shape[:2]
+        ids = np.repeat(np.arange(nP, dtype=np.int64) if participant is None
+                        else np.asarray(participant, dtype=np.int64), nT)
+        return data.reshape(nP*nT, 11), ids
+    if data.ndim == 2:
+        if participant is None:
+            ids = np.zeros(len(data), dtype=np.int64)
+        else:
+            ids = np.asarray(participant, dtype=np.int64)
+        return data, ids
+    raise ValueError("Expected an (N, 11) or (participants, trials, 11) array, got shape %s" % (data.shape,))
+
+
+def groupMedian(groups, values, nGroups):
+    """Median of values for each group in 0..nGroups-1 (NaN for empty groups), using a single sort"""
+    order = np.lexsort((values, groups))
+    v = values[order]
+    counts = np.bincount(groups, minlength=nGroups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    med = np.full(nGroups, np.nan)
+    has = counts > 0
+    lo = starts[has] + (counts[has] - 1)//2
+    hi = starts[has] + counts[has]//2
+    med[has] = 0.5*(v[lo] + v[hi])
+    return med
+
+
+def groupMean(groups, values, nGroups):
+    """Mean of values for each group in 0..nGroups-1 (NaN for empty groups)"""
+    counts = np.bincount(groups, minlength=nGroups)
+    sums = np.bincount(groups, weights=values, minlength=nGroups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
+def networkScores(data, participant=None, statistic='median', correctOnly=True):
+    """Compute per participant accuracy, RT summaries and network scores
+
+    data -- either a stacked (participants, trials, 11) array (rows with COMPLETED==0 are ignored, so
+            it may be zero padded), an (N, 11) array of rows, or a list of block arrays as returned by
+            fullExperiment
+    participant -- participant ids; one per participant for a 3D array, one per row for a 2D array, or
+                   one per block for a list of blocks. If not given, a 3D array uses 0..P-1 and
+                   everything else is taken to be a single participant (id 0)
+    statistic -- 'median' (as in the original ANT analysis) or 'mean' for the per condition RTs
+    correctOnly -- only use correctly answered trials for the RT summaries
+
+    Returns a structured array (see scoreDtype) with one row per participant in sorted id order
+    """
+    if statistic == 'median':
+        summary = groupMedian
+    elif statistic == 'mean':
+        summary = groupMean
+    else:
+        raise ValueError("Unknown statistic '%s'; use 'median' or 'mean'" % statistic)
+
+    rows, ids = _flatten(data, participant)
+    done = rows[:, COMPLETED] == 1
+    rows = rows[done]
+    pids, p = np.unique(ids[done], return_inverse=True)
+    nP = len(pids)
+
+    out = np.zeros(nP, dtype=scoreDtype)
+    out['participant'] = pids
+    out['nTrials'] = np.bincount(p, minlength=nP)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out['accuracy'] = np.bincount(p, weights=rows[:, CORRECT], minlength=nP) / out['nTrials']
+
+    use = rows[:, CORRECT] == 1 if correctOnly else np.ones(len(rows), dtype=bool)
+    rt = rows[use, RT]
+    p = p[use]
+    out['meanRT'] = groupMean(p, rt, nP)
+    out['medianRT'] = groupMedian(p, rt, nP)
+
+    # One combined sort/bincount per factor, with the condition folded into the group key
+    warning = rows[use, WARNING].astype(np.int64)
+    nW, nC = len(warningCodes), len(congruencyCodes)
+    byWarning = summary(p*nW + warning, rt, nP*nW).reshape(nP, nW)
+    congruency = rows[use, CONGRUENCY].astype(np.int64)
+    byCongruency = summary(p*nC + congruency, rt, nP*nC).reshape(nP, nC)
+
+    out['rtNo'] = byWarning[:, warningCodes['no']]
+    out['rtCenter'] = byWarning[:, warningCodes['center']]
+    out['rtDouble'] = byWarning[:, warningCodes['double']]
+    out['rtSpatial'] = byWarning[:, warningCodes['spatial']]
+    out['rtCongruent'] = byCongruency[:, congruencyCodes['congruent']]
+    out['rtIncongruent'] = byCongruency[:, congruencyCodes['incongruent']]
+    out['rtNeutral'] = byCongruency[:, congruencyCodes['neutral']]
+
+    out['alerting'] = out['rtNo'] - out['rtDouble']
+    out['orienting'] = out['rtCenter'] - out['rtSpatial']
+    out['executive'] = out['rtIncongruent'] - out['rtCongruent']
+
+    return out
@@ -0,0 +1,163 @@
+"""
+Headless, virtual-time backend for running the ANT without a display
+
+Instead of sleeping, waiting advances a virtual clock and every flip moves the clock to the next
+simulated retrace, so a complete session runs in a fraction of a second using the same ANTExp code
+(and producing the same log output) as a real session. Use it like this:
+
+    from ant import ANTExp
+    from simdisplay import SimMonitor, SimWindow, SimClock, SimBackend
+
+    mon = SimMonitor(distance=60, width=28.5, sizePix=(1440, 900))
+    clock = SimClock()
+    win = SimWindow(clock, refreshRate=60, size=(1440, 900), monitor=mon)
+    exp = ANTExp(mon, win, win.size, 60, clock, 0.0, backend=SimBackend(clock))
+
+    block = exp.fullExperiment()
+"""
+import math
+import numpy as np
+
+
+def perfectResponder(condition):
+    """A participant always responding correctly after 450ms; returns (key, rt) or None for no response"""
+    return (condition.tdir, 0.450)
+
+
+class SimClock(object):
+    """A virtual clock, mimicking psychopy.core.Clock, that only moves when advanced"""
+    def __init__(self):
+        self.t = 0.0
+
+    def getTime(self):
+        return self.t
+
+    def reset(self, newT=0.0):
+        self.t = newT
+
+    def advance(self, dt):
+        """Move the clock forward dt seconds (negative values are ignored, like core.wait does)"""
+        if dt > 0:
+            self.t += dt
+
+
+class SimMonitor(object):
+    """The parts of a psychopy.monitors.Monitor needed for unit conversion"""
+    def __init__(self, name='simMonitor', distance=60, width=28.5, sizePix=(1440, 900)):
+        self.name = name
+        self.distance = distance
+        self.width = width
+        self.sizePix = list(sizePix)
+
+    def getDistance(self):
+        return self.distance
+
+    def getWidth(self):
+        return self.width
+
+    def getSizePix(self):
+        return self.sizePix
+
+
+class SimWindow(object):
+    """A window that keeps count of frames instead of showing them
+
+    Each flip advances the clock to the next retrace (a multiple of the frame time) and increments
+    frameN. The number of draw calls issued before each flip is available in lastDraws.
+    """
+    def __init__(self, clock, refreshRate=60, size=(1440, 900), monitor=None, units='deg'):
+        self.clock = clock
+        self.refreshRate = refreshRate
+        self.frameTime = 1.0 / refreshRate
+        self.size = list(size)
+        self.monitor = monitor
+        self.units = units
+        self.frameN = 0
+        self.nDraws = 0
+        self.lastDraws = 0
+
+    def flip(self, clearBuffer=True):
+        # Next retrace strictly after now; the tolerance avoids skipping a frame on float rounding
+        frame = int(math.floor(self.clock.getTime() / self.frameTime + 1e-6)) + 1
+        self.clock.reset(frame * self.frameTime)
+        self.frameN += 1
+        self.lastDraws = self.nDraws
+        if clearBuffer:
+            self.nDraws = 0
+
+    def close(self):
+        pass
+
+
+class SimStim(object):
+    """A stand-in for every PsychoPy stimulus; drawing it only counts a draw call on the window"""
+    def __init__(self, win, **kwds):
+        self.win = win
+        self.pos = (0, 0)
+        self.__dict__.update(kwds)
+
+    def draw(self, win=None):
+        (win or self.win).nDraws += 1
+
+
+class SimVisual(object):
+    """Replaces the psychopy.visual module for the stimuli used by ANTExp"""
+    ShapeStim = SimStim
+    BufferImageStim = SimStim
+    TextStim = SimStim
+    ImageStim = SimStim
+    Line = SimStim
+
+
+class SimBackend(object):
+    """A backend for ANTExp running in virtual time with a simulated participant
+
+    clock -- the SimClock also given to the SimWindow and ANTExp
+    responder -- called as responder(condition) at each target; returns (key, rt) or None to time out
+    textKey -- the key "pressed" whenever text is displayed and a key is awaited
+    """
+    visual = SimVisual
+
+    def __init__(self, clock, responder=perfectResponder, textKey='space'):
+        self.clock = clock
+        self.responder = responder
+        self.textKey = textKey
+        self.condition = None
+
+    def startTrial(self, condition):
+        self.condition = condition
+
+    def wait(self, secs, hogCPUperiod=0.2):
+        self.clock.advance(secs)
+
+    def waitKeys(self, maxWait=float('inf'), timeStamped=False):
+        if self.condition is None:
+            response = (self.textKey, 0.0)
+        else:
+            response = self.responder(self.condition)
+            self.condition = None
+
+        if response is None or response[1] >= maxWait:
+            self.clock.advance(maxWait)
+            return None
+
+        key, rt = response
+        self.clock.advance(rt)
+        if timeStamped:
+            return [[key, self.clock.getTime()]]
+        return [key]
+
+    def clearEvents(self, eventType=None):
+        pass
+
+    def bufferImage(self, stim):
+        # Nothing is rendered; a single white pixel stands in for the captured image
+        return np.full((1, 1, 4), 255, dtype=np.uint8)
+
+    def imageStim(self, win, image, pos):
+        return SimStim(win, image=image, pos=pos)
+
+    def deg2pix(self, degrees, mon):
+        # As psychopy.tools.monitorunittools.deg2pix (without flat screen correction)
+        cm = degrees * mon.getDistance() * 0.017455
+        return cm * mon.getSizePix()[0] / float(mon.getWidth())
@@ -0,0 +1,101 @@
+"""
+Persistent on-disk cache of the rendered ANT target stimuli
+
+Building the 12 targets means creating and rasterizing up to ten ShapeStims each, which is slow on
+low end machines. The rendered images are stored (cropped to the arrows) in a file named by a hash
+of everything that affects their appearance, so later launches load them directly, and any change
+of monitor geometry or stimulus parameters automatically leads to a new rendering.
+
+    exp = ANTExp(mon, win, winsize, refresh, globalClock, startTime, alog, stimCache=StimCache())
+"""
+import os
+import json
+import hashlib
+import numpy as np
+
+# Increase when the way stimuli are drawn changes, to invalidate existing caches
+cacheVersion = 1
+
+
+def crop(image):
+    """Crop an RGB(A) image (rows from the top) to the pixels differing from its corner pixel
+
+    Returns (cropped image, (x, y)) where (x, y) is the center of the crop in pixels relative to the
+    image center (y upwards), as used for the pos of a stimulus in 'pix' units
+    """
+    image = np.asarray(image)
+    differs = np.any(image != image[0, 0], axis=-1)
+    rows = np.flatnonzero(differs.any(axis=1))
+    cols = np.flatnonzero(differs.any(axis=0))
+    if len(rows) == 0:
+        rows = cols = np.array([0])
+    y0, y1 = rows[0], rows[-1] + 1
+    x0, x1 = cols[0], cols[-1] + 1
+    h, w = image.shape[:2]
+    return image[y0:y1, x0:x1].copy(), ((x0 + x1 - w)/2.0, (h - y0 - y1)/2.0)
+
+
+class StimCache(object):
+    """Stores and loads rendered target images, keyed by their parameters
+
+    cacheDir -- where to keep the cache files (default ~/.ant/stimuli)
+    """
+    def __init__(self, cacheDir=None):
+        self.cacheDir = cacheDir if cacheDir else os.path.join(os.path.expanduser('~'), '.ant', 'stimuli')
+
+    @staticmethod
+    def params(exp):
+        """Everything about an ANTExp that affects the rendered targets"""
+        mon = exp.mon
+        return {'version': cacheVersion,
+                'distance': float(mon.getDistance()),
+                'width': float(mon.getWidth()),
+                'sizePix': [int(p) for p in mon.getSizePix()],
+                'winsize': [int(p) for p in exp.winsize],
+                'arrowSize': exp.arrowSize,
+                'arrowSep': exp.arrowSep,
+                'allWidthDeg': exp.allWidthDeg,
+                'targetDist': exp.targetDist,
+                'runDummy': bool(exp.runDummy),
+                'fixation': [exp.cueSize, exp.allWidthDeg] if exp.precompose and exp.original else None}
+
+    def path(self, params):
+        key = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cacheDir, 'targets-%s.npz' % key)
+
+    def load(self, params):
+        """Return a dict of name -> (image, pos) for the given parameters, or None if not cached"""
+        path = self.path(params)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as f:
+                if json.loads(str(f['params'])) != params:
+                    return None
+                names = [str(n) for n in f['names']]
+                return dict((n, (f['image_' + n], tuple(f['pos_' + n]))) for n in names)
+        except Exception:
+            # A damaged cache file is simply rendered and written again
+            return None
+
+    def save(self, params, textures):
+        """Store a dict of name -> (image, pos) for the given parameters"""
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir)
+        path = self.path(params)
+        arrays = {'params': np.array(json.dumps(params, sort_keys=True)),
+                  'names': np.array(sorted(textures))}
+        for n, (image, pos) in textures.items():
+            arrays['image_' + n] = image
+            arrays['pos_' + n] = np.asarray(pos, dtype=np.float64)
+
+        # Write to a temporary file first, so a crash never leaves a half written cache behind
+        tmp = path + '.%d.tmp' % os.getpid()
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        try:
+            os.replace(tmp, path)
+        except AttributeError:
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(tmp, path)
@@ -0,0 +1,117 @@
+"""
+Binary, preallocated session store backed by a memory mapped .npy file
+
+The whole session is allocated up front, and every trial is written in place as soon as it is done,
+so nothing is reallocated or formatted during the experiment and the data written so far survives
+a crash. Files are ordinary .npy files and can be reopened zero-copy for analysis:
+
+    store = SessionStore('p01.npy', nTrials=6*48)
+    exp = ANTExp(mon, win, winsize, refresh, globalClock, startTime, alog, store=store)
+    ...
+    store.close()
+
+    data = SessionStore.load('p01.npy')            # read-only memory map of all written trials
+    allData = SessionStore('p01.npy', mode='r').results()   # as fullExperiment's 11 column arrays
+"""
+import numpy as np
+
+from codes import responseCodes
+
+trialDtype = np.dtype([
+    ('wallt', np.float64),          # wall time (epoch) of t0
+    ('t0', np.float64),             # trial start on the experiment clock
+    ('d1', np.float32),             # fixation time before the cue
+    ('ct', np.float32),             # cue time
+    ('d2', np.float32),             # cue to target time
+    ('rt', np.float32),             # response time
+    ('tf', np.float32),             # total trial time
+    ('block', np.int16),            # fullExperiment call number (0 based)
+    ('index', np.int16),            # index of the procedure
+    ('warning', np.int8),           # 0-3: none, center, double, spatial
+    ('congruency', np.int8),        # 0-2: congruent, incongruent, neutral
+    ('location', np.int8),          # 0: top, 1: bottom
+    ('direction', np.int8),         # 0: left, 1: right
+    ('response', np.int8),          # 1: correct, 0: incorrect, -1: no response
+    ('completed', np.int8),         # 1 once the row has been written
+])
+
+
+class SessionStore(object):
+    """A preallocated, memory mapped array of trialDtype records for one session
+
+    path -- the .npy file to use
+    nTrials -- number of trials to allocate room for (only used when creating a new file)
+    mode -- 'w+' creates a new file, 'r+' continues writing an existing file (after the last
+            completed trial), and 'r' opens it read only
+    """
+    def __init__(self, path, nTrials=6*48, mode='w+'):
+        self.path = path
+        self.mode = mode
+        if mode == 'w+':
+            self.data = np.lib.format.open_memmap(path, mode='w+', dtype=trialDtype, shape=(nTrials,))
+            self.n = 0
+        elif mode in ('r+', 'r'):
+            self.data = np.load(path, mmap_mode=mode)
+            if self.data.dtype != trialDtype:
+                raise ValueError("%s does not contain ANT trial records" % path)
+            self.n = int(np.count_nonzero(self.data['completed']))
+        else:
+            raise ValueError("Unknown mode '%s'; use 'w+', 'r+' or 'r'" % mode)
+
+    @staticmethod
+    def load(path):
+        """Return a read-only, zero-copy view of the completed trials in a store file"""
+        data = np.load(path, mmap_mode='r')
+        return data[:int(np.count_nonzero(data['completed']))]
+
+    def append(self, block, index, warning, congruency, res):
+        """Write a trial (a result from ANTExp._oneProcedure) in place as the next record"""
+        if self.n >= len(self.data):
+            raise IndexError("Session store %s is full (%d trials)" % (self.path, len(self.data)))
+        r = self.data[self.n]
+        r['wallt'] = res.wt
+        r['t0'] = res.t0
+        r['d1'] = res.d1
+        r['ct'] = res.ct
+        r['d2'] = res.d2
+        r['rt'] = res.rt
+        r['tf'] = res.tf
+        r['block'] = block
+        r['index'] = index
+        r['warning'] = warning
+        r['congruency'] = congruency
+        r['location'] = res.condition.location
+        r['direction'] = res.condition.direction
+        r['response'] = responseCodes[res.resp]
+        r['completed'] = 1
+        self.n += 1
+
+    def trials(self):
+        """Return a view of the completed trials"""
+        return self.data[:self.n]
+
+    def results(self):
+        """Return the completed trials as one array in the 11 column layout of fullExperiment"""
+        d = self.trials()
+        out = np.empty((len(d), 11))
+        out[:, 0] = d['t0']
+        out[:, 1] = d['index']
+        out[:, 2] = d['warning']
+        out[:, 3] = d['congruency']
+        out[:, 4] = d['d1']
+        out[:, 5] = d['ct']
+        out[:, 6] = d['d2']
+        out[:, 7] = d['rt']
+        out[:, 8] = d['tf']
+        out[:, 9] = d['response'] == 1
+        out[:, 10] = 1
+        return out
+
+    def flush(self):
+        """Make sure everything written so far is on disk"""
+        if self.mode != 'r':
+            self.data.flush()
+
+    def close(self):
+        self.flush()
+        self.data = None
@@ -4,11 +4,14 @@ Example of how to use the ANT module
 import sys
 
 from psychopy import visual, core, event, monitors, tools
-import pyglet
 import time
 import numpy as np
 import random as random
 from ant import ANTExp
+from store import SessionStore
+from stimcache import StimCache
+from clocksync import ClockSync
+from calibration import RefreshCalibration, displayKey
 import threading
 
 ################################
@@ -24,13 +27,17 @@ mon.setSizePix(winsize)
 
 win = visual.Window(winsize, waitBlanking=True, winType='pyglet', fullscr=True, 
         color='white', units='deg', monitor=mon)
-pw = visual.TextStim(win, alignHoriz='center', wrapWidth=12, height=0.01, color='black', 
-        text="Please wait (checking screen timing)...")
-pw.autoDraw = True
-pw.draw()
-win.flip()
-refresh = win.getActualFrameRate(nIdentical=50, nMaxFrames=900, nWarmUpFrames=100, threshold=1)
-pw.autoDraw = False
+
+# Reuse the refresh rate measured last time on this display (it is checked during the instructions);
+# only measure it now if it isn't known
+calib = RefreshCalibration(win, displayKey(mon, win))
+refresh = calib.refreshRate
+if refresh is None:
+    pw = visual.TextStim(win, alignHoriz='center', wrapWidth=12, height=0.01, color='black', 
+            text="Please wait (checking screen timing)...")
+    pw.autoDraw = True
+    refresh = calib.calibrate()
+    pw.autoDraw = False
 
 halted = False
 
@@ -43,12 +50,17 @@ if now > 0.001:
 else:
     print("Internal initial timing offset is not to worry about (only %0.6f s)" % now)
 
+# Keep track of how the experiment clock drifts against wall time during the session
+sync = ClockSync(globalClock.getTime, {'wall': time.time}, interval=5.0)
+sync.start()
+
 endExperiment = False
-exp = ANTExp(mon, win, winsize, refresh, globalClock, startTime)
+store = SessionStore(time.strftime("ant-%Y%m%d-%H%M%S.npy"), nTrials=6*48)
+exp = ANTExp(mon, win, winsize, refresh, globalClock, startTime, store=store, stimCache=StimCache(),
+        lazyTargets=True, precompose=True, clockSync=sync, calibration=calib)
 
 noPractice = exp.displayInstructions()
 
-allData = None
 if noPractice:
     sys.stderr.write("Skipped practice block on user's request\n")
 else:
@@ -63,19 +75,24 @@ for r in range(6):
         core.wait(1)
     block = exp.fullExperiment()
 
-    if block == None:
+    if block is None:
         break
-    if allData == None:
-        allData = block
-    else:
-        allData = np.concatenate((allData, block))
+
+# All completed trials have been written to the store as they finished
+allData = store.results()
+store.close()
+exp.close()
 
 # do something with allData here!
 
-endTime = time.time()
-now = globalClock.getTime()
-print("Real time was %0.3f and global clock counted %0.3f (compare %0.6f to initial timing offset to determine drift)" % 
-        (endTime-startTime, now, now - (endTime-startTime)))
+if calib.recalibrated:
+    print("Refresh rate recalibrated: %0.3f Hz (the quick check measured %s Hz)" % (exp.refreshRate, calib.checkedRate))
+
+sync.stop()
+drift = sync.diagnostics()['wall']
+print("Over %0.1f s the global clock drifted %0.2f ppm against wall time (a single offset would be off by %0.6f s "
+      "at the end; residuals around the drift model %0.6f s sd)" %
+        (drift['span'], drift['drift'], drift['offsetError'], drift['residualSd']))
 
 win.close()
 core.quit()
@@ -0,0 +1,37 @@
+"""
+Shared fixtures: the modules live in the repository root, and most tests run ANTExp headless on a
+simdisplay backend in virtual time
+"""
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ant import ANTExp
+from simdisplay import SimMonitor, SimClock, SimWindow, SimBackend
+
+
+@pytest.fixture
+def simExp():
+    """Factory for an ANTExp on a SimWindow at 60Hz; keyword arguments go to ANTExp, except responder
+    (given to the SimBackend). Experiments are closed after the test
+    """
+    made = []
+
+    def make(responder=None, refreshRate=60, **kwds):
+        mon = SimMonitor()
+        clock = SimClock()
+        win = SimWindow(clock, refreshRate, monitor=mon)
+        if 'backend' not in kwds:
+            kwds['backend'] = SimBackend(clock, responder=responder) if responder else SimBackend(clock)
+        exp = ANTExp(mon, win, win.size, refreshRate, clock, 0.0, io.StringIO(), **kwds)
+        exp.log.console = io.StringIO()
+        made.append(exp)
+        return exp
+
+    yield make
+    for exp in made:
+        exp.close()
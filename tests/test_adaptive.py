@@ -0,0 +1,78 @@
+import numpy as np
+
+from adaptive import AdaptiveScheduler
+from ant import allProcedures
+from design import factorLevels, runLengths
+from participant import Population
+from scores import networkScores
+
+
+def _feed(scheduler, participant):
+    """Run a scheduler without ANTExp; returns the procedure indices in the order run"""
+    order = []
+    while not scheduler.done():
+        i = scheduler.next()
+        response = participant(scheduler.procedures[i])
+        correct = response is not None and response[0] == scheduler.procedures[i].tdir
+        scheduler.update(i, response[1] if response else 1.7, correct)
+        order.append(i)
+    return order
+
+
+def test_rounds_stay_balanced():
+    procedures = allProcedures()
+    scheduler = AdaptiveScheduler(procedures, precision=1e-6, maxTrials=3*48 + 10, rng=np.random.RandomState(0))
+    order = _feed(scheduler, Population().participant(np.random.RandomState(1)))
+    assert len(order) == 3*48 + 10
+    for r in range(3):
+        assert sorted(order[48*r:48*(r + 1)]) == list(range(48))
+    assert len(set(order[3*48:])) == 10
+    assert scheduler.runs.max() - scheduler.runs.min() == 1
+
+
+def test_stops_at_precision():
+    procedures = allProcedures()
+    scheduler = AdaptiveScheduler(procedures, precision=0.015, maxTrials=20*48, rng=np.random.RandomState(2))
+    order = _feed(scheduler, Population(sdMu=0, tau=0.05).participant(np.random.RandomState(3)))
+    e = scheduler.estimates()
+    assert 48 <= len(order) < 20*48 and len(order) % 48 == 0
+    assert max(e.alertingSE, e.orientingSE, e.executiveSE) <= 0.015
+    assert e.nTrials == len(order)
+
+
+def test_never_stops_before_min_trials():
+    scheduler = AdaptiveScheduler(allProcedures(), precision=1.0, minTrials=60, rng=np.random.RandomState(4))
+    assert len(_feed(scheduler, Population().participant(np.random.RandomState(5)))) == 2*48   # end of that round
+
+
+def test_stops_only_at_the_end_of_a_round():
+    procedures = allProcedures()
+    warning = np.array([p.warning for p in procedures])
+    for seed in range(20):
+        scheduler = AdaptiveScheduler(procedures, precision=0.03, maxTrials=20*48, rng=np.random.RandomState(seed))
+        order = _feed(scheduler, Population().participant(np.random.RandomState(100 + seed)))
+        assert len(order) % 48 == 0
+        assert len(set(np.bincount(warning[order]))) == 1
+
+
+def test_rounds_are_shuffled():
+    procedures = allProcedures()
+    scheduler = AdaptiveScheduler(procedures, precision=0.012, maxTrials=10*48, rng=np.random.RandomState(8))
+    order = np.array(_feed(scheduler, Population().participant(np.random.RandomState(9))))
+    rounds = order.reshape(-1, 48)
+    assert len(rounds) > 2
+    assert len(set(map(tuple, rounds))) == len(rounds)
+    assert runLengths(rounds, factorLevels()['flank']).max() < 8
+
+
+def test_adaptive_experiment(simExp):
+    participant = Population().participant(np.random.RandomState(6))
+    exp = simExp(responder=participant)
+    scheduler = AdaptiveScheduler(exp.procedures, precision=0.02, maxTrials=6*48, rng=np.random.RandomState(7))
+    data = exp.adaptiveExperiment(scheduler)
+    assert len(data) == scheduler.nTrials
+    assert np.all(np.diff(data[:, 0]) > 0)      # in the order run
+    e = scheduler.estimates()
+    s = networkScores(data, statistic='mean')
+    assert np.isclose(e.executive, s['executive'][0])
+    assert np.isclose(e.alerting, s['alerting'][0])
@@ -0,0 +1,74 @@
+import gc
+import io
+import threading
+import weakref
+
+import asynclog
+from asynclog import AsyncLogWriter
+
+
+def test_records_written_in_order():
+    out, console = io.StringIO(), io.StringIO()
+    log = AsyncLogWriter(out, console, batchSize=7)
+    for i in range(200):
+        log.text("line %d" % i)
+        log.message("msg %d of %s", i, 'x')
+    log.flush()
+    assert out.getvalue().splitlines() == ["line %d" % i for i in range(200)]
+    assert console.getvalue().splitlines() == ["msg %d of x" % i for i in range(200)]
+    log.close()
+
+
+def test_shared_stream_keeps_order():
+    out = io.StringIO()
+    log = AsyncLogWriter(out, out)
+    log.text("a")
+    log.message("%s", "b")
+    log.text("c")
+    log.close()
+    assert out.getvalue() == "a\nb\nc\n"
+
+
+def test_records_after_close_are_written():
+    out = io.StringIO()
+    log = AsyncLogWriter(out, io.StringIO(), maxQueue=1)
+    log.text("before")
+    log.close()
+    assert not log.thread.is_alive()
+    done = []
+    t = threading.Thread(target=lambda: (log.text("after"), done.append(True)))
+    t.start()
+    t.join(5)
+    assert done                                 # doesn't block on the (full, undrained) queue
+    log.flush()
+    log.close()                                 # closing twice is harmless
+    assert out.getvalue() == "before\nafter\n"
+
+
+def test_closed_writers_are_released():
+    log = AsyncLogWriter(io.StringIO(), io.StringIO())
+    assert log in asynclog._open
+    log.close()
+    assert log not in asynclog._open
+    ref = weakref.ref(log)
+    del log
+    gc.collect()
+    assert ref() is None
+
+
+def test_write_errors_do_not_stop_the_writer(capsys):
+    class Broken(object):
+        def write(self, s):
+            raise IOError("disk full")
+
+        def flush(self):
+            pass
+
+    out = io.StringIO()
+    log = AsyncLogWriter(Broken(), out)
+    log.text("lost")
+    log.flush()
+    log.message("kept")
+    log.close()
+    assert out.getvalue() == "kept\n"
+    assert "disk full" in capsys.readouterr().err
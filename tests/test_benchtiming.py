@@ -0,0 +1,63 @@
+import json
+import threading
+
+import numpy as np
+
+import benchtiming
+from benchtiming import WallClock, VsyncWindow, Load, runScenario, regressions, intervals, _stats
+
+
+def test_vsync_window_blocks_until_the_retrace():
+    clock = WallClock()
+    win = VsyncWindow(clock, 100)
+    for i in range(3):
+        win.flip()
+    t = clock.getTime()
+    assert t >= 0.03 - 1e-4
+    assert win.frameN == 3
+
+
+def test_stats_are_in_ms():
+    s = _stats([0.001, -0.002, 0.003])
+    assert np.isclose(s['mean'], 2/3.0)
+    assert np.isclose(s['max'], 3.0)
+
+
+def test_load_starts_and_stops():
+    before = threading.active_count()
+    load = Load(('gil', 'gc', 'io'))
+    load.start()
+    assert len(load.workers) == 3
+    load.stop()
+    assert load.workers == [] and threading.active_count() == before
+
+
+def test_run_scenario_reports_every_interval():
+    result = runScenario((), nTrials=3, scale=0.05)
+    assert result['flips']['nFlips'] == 3*4
+    for name in intervals:
+        assert set(result[name]) == {'planned', 'nominal'}
+
+
+def _results(p99):
+    return {'scenarios': {'none': dict((k, {'planned': {'p99': p99[k]}}) for k in intervals)}}
+
+
+def test_regressions():
+    baseline = _results({'d1': 1.0, 'ct': 1.0, 'd2': 10.0, 'tf': 1.0})
+    now = _results({'d1': 1.4, 'ct': 2.0, 'd2': 12.6, 'tf': 0.5})
+    assert regressions(now, baseline) == [('none', 'ct', 2.0, 1.0), ('none', 'd2', 12.6, 10.0)]
+    assert regressions(now, {'scenarios': {}}) == []
+
+
+def test_main_flags_regressions(tmp_path, monkeypatch, capsys):
+    fast = dict((k, {'planned': {'p99': 0.1}}) for k in intervals)
+    slow = dict((k, {'planned': {'p99': 5.0}}) for k in intervals)
+    monkeypatch.setattr(benchtiming, 'measure', lambda names, *args: {'config': {}, 'scenarios': {'none': slow}})
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(u"%s" % json.dumps({'scenarios': {'none': fast}}))
+    assert benchtiming.main(['--scenarios', 'none', '--baseline', str(baseline)]) == 1
+    out = capsys.readouterr()
+    assert json.loads(out.out)['scenarios']['none'] == slow
+    assert out.err.count("REGRESSION") == 4
+    assert benchtiming.main(['--scenarios', 'none']) == 0
@@ -0,0 +1,106 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from ant import ANTExp
+from calibration import CalibrationCache, RefreshCalibration, displayKey, estimateRate, intervalSummary
+from simdisplay import SimBackend, SimClock, SimMonitor, SimWindow
+
+
+def test_estimate_rate():
+    iv = np.full(100, 1/60.0)
+    iv[::10] = 2/60.0                           # dropped frames don't count
+    assert np.isclose(estimateRate(iv), 60.0)
+    assert estimateRate(np.random.RandomState(0).random_sample(100)*0.05) is None
+    assert estimateRate([]) is None
+    s = intervalSummary(iv)
+    assert s['nFrames'] == 100 and np.isclose(s['dropped'], 0.1) and np.isclose(s['p50'], 1/60.0)
+
+
+def test_cache_round_trip(tmp_path):
+    cache = CalibrationCache(str(tmp_path / 'calibration.json'))
+    assert cache.get('a') is None
+    cache.put('a', {'refreshRate': 60.0})
+    cache.put('b', {'refreshRate': 144.0})
+    assert cache.get('a') == {'refreshRate': 60.0}
+    assert sorted(json.loads((tmp_path / 'calibration.json').read_text())) == ['a', 'b']
+    (tmp_path / 'calibration.json').write_text(u'{broken')
+    assert cache.get('a') is None
+
+
+def _window(rate):
+    clock = SimClock()
+    mon = SimMonitor()
+    return mon, clock, SimWindow(clock, rate, monitor=mon)
+
+
+def test_first_launch_calibrates(tmp_path):
+    mon, clock, win = _window(144)
+    cache = CalibrationCache(str(tmp_path / 'calibration.json'))
+    calib = RefreshCalibration(win, displayKey(mon, win), cache, clock=clock.getTime)
+    assert calib.refreshRate is None and not calib.pending
+    assert np.isclose(calib.calibrate(), 144.0)
+    assert win.frameN == 30 + 600 + 1
+    record = cache.get(displayKey(mon, win))
+    assert np.isclose(record['refreshRate'], 144.0) and record['stable']
+
+
+def test_cached_rate_is_verified(tmp_path):
+    mon, clock, win = _window(60)
+    cache = CalibrationCache(str(tmp_path / 'calibration.json'))
+    cache.put(displayKey(mon, win), {'refreshRate': 60.0})
+    calib = RefreshCalibration(win, displayKey(mon, win), cache, clock=clock.getTime)
+    assert calib.refreshRate == 60.0 and calib.pending
+    drawn = []
+    assert calib.finish(lambda: drawn.append(1)) == 60.0
+    assert calib.verified and not calib.recalibrated
+    assert len(drawn) == 30 + 60 + 1
+    assert 'verified' in cache.get(displayKey(mon, win))
+
+
+def test_wrong_cached_rate_is_recalibrated(tmp_path):
+    mon, clock, win = _window(60)
+    cache = CalibrationCache(str(tmp_path / 'calibration.json'))
+    cache.put(displayKey(mon, win), {'refreshRate': 75.0})
+    calib = RefreshCalibration(win, displayKey(mon, win), cache, clock=clock.getTime, fullFrames=120)
+    while calib.step():
+        clock.advance(0.001)                    # other work between frames doesn't matter
+    assert np.isclose(calib.checkedRate, 60.0) and not calib.verified
+    assert calib.recalibrated and np.isclose(calib.refreshRate, 60.0)
+    assert np.isclose(cache.get(displayKey(mon, win))['refreshRate'], 60.0)
+
+
+def test_pauses_are_not_measured(tmp_path):
+    mon, clock, win = _window(60)
+    cache = CalibrationCache(str(tmp_path / 'calibration.json'))
+    cache.put(displayKey(mon, win), {'refreshRate': 60.0})
+    calib = RefreshCalibration(win, displayKey(mon, win), cache, clock=clock.getTime, warmUpFrames=0)
+    for i in range(20):
+        calib.step()
+        if i % 5 == 4:
+            calib.pause()
+            clock.advance(2.0)
+    calib.finish()
+    assert calib.verified
+
+
+@pytest.mark.parametrize('cached, recalibrated', [(60.0, False), (75.0, True)])
+def test_experiment_uses_the_checked_rate(tmp_path, cached, recalibrated):
+    mon, clock, win = _window(60)
+    cache = CalibrationCache(str(tmp_path / 'calibration.json'))
+    cache.put(displayKey(mon, win), {'refreshRate': cached})
+    calib = RefreshCalibration(win, displayKey(mon, win), cache, clock=clock.getTime, fullFrames=120)
+    exp = ANTExp(mon, win, win.size, calib.refreshRate, clock, 0.0, io.StringIO(), backend=SimBackend(clock),
+                 calibration=calib)
+    exp.log.console = io.StringIO()
+    assert exp.displayText("Ready?") is False   # the simulated key comes at once, leaving the check pending
+    assert calib.pending
+    block = exp.fullExperiment()
+    exp.close()
+    assert not calib.pending and calib.recalibrated == recalibrated
+    assert np.isclose(exp.refreshRate, 60.0)
+    assert np.allclose(block[:, 5], 0.1, atol=1e-6)
+    assert exp.flipSummary(0).onTime == exp.flipSummary().onTime == 4*48
+    assert ("recalibrated to 60.000 Hz" in exp.log.console.getvalue()) == recalibrated
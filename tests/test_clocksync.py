@@ -0,0 +1,84 @@
+import time
+
+import numpy as np
+
+from clocksync import ClockFit, ClockSync
+
+
+def test_clock_fit_recovers_a_known_drift():
+    rng = np.random.RandomState(0)
+    x = np.sort(rng.random_sample(500))*3600
+    y = 1.7e9 + 12.5 + x*(1 + 40e-6) + 20e-6*rng.standard_normal(len(x))
+    fit = ClockFit()
+    for a, b in zip(x, y):
+        fit.add(a, b)
+    assert abs(fit.params[1] - (1 + 40e-6)) < 0.05e-6
+    assert abs(float(fit.forward(1800.0)) - (1.7e9 + 12.5 + 1800*(1 + 40e-6))) < 10e-6
+    t = np.linspace(0, 3600, 7)
+    assert np.allclose(fit.inverse(fit.forward(t)), t, rtol=0, atol=1e-6)
+
+
+def test_clock_fit_with_one_sample_is_an_offset():
+    fit = ClockFit()
+    fit.add(10.0, 110.0)
+    assert fit.params[1] == 1.0
+    assert float(fit.forward(12.0)) == 112.0
+
+
+class DriftingClocks(object):
+    """A reference clock advancing 1ms per reading, and clocks derived from it (read halfway between
+    two readings of the reference, as the sample takes the middle of its bracket)
+    """
+    def __init__(self):
+        self.t = 0.0
+
+    def reference(self):
+        self.t += 0.001
+        return self.t
+
+    def source(self, offset, ppm):
+        return lambda: offset + (self.t + 0.0005)*(1 + ppm*1e-6)
+
+
+def test_sync_converts_between_clocks():
+    clocks = DriftingClocks()
+    sync = ClockSync(clocks.reference, {'wall': clocks.source(1.7e9, 25), 'tracker': clocks.source(-3.0, -80)},
+                     capacity=50)
+    for i in range(100):
+        clocks.t += 10.0
+        sync.sample()
+    d = sync.diagnostics()
+    assert abs(d['wall']['drift'] - 25) < 0.01 and abs(d['tracker']['drift'] + 80) < 0.01
+    assert d['wall']['nSamples'] == 50 and d['wall']['maxResidual'] < 1e-5
+    assert abs(d['tracker']['offsetError'] + 80e-6*d['tracker']['span']) < 1e-6
+
+    t = np.array([100.0, 500.0, 1000.0])
+    assert np.allclose(sync.convert(t, 'clock', 'tracker'), -3.0 + t*(1 - 80e-6), rtol=0, atol=1e-5)
+    tracker = -3.0 + t*(1 - 80e-6)
+    assert np.allclose(sync.convert(tracker, 'tracker', 'wall'), 1.7e9 + t*(1 + 25e-6), rtol=0, atol=1e-5)
+    h = sync.history()
+    assert h.shape == (50, 4) and np.all(np.diff(h[:, 0]) > 0)
+
+
+def test_background_sampling():
+    clocks = DriftingClocks()
+    sync = ClockSync(clocks.reference, {'wall': clocks.source(0.0, 0)}, interval=0.001)
+    sync.start()
+    deadline = time.time() + 5
+    while sync.n < 5 and time.time() < deadline:
+        time.sleep(0.001)
+    sync.stop()
+    assert sync.n >= 5
+    n = sync.n
+    assert sync.thread is None and len(sync.history()) == n
+
+
+def test_logged_wall_times_use_the_sync(simExp):
+    exp = simExp()
+    sync = ClockSync(exp.clock.getTime, {'wall': lambda: 1000.0 + 1.001*exp.clock.getTime()})
+    sync.sample()
+    exp.clock.advance(100.0)
+    sync.sample()
+    exp.clockSync = sync
+    res = exp._oneProcedure(exp.procedures[0])
+    assert np.isclose(res.wt, 1000.0 + 1.001*res.t0)
@@ -0,0 +1,181 @@
+import os
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+from ant import Bunch, allProcedures
+from collector import (Collector, CollectorClient, ColumnStore, recordDtype, storedDtype, _header, _magic, _ack,
+                       _recvExactly)
+
+
+def _freePort():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+@pytest.fixture
+def collector(tmp_path):
+    c = Collector(str(tmp_path / 'results'), port=0, flushInterval=0.05)
+    c.start()
+    yield c
+    c.close()
+
+
+def test_trials_arrive_in_the_store(collector, simExp, tmp_path):
+    client = CollectorClient('station-1', port=collector.address[1], spool=str(tmp_path / 'spool'), batchSize=10)
+    exp = simExp(store=client)
+    block = exp.fullExperiment()
+    client.close()
+    collector.stop()
+
+    columns = ColumnStore.load(collector.store.path)
+    assert columns['stations'] == ['station-1']
+    assert len(columns['seq']) == 48 and list(columns['seq']) == list(range(48))
+    order = np.argsort(block[:, 0], kind='stable')
+    assert np.array_equal(columns['t0'], block[order, 0])
+    assert np.array_equal(columns['index'], block[order, 1])
+    assert np.all(columns['response'] == 1) and np.all(columns['station'] == 0)
+    assert client.nSent == 48 and client.nSpooled == 0
+    assert not os.path.exists(client.spool)
+
+
+def test_spooled_while_down_then_sent_once(simExp, tmp_path):
+    port = _freePort()
+    spool = str(tmp_path / 'spool')
+    client = CollectorClient('station-2', port=port, spool=spool, session=7, retryInterval=0.0, timeout=0.2)
+    exp = simExp(store=client)
+    exp.fullExperiment()
+    exp.store.flush()
+    assert client.nSpooled == 48
+    assert os.path.getsize(spool) == 48*recordDtype.itemsize
+
+    collector = Collector(str(tmp_path / 'results'), port=port, flushInterval=0.05)
+    collector.start()
+    try:
+        exp.fullExperiment()
+        client.close()
+        assert not os.path.exists(spool)
+        assert client.nSent == 96
+
+        # Resending everything (e.g. after a lost acknowledgement) stores nothing new
+        again = CollectorClient('station-2', port=port, spool=str(tmp_path / 'spool2'), session=7)
+        exp.store = again
+        exp.fullExperiment()
+        again.close()
+        assert collector.nDuplicates == 48
+    finally:
+        collector.close()
+
+    columns = ColumnStore.load(str(tmp_path / 'results'))
+    assert list(columns['seq']) == list(range(96))       # spooled records first, in order
+    assert np.all(columns['session'] == 7)
+    assert list(columns['block']) == [0]*48 + [1]*48
+
+
+def _results(n):
+    procedures = allProcedures()
+    return [Bunch(condition=procedures[i % 48], wt=1000.0 + 4*i, t0=4.0*i, d1=0.5, ct=0.1, d2=0.4, rt=0.45, tf=4.0,
+                  resp='OK') for i in range(n)]
+
+
+def test_concurrent_stations(collector, tmp_path):
+    nStations, n, resent = 8, 1500, 400
+    results = _results(n)
+    clients = []
+
+    def station(name, session, trials):
+        client = CollectorClient(name, port=collector.address[1], spool=str(tmp_path / (name + str(len(trials)))),
+                                 session=session, batchSize=32)
+        for i, res in enumerate(trials):
+            client.append(i // 48, res.condition.index, res.condition.warning, res.condition.congruency, res)
+        client.close()
+        clients.append(client)
+
+    threads = [threading.Thread(target=station, args=('station-%d' % s, s, results)) for s in range(nStations)]
+    # A second client of station 0 resending the start of its session at the same time
+    threads.append(threading.Thread(target=station, args=('station-0', 0, results[:resent])))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    collector.stop()
+
+    assert len(clients) == nStations + 1 and all(c.nSpooled == 0 for c in clients)
+    assert collector.nRecords == nStations*n
+    assert collector.nDuplicates == resent
+    columns = ColumnStore.load(collector.store.path)
+    assert sorted(columns['stations']) == sorted('station-%d' % s for s in range(nStations))
+    for number, name in enumerate(columns['stations']):
+        mine = columns['station'] == number
+        assert list(columns['seq'][mine]) == list(range(n))         # once each, in order
+        assert np.all(columns['session'][mine] == int(name.split('-')[1]))
+        assert np.array_equal(columns['t0'][mine], 4.0*np.arange(n))
+
+
+def test_duplicates_dropped_across_restarts(tmp_path):
+    path = str(tmp_path / 'results')
+    records = np.zeros(5, dtype=recordDtype)
+    records['session'] = 3
+    records['seq'] = np.arange(5)
+    first = Collector(path)
+    first._ingest('s', records)
+    first.close()
+
+    second = Collector(path)
+    second._ingest('s', records[2:])
+    records['seq'] = np.arange(5, 10)
+    second._ingest('s', records)
+    second.close()
+    columns = ColumnStore.load(path)
+    assert list(columns['seq']) == list(range(10))
+    assert second.nDuplicates == 3
+
+
+def _frame(name, count, records=b''):
+    return _header.pack(_magic, len(name), count) + name + records
+
+
+def test_oversized_frames_drop_the_connection(collector):
+    sock = socket.create_connection(collector.address, 2)
+    try:
+        records = np.zeros(2, dtype=recordDtype)
+        records['seq'] = (0, 1)
+        sock.sendall(_frame(b's', 2, records.tobytes()))
+        assert _ack.unpack(bytes(_recvExactly(sock, _ack.size)))[0] == 2
+        sock.sendall(_frame(b's', collector.maxRecords + 1))
+        assert sock.recv(1) == b''
+    finally:
+        sock.close()
+    assert collector.nRecords == 2
+
+
+def test_partial_appends_are_cut_back(tmp_path):
+    path = str(tmp_path / 'results')
+    store = ColumnStore(path)
+    records = np.zeros(4, dtype=storedDtype)
+    store.append(records)
+    store.close()
+    with open(os.path.join(path, 'seq.bin'), 'ab') as f:
+        f.write(b'\0'*(2*8 + 3))                 # two more values and a partial one
+    with open(os.path.join(path, 'rt.bin'), 'ab') as f:
+        f.write(b'\0'*4)
+    assert all(len(c) == 4 for n, c in ColumnStore.load(path).items() if n != 'stations')
+
+    store = ColumnStore(path)
+    store.append(records[:1])
+    store.close()
+    columns = ColumnStore.load(path)
+    assert all(len(c) == 5 for n, c in columns.items() if n != 'stations')
+    assert os.path.getsize(os.path.join(path, 'seq.bin')) == 5*8
+
+
+def test_store_layout_is_checked(tmp_path):
+    path = str(tmp_path / 'results')
+    ColumnStore(path).close()
+    with pytest.raises(ValueError):
+        ColumnStore(path, dtype=recordDtype)
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from design import generateOrders, saveOrders, loadOrders, factorLevels, runLengths, transitionCounts
+
+
+def test_run_lengths_and_transitions():
+    levels = np.array([0, 0, 1, 1, 2])
+    orders = np.array([[0, 1, 2, 3, 4], [0, 2, 1, 4, 3]])
+    assert list(runLengths(orders, levels)) == [2, 1]
+    t = transitionCounts(orders, levels)
+    assert t.shape == (2, 3, 3)
+    assert t[0, 0, 0] == 1 and t[0, 0, 1] == 1 and t[0, 1, 2] == 1
+    assert t.sum(axis=(1, 2)).tolist() == [4, 4]
+
+
+def test_orders_meet_the_constraints():
+    maxRepeats = {'cue': 2, 'tloc': 3, 'tdir': 3, 'flank': 3}
+    orders = generateOrders(100, nBlocks=3, maxRepeats=maxRepeats, seed=1)
+    assert orders.shape == (100, 3, 48)
+    assert np.all(np.sort(orders, axis=-1) == np.arange(48))      # each block is a permutation
+    levels = factorLevels()
+    for f, m in maxRepeats.items():
+        assert runLengths(orders, levels[f]).max() <= m
+
+
+def test_cue_transitions_are_balanced():
+    orders = generateOrders(50, nBlocks=2, seed=2)
+    t = transitionCounts(orders, factorLevels()['cue'])
+    # 47 transitions over 16 (from, to) pairs: about 3 each
+    assert t.min() >= 1 and t.max() <= 5
+    unbalanced = transitionCounts(generateOrders(50, nBlocks=2, balance=None, seed=2), factorLevels()['cue'])
+    assert t.std(axis=(2, 3)).mean() < unbalanced.std(axis=(2, 3)).mean()
+
+
+def test_orders_are_reproducible():
+    assert np.array_equal(generateOrders(5, seed=3), generateOrders(5, seed=3))
+    assert not np.array_equal(generateOrders(5, seed=3), generateOrders(5, seed=4))
+
+
+def test_impossible_constraints():
+    with pytest.raises(ValueError):
+        generateOrders(2, maxRepeats={'tdir': 0}, seed=0, maxAttempts=2)
+    with pytest.raises(ValueError):
+        generateOrders(2, maxRepeats={'colour': 2})
+
+
+@pytest.mark.parametrize('ext', ['npz', 'csv'])
+def test_save_load_round_trip(tmp_path, ext):
+    orders = generateOrders(4, nBlocks=2, seed=5)
+    path = str(tmp_path / ('design.' + ext))
+    saveOrders(path, orders, seed=5)
+    loaded = loadOrders(path)
+    assert np.array_equal(loaded.orders, orders)
+    assert loaded.info == ({'seed': 5} if ext == 'npz' else {})
+
+
+def test_experiment_runs_a_given_order(simExp):
+    order = generateOrders(1, nBlocks=1, seed=6)[0, 0]
+    block = simExp().fullExperiment(order=order)
+    run = block[np.argsort(block[:, 0]), 1].astype(int)
+    assert np.array_equal(run, order)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from epochs import eventTimes, epochs, cohortEpochs, groupMeans, sampleRate
+from scores import WARNING
+
+
+def test_event_times(simExp):
+    block = simExp().fullExperiment()
+    assert np.array_equal(eventTimes(block, 'fixation'), block[:, 0])
+    assert np.allclose(eventTimes(block, 'target') - eventTimes(block, 'cue'), block[:, 5] + block[:, 6])
+    assert np.allclose(eventTimes(block, 'response') - eventTimes(block, 'target'), block[:, 7])
+    with pytest.raises(ValueError):
+        eventTimes(block, 'blink')
+
+
+def _loop(at, tmin, length, samples, times):
+    """Per epoch reference implementation"""
+    out = np.full((len(at), length, samples.shape[1]), np.nan)
+    for e, t in enumerate(at):
+        i = np.searchsorted(times, t + tmin)
+        if i + length <= len(samples) and times[min(i, len(times) - 1)] - (t + tmin) <= 0.01:
+            out[e] = samples[i:i + length]
+    return out
+
+
+def test_epochs_match_a_loop():
+    rate = 100.0
+    times = 5 + np.arange(1000) / rate
+    samples = np.column_stack((np.sin(times), np.cos(times)))
+    assert np.isclose(sampleRate(times), rate)
+    at = np.array([4.9, 5.3, 7.777, 9.0, 14.8, 20.0])
+    ep = epochs(times, samples, at, -0.2, 0.5)
+    assert ep.shape == (6, 70, 2)
+    assert np.array_equal(np.isnan(ep[:, 0, 0]), [True, False, False, False, True, True])
+    assert np.allclose(ep, _loop(at, -0.2, 70, samples, times), equal_nan=True)
+
+
+def test_baseline_correction():
+    times = np.arange(500) / 50.0
+    samples = times*2.0 + 3.0
+    ep = epochs(times, samples, [2.0, 5.0], -0.2, 0.4, baseline=(-0.2, 0))
+    assert ep.shape == (2, 30, 1)
+    assert np.allclose(ep[:, :10].mean(axis=1), 0)
+    assert np.allclose(ep[0, :, 0], ep[1, :, 0])
+
+
+def test_group_means_skip_nan():
+    ep = np.arange(24, dtype=float).reshape(4, 3, 2)
+    ep[1, 0, 0] = np.nan
+    means, counts = groupMeans(ep, [0, 0, 1, 2], 4)
+    assert np.allclose(means[0, 0, 0], ep[0, 0, 0])
+    assert np.allclose(means[0, 1:], ep[:2, 1:].mean(axis=0))
+    assert counts[0, 0, 0] == 1 and counts[0, 1, 1] == 2
+    assert np.all(np.isnan(means[3])) and np.all(counts[3] == 0)
+
+
+def test_cohort_epochs(simExp):
+    sessions = []
+    for s in range(2):
+        block = simExp(rng=np.random.RandomState(s)).fullExperiment()
+        times = np.arange(0, 200, 1/60.0)
+        sessions.append((times, np.full(len(times), float(s)), block))
+    ep, results, session = cohortEpochs(sessions, 'target', -0.1, 0.5, rate=60.0)
+    assert ep.shape == (96, 36, 1)
+    assert np.array_equal(session, np.repeat([0, 1], 48))
+    assert np.array_equal(results[:, WARNING], np.concatenate([b[:, WARNING] for t, s, b in sessions]))
+    assert np.all(ep[session == 1] == 1) and np.all(ep[session == 0] == 0)
@@ -0,0 +1,62 @@
+import io
+
+import numpy as np
+
+from ant import ANTExp
+from fliptiming import FlipMonitor, CUE, TARGET
+from simdisplay import SimMonitor, SimClock, SimWindow, SimBackend
+
+
+def test_record_classifies_against_tolerance():
+    flips = FlipMonitor(0.010, capacity=2)
+    assert flips.record(CUE, 0, 1.0, 1.004) == 0
+    assert flips.record(CUE, 1, 1.0, 0.996) == 0
+    assert flips.record(CUE, 2, 1.0, 0.990) == -1
+    assert flips.record(TARGET, 3, 1.0, 1.012) == 1
+    assert flips.record(TARGET, 4, 1.0, 1.021) == 2
+    assert len(flips.flips()) == 5              # grown beyond the capacity
+
+    s = flips.summary()
+    assert (s.nFlips, s.onTime, s.late, s.early, s.droppedFrames) == (5, 2, 2, 1, 3)
+    assert (s.worstCondition, s.worstPhase) == (4, TARGET)
+    assert np.isclose(s.maxError, 0.021)
+    assert s.histogram[0].sum() == 5
+    assert "3 dropped frames" in str(s)
+
+
+def test_empty_summary():
+    s = FlipMonitor(1/60.0).summary(block=3)
+    assert s.nFlips == 0 and s.worstCondition == -1
+    assert "0 flips" in str(s)
+
+
+class DroppingWindow(SimWindow):
+    """Misses the retrace on every 10th flip"""
+    def flip(self, clearBuffer=True):
+        if self.frameN % 10 == 9:
+            self.clock.advance(self.frameTime)
+        SimWindow.flip(self, clearBuffer)
+
+
+def test_dropped_frames_are_detected():
+    mon = SimMonitor()
+    clock = SimClock()
+    win = DroppingWindow(clock, 60, monitor=mon)
+    exp = ANTExp(mon, win, win.size, 60, clock, 0.0, io.StringIO(), backend=SimBackend(clock))
+    exp.log.console = io.StringIO()
+    exp.fullExperiment()
+    exp.close()
+
+    s = exp.flipSummary(0)
+    assert s.nFlips == 4*48
+    assert s.late > 0 and s.early == 0
+    assert s.droppedFrames == s.late            # one frame each
+    assert s.onTime + s.late == s.nFlips
+    assert np.isclose(s.maxError, 1/60.0, atol=1e-6)
+
+
+def test_perfect_display_is_on_time(simExp):
+    exp = simExp()
+    exp.fullExperiment()
+    s = exp.flipSummary()
+    assert s.nFlips == 4*48 and s.onTime == s.nFlips
@@ -0,0 +1,121 @@
+import struct
+import socket
+import time
+
+import numpy as np
+
+from gaze import GazeRecorder, ReplaySource, SocketSource
+
+
+class CountingClock(object):
+    """Each reading is 10ms later than the one before"""
+    def __init__(self):
+        self.t = 0.0
+
+    def getTime(self):
+        self.t += 0.01
+        return self.t
+
+
+class ListSource(object):
+    """Hands out the given batch sizes (at most what fits), one per read, with sample values counting up"""
+    nChannels = 2
+
+    def __init__(self, sizes):
+        self.sizes = list(sizes)
+        self.sent = 0
+
+    def readInto(self, out):
+        if not self.sizes:
+            time.sleep(0.001)
+            return 0
+        k = min(self.sizes.pop(0), len(out))
+        out[:k, 0] = self.sent + np.arange(k)
+        out[:k, 1] = -out[:k, 0]
+        self.sent += k
+        return k
+
+
+def _record(sizes, capacity, rate=1000.0):
+    source = ListSource(sizes)
+    rec = GazeRecorder(source, CountingClock(), capacity=capacity, rate=rate)
+    rec.start()
+    deadline = time.time() + 5
+    while source.sizes and time.time() < deadline:
+        time.sleep(0.001)
+    time.sleep(0.01)
+    rec.stop()
+    return rec
+
+
+def test_ring_keeps_the_latest_samples():
+    rec = _record([3, 5, 7, 1, 9, 4], capacity=16)
+    assert rec.n == 29
+    t, s = rec.samples(0)
+    assert np.array_equal(s[:, 0], np.arange(29 - 16, 29))
+    assert np.all(np.diff(t) > 0)
+    # The last sample of a batch gets its arrival time, earlier ones are spread at the rate
+    t, s = rec.samples(25, 29)
+    assert np.allclose(t, 0.06 + np.arange(-3, 1)/1000.0)
+
+
+def test_batches_wrap_a_small_ring():
+    rec = _record([3, 6, 3], capacity=4)
+    assert len(rec._batch) == 4 and rec.n == 10
+    t, s = rec.samples(0)
+    assert np.array_equal(s[:, 0], np.arange(6, 10))
+
+
+def test_between_matches_brute_force():
+    rec = _record([5]*40, capacity=64)
+    times, data = rec.samples(0)
+    for t0, t1 in [(0, 1), (0.2, 0.3), (0.255, 0.3051), (0.37, 0.38), (1, 2), (0.3, 0.2)]:
+        t, s = rec.between(t0, t1)
+        keep = (times >= t0) & (times < t1)
+        assert np.array_equal(t, times[keep])
+        assert np.array_equal(s, data[keep])
+
+
+def test_replay_source_keeps_its_rate():
+    data = np.column_stack((np.arange(50.0), np.zeros(50)))
+    source = ReplaySource(data, rate=500.0)
+    out = np.zeros((256, 2))
+    got = []
+    start = time.time()
+    while sum(len(g) for g in got) < 50 and time.time() - start < 5:
+        k = source.readInto(out)
+        got.append(out[:k, 0].copy())
+    elapsed = time.time() - start
+    assert np.array_equal(np.concatenate(got), np.arange(50.0))
+    assert 0.08 <= elapsed < 1.0
+    assert source.readInto(out) == 0            # not looping
+
+
+def test_socket_source():
+    source = SocketSource(nChannels=3, port=0)
+    port = source.sock.getsockname()[1]
+    rec = GazeRecorder(source, CountingClock(), capacity=100, rate=250.0)
+    rec.start()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for i in range(10):
+            sender.sendto(struct.pack('<6d', 2*i, 1, 2, 2*i + 1, 1, 2), ('127.0.0.1', port))
+        deadline = time.time() + 5
+        while rec.n < 20 and time.time() < deadline:
+            time.sleep(0.005)
+    finally:
+        sender.close()
+        rec.stop()
+        source.close()
+    t, s = rec.samples(0)
+    assert np.array_equal(s[:, 0], np.arange(20.0))
+    assert np.all(s[:, 1:] == (1, 2))
+
+
+def test_procedures_record_their_sample_range(simExp):
+    source = ListSource([])
+    rec = GazeRecorder(source, CountingClock(), capacity=100)
+    exp = simExp(gaze=rec)
+    rec.n = 7                                   # not started: the range simply stays where it is
+    res = exp._oneProcedure(exp.procedures[0])
+    assert res.gaze == (7, 7)
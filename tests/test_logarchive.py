@@ -0,0 +1,78 @@
+import numpy as np
+
+from logarchive import readLog, summarizeFile, aggregate, LogStats
+from participant import Population
+from scores import networkScores
+
+
+def _session(simExp, tmp_path, name, seed, nBlocks=2):
+    exp = simExp(responder=Population().participant(np.random.RandomState(seed)))
+    blocks = np.concatenate([exp.fullExperiment() for b in range(nBlocks)])
+    exp.log.flush()
+    path = tmp_path / name
+    path.write_text(exp.logfile.getvalue())
+    return str(path), blocks
+
+
+def test_read_log_matches_results(simExp, tmp_path):
+    path, blocks = _session(simExp, tmp_path, 'p01.log', 1)
+    info = {}
+    chunks = list(readLog(path, chunkSize=40, info=info))
+    assert [len(c) for c in chunks] == [40, 40, 16]
+    trials = np.concatenate(chunks)
+    order = np.argsort(blocks[:, 0], kind='stable')
+    assert np.allclose(trials['t0'], blocks[order, 0], atol=5e-4)
+    assert np.array_equal(trials['warning'], blocks[order, 2])
+    assert np.array_equal(trials['congruency'], blocks[order, 3])
+    assert np.allclose(trials['rt'], blocks[order, 7], atol=5e-4)
+    assert np.array_equal(trials['response'] == 1, blocks[order, 9] == 1)
+    assert info == {'truncated': False, 'skipped': 1}        # the header
+
+
+def test_truncated_and_foreign_lines(tmp_path):
+    path = tmp_path / 'p02.log'
+    path.write_text(u"wallt;t0;warning;position;direction;congruency;d1;ct;d2;rt;tf;response\n"
+                    u"Key pressed: space\n"
+                    u"1.0;0.5;center;top;left;congruent;0.6;0.1;0.4;0.45;4.0;OK\n"
+                    u"2.0;4.5;spatial;bottom;right;incongruent;0.6;0.1;0.4;0.5;4.0;No")
+    info = {}
+    trials = np.concatenate(list(readLog(str(path), info=info)))
+    assert len(trials) == 1 and trials['rt'][0] == np.float32(0.45)
+    assert info == {'truncated': True, 'skipped': 3}
+
+
+def test_aggregate_matches_network_scores(simExp, tmp_path):
+    sessions = [_session(simExp, tmp_path, 'p%02d.log' % i, i) for i in range(3)]
+    missing = str(tmp_path / 'missing.log')
+    summary = aggregate([p for p, b in sessions] + [missing], processes=1)
+    assert sorted(summary.paths) == sorted([p for p, b in sessions] + [missing])
+    assert list(summary.files['failed']) == [False, False, False, True]
+
+    expected = networkScores(np.stack([b for p, b in sessions]), statistic='mean')
+    for i, (path, blocks) in enumerate(sessions):
+        f = summary.files[summary.paths.index(path)]
+        assert f['nTrials'] == 96
+        assert abs(f['executive'] - expected['executive'][i]) < 1e-3
+        assert abs(f['accuracy'] - expected['accuracy'][i]) < 1e-9
+    assert summary.total.scores().nTrials == 3*96
+
+
+def test_merge_equals_single_pass(simExp, tmp_path):
+    path, blocks = _session(simExp, tmp_path, 'p01.log', 2)
+    whole = summarizeFile(path)[1]
+    merged = LogStats()
+    for chunk in readLog(path, chunkSize=10):
+        part = LogStats()
+        part.add(chunk)
+        merged.merge(part)
+    assert np.array_equal(merged.count, whole.count)
+    assert np.allclose(merged.rtSum, whole.rtSum)
+
+
+def test_aggregate_in_processes(simExp, tmp_path):
+    paths = [_session(simExp, tmp_path, 'p%02d.log' % i, i, nBlocks=1)[0] for i in range(2)]
+    single = aggregate(paths, processes=1)
+    pooled = aggregate(paths, processes=2)
+    assert sorted(pooled.paths) == sorted(single.paths)
+    assert pooled.total.scores().nTrials == single.total.scores().nTrials == 96
+    assert np.allclose(pooled.total.rtSum, single.total.rtSum)
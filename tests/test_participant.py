@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from participant import Population, runSession, simulateBlocks, tCritical, powerAnalysis
+from scores import networkScores
+
+
+def test_seeded_sessions_are_reproducible():
+    a = runSession(Population().participant(np.random.RandomState(4)), nBlocks=2)
+    b = runSession(Population().participant(np.random.RandomState(4)), nBlocks=2)
+    assert a.shape == (96, 11)
+    assert np.array_equal(a, b)
+
+
+def test_session_shows_the_population_effects():
+    pop = Population(sdNetwork=0.0, errorRate=0.0, incongruentErrors=0.0, tau=0.02, sigma=0.01)
+    s = networkScores(runSession(pop.participant(np.random.RandomState(1)), nBlocks=2))
+    # RTs are measured from the quantized target flip, so allow a frame or so
+    assert abs(s['alerting'][0] - pop.alerting) < 0.02
+    assert abs(s['orienting'][0] - pop.orienting) < 0.02
+    assert abs(s['executive'][0] - pop.executive) < 0.02
+    assert s['accuracy'][0] == 1.0
+
+
+def test_simulated_blocks():
+    pop = Population()
+    data = simulateBlocks(pop, 200, nBlocks=2, rng=np.random.RandomState(0))
+    assert data.shape == (200, 96, 11)
+    assert np.all(data[..., 10] == 1)
+    assert np.all(data[..., 7] <= pop.tOut)
+    s = networkScores(data, statistic='mean')
+    assert abs(s['executive'].mean() - pop.executive) < 0.01
+    assert abs(s['orienting'].mean() - pop.orienting) < 0.01
+
+
+def test_t_critical():
+    assert abs(tCritical(10) - 2.228) < 0.002
+    assert abs(tCritical(1000) - 1.962) < 0.002
+
+
+def test_power_grows_with_effect_and_cohort():
+    curves = powerAnalysis('orienting', effects=(0.0, 0.03), nParticipants=(5, 20), nBlocks=(2,),
+                           nCohorts=200, processes=1)
+    power = curves['power'].reshape(2, 2)
+    assert np.all(power[0] < 0.15)              # about alpha without an effect
+    assert power[1, 1] > power[1, 0]
+    assert power[1, 1] > 0.8
+
+
+def test_unknown_network():
+    with pytest.raises(ValueError):
+        powerAnalysis('vigilance', (0.01,), (10,), processes=1)
@@ -0,0 +1,55 @@
+import io
+
+import numpy as np
+import pytest
+
+from ant import ANTExp
+from simdisplay import SimBackend, SimClock, SimMonitor, SimWindow
+
+
+class CountingWindow(SimWindow):
+    """Keeps the number of draw calls before every flip"""
+    def __init__(self, *args, **kwds):
+        SimWindow.__init__(self, *args, **kwds)
+        self.draws = []
+
+    def flip(self, clearBuffer=True):
+        self.draws.append(self.nDraws)
+        SimWindow.flip(self, clearBuffer)
+
+
+class WindowImageBackend(SimBackend):
+    """Captures every buffer as a full window image with a 40x20 mark just below the middle"""
+    def bufferImage(self, stim):
+        image = np.full((900, 1440, 4), 127, dtype=np.uint8)
+        image[445:465, 700:740] = 0
+        return image
+
+
+def _drawsPerFlip(**kwds):
+    mon = SimMonitor()
+    clock = SimClock()
+    win = CountingWindow(clock, 60, monitor=mon)
+    exp = ANTExp(mon, win, win.size, 60, clock, 0.0, io.StringIO(), backend=SimBackend(clock), **kwds)
+    exp.log.console = io.StringIO()
+    win.draws = []
+    assert exp.fullExperiment() is not None
+    exp.close()
+    return win.draws
+
+
+@pytest.mark.parametrize('original', [True, False])
+def test_one_draw_per_flip(original):
+    draws = _drawsPerFlip(precompose=True, original=original)
+    assert len(draws) == 6*48 and max(draws) == 1
+    assert max(_drawsPerFlip(original=original)) > 1
+
+
+def test_screens_are_cropped(simExp):
+    exp = simExp(precompose=True, backend=WindowImageBackend(SimClock()))
+    images = dict((id(s), s) for screens in exp.cueScreens for stims in screens for s in stims
+                  if hasattr(s, 'image')).values()
+    assert len(images) == 3                     # double, and spatial at both locations
+    for stim in list(images) + exp.visTarget:
+        assert stim.image.shape == (20, 40, 4)
+        assert stim.pos == (0.0, -5.0)
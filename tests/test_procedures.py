@@ -0,0 +1,47 @@
+import numpy as np
+
+from ant import (allProcedures, targets, targetNames, warningCodes, congruencyCodes, locationCodes,
+                 directionCodes)
+
+
+def test_all_procedures():
+    procedures = allProcedures()
+    assert len(procedures) == 48
+    assert len(set((p.cue, p.tloc, p.tdir, p.flank) for p in procedures)) == 48
+    for i, p in enumerate(procedures):
+        assert p.index == i
+        assert (p.warning, p.location, p.direction, p.congruency) == \
+            (warningCodes[p.cue], locationCodes[p.tloc], directionCodes[p.tdir], congruencyCodes[p.flank])
+        assert targets[p.target] == (p.tloc, p.tdir, p.flank)
+        assert targetNames[p.target] == p.tloc + p.tdir + p.flank
+        assert p.text == ";".join((p.cue, p.tloc, p.tdir, p.flank))
+    # Balanced: 12 procedures per cue, 24 per location and direction, 16 per flanker type
+    assert np.bincount([p.warning for p in procedures]).tolist() == [12]*4
+    assert np.bincount([p.direction for p in procedures]).tolist() == [24]*2
+    assert np.bincount([p.congruency for p in procedures]).tolist() == [16]*3
+
+
+def test_results_are_coded_per_procedure(simExp):
+    exp = simExp()
+    block = exp.fullExperiment()
+    for row in block:
+        p = exp.procedures[int(row[1])]
+        assert (row[2], row[3]) == (p.warning, p.congruency)
+
+
+def test_alternative_response_keys(simExp):
+    exp = simExp(responder=lambda c: ('f' if c.tdir == 'left' else 'j', 0.5))
+    block = exp.fullExperiment()
+    assert np.all(block[:, 9] == 1)
+    exp = simExp(responder=lambda c: ('j' if c.tdir == 'left' else 'f', 0.5))
+    assert np.all(exp.fullExperiment()[:, 9] == 0)
+
+
+def test_log_records_use_the_names(simExp):
+    exp = simExp()
+    block = exp.fullExperiment()
+    exp.log.flush()
+    records = [l.split(';') for l in exp.logfile.getvalue().splitlines()[1:] if l.count(';') == 11]
+    names = set(tuple(r[2:6]) for r in records)
+    assert names == set((p.cue, p.tloc, p.tdir, p.flank) for p in exp.procedures)
+    assert set(r[11] for r in records) == {'OK'}
@@ -0,0 +1,65 @@
+import io
+import json
+import time
+
+import numpy as np
+
+from profiler import Profiler
+
+
+def test_spans_and_summary():
+    prof = Profiler()
+    for i in range(5):
+        with prof.span('sleep'):
+            time.sleep(0.002)
+    f = prof.timed(lambda x: x*2, 'double')
+    assert f(21) == 42
+    assert prof.timed(f, 'again') is f          # not timed twice
+
+    spans = prof.spans()
+    assert len(spans) == 6
+    assert list(spans['phase']) == [0]*5 + [1]
+    assert np.all(spans['duration'][:5] >= 2e6)
+    rows = prof.summary()
+    assert [r[:2] for r in rows] == [('sleep', 5), ('double', 1)]
+    assert rows[0][3] >= 2.0
+
+
+def test_buffer_is_bounded():
+    prof = Profiler(capacity=3)
+    for i in range(5):
+        with prof.span('x'):
+            pass
+    assert prof.n == 3 and prof.dropped == 2
+    out = io.StringIO()
+    prof.printSummary(out)
+    assert "2 spans dropped" in out.getvalue()
+
+
+def test_chrome_trace(tmp_path):
+    prof = Profiler()
+    with prof.span('a'):
+        with prof.span('b'):
+            pass
+    path = str(tmp_path / 'trace.json')
+    prof.chromeTrace(path)
+    with open(path) as f:
+        events = json.load(f)['traceEvents']
+    assert [e['name'] for e in events] == ['b', 'a']
+    assert min(e['ts'] for e in events) == 0
+    assert all(e['ph'] == 'X' and e['dur'] >= 0 for e in events)
+
+
+def test_experiment_is_profiled_without_patching(simExp):
+    prof = Profiler()
+    exp = simExp(profiler=prof)
+    win, backend = exp.win, exp.backend
+    exp.fullExperiment()
+    counts = dict(r[:2] for r in prof.summary())
+    assert counts['trial'] == 48 and counts['record'] == 48
+    assert counts['flip'] == 6*48 and counts['waitKeys'] == 48
+    assert counts['draw'] > 48
+    # The caller's objects are left alone, so displayText isn't counted
+    assert 'flip' not in win.__dict__ and 'wait' not in backend.__dict__ and 'waitKeys' not in backend.__dict__
+    exp.displayText("Done", noWait=True)
+    assert dict(r[:2] for r in prof.summary())['flip'] == 6*48
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from render import SessionRenderer, _fill, main
+from simdisplay import SimMonitor
+from store import SessionStore
+
+
+def test_fill_square_with_antialiasing():
+    canvas = np.zeros((10, 10))
+    _fill(canvas, np.array([(2.0, 2.0), (6.0, 2.0), (6.0, 6.0), (2.0, 6.0)]), 255, 1)
+    assert canvas.sum() == 16*255 and np.all(canvas[2:6, 2:6] == 255)
+
+    canvas = np.zeros((10, 10))
+    _fill(canvas, np.array([(2.5, 2.0), (6.5, 2.0), (6.5, 6.0), (2.5, 6.0)]), 100, 4)
+    assert np.isclose(canvas.sum(), 16*100)
+    assert np.allclose(canvas[2:6, 2], 50) and np.allclose(canvas[2:6, 6], 50)
+
+
+@pytest.fixture(scope='module')
+def renderer():
+    return SessionRenderer(SimMonitor(), (1440, 900), 60, scale=0.25)
+
+
+def _session(simExp, tmp_path, pause=0.0):
+    store = SessionStore(str(tmp_path / 'p01.npy'), nTrials=2*48)
+    exp = simExp(store=store)
+    exp.fullExperiment()
+    exp.clock.advance(pause)                    # e.g. a text screen between blocks
+    exp.fullExperiment()
+    store.close()
+    return SessionStore.load(str(tmp_path / 'p01.npy'))
+
+
+def test_screens(renderer):
+    assert renderer.size == (360, 225)
+    blank, fixation = renderer.screens[renderer.BLANK], renderer.screens[renderer.FIXATION]
+    assert np.all(blank == 255)
+    assert 0 < np.count_nonzero(fixation < 255) < 200
+    assert len(set(renderer.cueScreen.ravel()) | set(renderer.targetScreen.ravel())) == 8 + 12
+    cues = [renderer.screens[s] for s in renderer.cueScreen.ravel()]
+    assert np.array_equal(cues[0], fixation) and np.array_equal(cues[1], fixation)     # no cue
+    assert len(set(c.tobytes() for c in cues)) == 1 + 1 + 1 + 2  # none, center, double, spatial top/bottom
+    for s in renderer.targetScreen.ravel():
+        assert np.count_nonzero(renderer.screens[s] < 128) > np.count_nonzero(fixation < 128)
+
+
+def test_frames_follow_the_trials(renderer, simExp, tmp_path):
+    trials = _session(simExp, tmp_path)
+    ids = renderer.frameScreens(trials)
+    # Trials run back to back, 4s and a frame each
+    assert len(ids) == 2*48*241
+    assert renderer.GAP not in ids
+    first = trials[0]
+    assert ids[0] == renderer.FIXATION
+    assert ids[int(round(first['d1']*60))] == renderer.cueScreen[first['warning'], first['location']]
+
+
+def test_screen_changes_on_the_flips(renderer, simExp, tmp_path):
+    # Varying reaction times, with every fifth trial timing out
+    calls = []
+
+    def responder(condition):
+        calls.append(condition)
+        return None if len(calls) % 5 == 0 else (condition.tdir, 0.3 + 0.0137*len(calls))
+
+    store = SessionStore(str(tmp_path / 'p01.npy'), nTrials=48)
+    exp = simExp(store=store, responder=responder)
+    flips = []
+    flip = exp._flip
+
+    def recordFlip():
+        flip()
+        flips.append(int(round(exp.clock.getTime()*60)))
+    exp._flip = recordFlip
+    exp.fullExperiment()
+    store.close()
+    trials = SessionStore.load(str(tmp_path / 'p01.npy'))
+    assert np.any(trials['response'] == -1)
+
+    ids = renderer.frameScreens(trials)
+    flips = np.array(flips) - flips[0]
+    changes = np.flatnonzero(ids[1:] != ids[:-1]) + 1
+    assert set(changes) <= set(flips)
+    # Each trial flips fixation, cue, fixation, target, response and end screens
+    for trial, (target, response) in zip(trials, flips.reshape(-1, 6)[:, 3:5]):
+        screen = renderer.targetScreen[trial['location'], trial['direction'], trial['congruency']]
+        assert np.all(ids[target:response] == screen) and ids[response] != screen
+
+
+def test_gaps_between_blocks(renderer, simExp, tmp_path):
+    trials = _session(simExp, tmp_path, pause=60.0)
+    ids = renderer.frameScreens(trials)
+    assert np.count_nonzero(ids == renderer.GAP) == 3600
+    assert len(ids) == 2*48*241 + 3600
+
+
+class Sink(object):
+    def __init__(self):
+        self.sizes = []
+
+    def write(self, data):
+        self.sizes.append(len(data))
+
+
+def test_write_raw_in_bounded_chunks(renderer, simExp, tmp_path):
+    trials = _session(simExp, tmp_path, pause=60.0)
+    sink = Sink()
+    n = renderer.writeRaw(sink, trials, chunkBytes=1 << 20)
+    frameBytes = 360*225
+    assert n == len(renderer.frameScreens(trials))
+    assert sum(sink.sizes) == n*frameBytes
+    assert max(sink.sizes) <= 1 << 20
+    assert renderer.writeRaw(Sink(), trials, start=100, stop=150) == 50
+
+
+def test_write_images_and_main(renderer, simExp, tmp_path):
+    trials = _session(simExp, tmp_path)
+    n = renderer.writeImages(str(tmp_path / 'frames'), trials[:2])
+    names = sorted(p.name for p in (tmp_path / 'frames').iterdir())
+    assert len(names) == n and names[0] == 'frame-0000000.pgm'
+    data = (tmp_path / 'frames' / names[1]).read_bytes()
+    assert data.startswith(b'P5\n360 225\n255\n') and len(data) == len(b'P5\n360 225\n255\n') + 360*225
+
+    out = tmp_path / 'p01.raw'
+    assert main([str(tmp_path / 'p01.npy'), '--scale', '0.25', '--output', str(out)]) == 0
+    assert out.stat().st_size == len(renderer.frameScreens(trials))*360*225
@@ -0,0 +1,94 @@
+import sys
+import time
+import threading
+import types
+
+import pytest
+
+from responses import ResponseCollector, QueueSource, KeyboardSource
+
+
+class RealClock(object):
+    def __init__(self, offset=0.0):
+        self.offset = offset
+
+    def getTime(self):
+        return time.time() + self.offset
+
+
+@pytest.fixture
+def collector():
+    source = QueueSource()
+    c = ResponseCollector(source, RealClock())
+    c.start()
+    yield source, c
+    c.stop()
+
+
+def test_key_is_stamped_when_detected(collector):
+    source, c = collector
+    pressedAt = []
+
+    def press():
+        time.sleep(0.05)
+        pressedAt.append(c.clock.getTime())
+        source.press('left')
+    threading.Thread(target=press).start()
+    key, t = c.waitKeys(maxWait=2, timeStamped=True)[0]
+    assert key == 'left'
+    assert 0 <= t - pressedAt[0] < 0.02
+
+
+def test_keys_are_kept_in_order(collector):
+    source, c = collector
+    for k in ('a', 'b', 'c'):
+        source.press(k)
+    assert [c.waitKeys(maxWait=1)[0] for i in range(3)] == ['a', 'b', 'c']
+
+
+def test_timeout_on_the_collector_clock(collector):
+    source, c = collector
+    t0 = time.time()
+    assert c.waitKeys(maxWait=0.1) is None
+    assert 0.09 <= time.time() - t0 < 0.5
+
+
+def test_clear_events(collector):
+    source, c = collector
+    source.press('right')
+    time.sleep(0.02)
+    c.clearEvents()
+    assert c.waitKeys(maxWait=0.05) is None
+
+
+def test_time_stamps_on_another_clock(collector):
+    source, c = collector
+    source.press('space')
+    time.sleep(0.02)
+    other = RealClock(offset=-1000.0)
+    key, t = c.waitKeys(maxWait=1, timeStamped=other)[0]
+    assert abs(t - (other.getTime() - 0.02)) < 0.015
+    with pytest.raises(TypeError):
+        c.waitKeys(maxWait=0, timeStamped=1.5)
+
+
+def test_poll_stats(collector):
+    source, c = collector
+    time.sleep(0.05)
+    s = c.pollStats()
+    assert s.nPolls > 10
+    assert 0 < s.mean <= s.p99 <= s.max < 0.05
+
+
+def test_keyboard_source_requires_ptb(monkeypatch):
+    keyboard = types.ModuleType('psychopy.hardware.keyboard')
+    keyboard.havePTB = False
+    hardware = types.ModuleType('psychopy.hardware')
+    hardware.keyboard = keyboard
+    psychopy = types.ModuleType('psychopy')
+    psychopy.hardware = hardware
+    monkeypatch.setitem(sys.modules, 'psychopy', psychopy)
+    monkeypatch.setitem(sys.modules, 'psychopy.hardware', hardware)
+    monkeypatch.setitem(sys.modules, 'psychopy.hardware.keyboard', keyboard)
+    with pytest.raises(RuntimeError):
+        KeyboardSource()
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from participant import Population
+from runstats import Welford, P2Quantile, RunningStats
+from scores import networkScores
+
+
+def test_welford_matches_numpy():
+    x = np.random.RandomState(0).standard_normal(1000)*3 + 10
+    w = Welford()
+    for v in x:
+        w.add(v)
+    assert np.isclose(w.mean, x.mean())
+    assert np.isclose(w.variance(), x.var(ddof=1))
+    assert np.isclose(w.sem(), x.std(ddof=1)/np.sqrt(len(x)))
+    assert np.isnan(Welford().variance())
+
+
+@pytest.mark.parametrize('n', [1, 2, 3, 4, 5])
+def test_p2_is_exact_for_few_values(n):
+    q = P2Quantile()
+    x = [0.7, 0.1, 0.5, 0.3, 0.9][:n]
+    for v in x:
+        q.add(v)
+    assert np.isclose(q.value(), np.median(x))
+
+
+@pytest.mark.parametrize('dist', ['normal', 'exgauss', 'uniform'])
+def test_p2_median_close_to_numpy(dist):
+    rng = np.random.RandomState(1)
+    n = 5000
+    x = {'normal': rng.standard_normal(n)*0.05 + 0.5,
+         'exgauss': 0.4 + 0.04*rng.standard_normal(n) + rng.exponential(0.1, n),
+         'uniform': rng.random_sample(n)}[dist]
+    q = P2Quantile()
+    for v in x:
+        q.add(v)
+    iqr = np.percentile(x, 75) - np.percentile(x, 25)
+    assert abs(q.value() - np.median(x)) < 0.02*iqr
+
+
+def test_p2_other_quantiles():
+    x = np.random.RandomState(2).random_sample(5000)
+    q = P2Quantile(0.9)
+    for v in x:
+        q.add(v)
+    assert abs(q.value() - np.percentile(x, 90)) < 0.01
+
+
+def test_running_stats_match_network_scores(simExp):
+    exp = simExp(responder=Population().participant(np.random.RandomState(3)), rng=np.random.RandomState(4))
+    seen = []
+    exp.subscribe(lambda res, stats: seen.append(stats.estimates().nTrials))
+    blocks = [exp.fullExperiment() for b in range(3)]
+    assert seen == list(range(1, 3*48 + 1))
+
+    e = exp.stats.estimates()
+    s = networkScores(blocks, statistic='mean')
+    for name in ('alerting', 'orienting', 'executive', 'accuracy'):
+        assert np.isclose(getattr(e, name), s[name][0])
+    assert e.nTrials == 3*48
+    data = np.concatenate(blocks)
+    ok = data[:, 9] == 1
+    assert np.isclose(e.meanRT, data[ok, 7].mean())
+    rt = data[ok, 7]
+    # P^2 on ~140 values: allow a few standard errors of the sample median (about 1.25 sd/sqrt(n))
+    assert abs(e.medianRT - np.median(rt)) < 3*1.25*rt.std()/np.sqrt(len(rt))
+    assert e.executiveSE > 0
+    assert "144 trials" in str(e)
+
+
+def test_empty_estimates():
+    e = RunningStats().estimates()
+    assert e.nTrials == 0 and np.isnan(e.accuracy) and np.isnan(e.executive)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from ant import warningCodes, congruencyCodes
+from scores import networkScores, groupMedian, groupMean, WARNING, CONGRUENCY, RT, CORRECT, COMPLETED
+
+
+def _rows(rng, n=480):
+    rows = np.zeros((n, 11))
+    rows[:, WARNING] = rng.randint(0, 4, n)
+    rows[:, CONGRUENCY] = rng.randint(0, 3, n)
+    rows[:, RT] = 0.4 + 0.05*rows[:, WARNING] + 0.03*rows[:, CONGRUENCY] + 0.02*rng.standard_normal(n)
+    rows[:, CORRECT] = rng.random_sample(n) > 0.1
+    rows[:, COMPLETED] = 1
+    return rows
+
+
+def _expected(rows, statistic):
+    ok = rows[:, CORRECT] == 1
+    rt = lambda col, code: statistic(rows[ok & (rows[:, col] == code), RT])
+    return (rt(WARNING, warningCodes['no']) - rt(WARNING, warningCodes['double']),
+            rt(WARNING, warningCodes['center']) - rt(WARNING, warningCodes['spatial']),
+            rt(CONGRUENCY, congruencyCodes['incongruent']) - rt(CONGRUENCY, congruencyCodes['congruent']))
+
+
+@pytest.mark.parametrize('name,statistic', [('median', np.median), ('mean', np.mean)])
+def test_network_scores_match_direct_computation(name, statistic):
+    rows = _rows(np.random.RandomState(0))
+    s = networkScores(rows, statistic=name)
+    assert len(s) == 1
+    assert np.allclose((s['alerting'][0], s['orienting'][0], s['executive'][0]), _expected(rows, statistic))
+    assert s['nTrials'][0] == len(rows)
+    assert np.isclose(s['accuracy'][0], rows[:, CORRECT].mean())
+
+
+def test_stacked_participants_and_padding():
+    rng = np.random.RandomState(1)
+    data = np.stack([_rows(rng), _rows(rng), _rows(rng)])
+    data[2, 400:] = 0                            # zero padded: not completed
+    s = networkScores(data)
+    assert list(s['participant']) == [0, 1, 2]
+    assert list(s['nTrials']) == [480, 480, 400]
+    for p in range(3):
+        assert np.allclose(s['executive'][p], _expected(data[p, :s['nTrials'][p]], np.median)[2])
+
+
+def test_blocks_with_participant_ids():
+    rng = np.random.RandomState(2)
+    blocks = [_rows(rng, 48) for b in range(4)]
+    s = networkScores(blocks, participant=[7, 7, 3, 3])
+    assert list(s['participant']) == [3, 7]
+    assert np.allclose(s['alerting'][1], _expected(np.concatenate(blocks[:2]), np.median)[0])
+
+
+def test_group_summaries():
+    rng = np.random.RandomState(3)
+    groups = rng.randint(0, 5, 200)
+    values = rng.random_sample(200)
+    med = groupMedian(groups, values, 6)
+    mean = groupMean(groups, values, 6)
+    for g in range(5):
+        assert np.isclose(med[g], np.median(values[groups == g]))
+        assert np.isclose(mean[g], values[groups == g].mean())
+    assert np.isnan(med[5]) and np.isnan(mean[5])
+
+
+def test_unknown_statistic():
+    with pytest.raises(ValueError):
+        networkScores(_rows(np.random.RandomState(4)), statistic='mode')
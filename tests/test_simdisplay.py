@@ -0,0 +1,60 @@
+import numpy as np
+
+from simdisplay import SimClock, SimWindow, SimBackend
+
+
+def test_flip_moves_clock_to_next_retrace():
+    clock = SimClock()
+    win = SimWindow(clock, 60)
+    clock.advance(0.010)
+    win.flip()
+    assert abs(clock.getTime() - 1/60.0) < 1e-9
+    win.flip()
+    assert abs(clock.getTime() - 2/60.0) < 1e-9
+    assert win.frameN == 2
+
+
+def test_wait_keys_times_out_on_virtual_clock():
+    clock = SimClock()
+    backend = SimBackend(clock, responder=lambda condition: None)
+    backend.startTrial(object())
+    assert backend.waitKeys(maxWait=1.5) is None
+    assert clock.getTime() == 1.5
+
+
+def test_full_block_with_perfect_responder(simExp):
+    exp = simExp()
+    block = exp.fullExperiment()
+    assert block.shape == (48, 11)
+    assert np.all(block[:, 10] == 1)            # completed
+    assert np.all(block[:, 9] == 1)             # correct
+    assert np.allclose(block[:, 7], 0.450)      # rt
+    assert np.all((block[:, 4] >= 0.4 - 1e-9) & (block[:, 4] <= 1.6 + 1e-9))
+    assert np.allclose(block[:, 5], 0.100, atol=1/120.0)
+    assert np.allclose(block[:, 6], 0.400, atol=1/120.0)
+    assert sorted(block[:, 1].astype(int)) == list(range(48))
+    # Trials run back to back, 4 s each
+    assert np.allclose(np.diff(np.sort(block[:, 0])), 4.0 + 1/60.0, atol=1e-6)
+
+
+def test_timeouts_and_wrong_keys(simExp):
+    exp = simExp(responder=lambda c: None if c.warning == 0 else ('left' if c.tdir == 'right' else 'right', 0.3))
+    block = exp.fullExperiment()
+    assert np.all(block[:, 10] == 1)
+    assert np.all(block[:, 9] == 0)
+    timedOut = block[:, 2] == 0
+    assert np.all(block[timedOut, 7] > 1.6)
+
+
+def test_escape_aborts_block(simExp):
+    exp = simExp(responder=lambda c: ('escape', 0.3))
+    assert exp.fullExperiment() is None
+
+
+def test_log_has_a_record_per_trial(simExp):
+    exp = simExp()
+    exp.fullExperiment()
+    exp.log.flush()
+    lines = exp.logfile.getvalue().splitlines()
+    assert lines[0].startswith("wallt;t0;")
+    assert len([l for l in lines[1:] if l.count(';') == 11]) == 48
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pytest
+
+from ant import ANTExp, targetNames
+from stimcache import StimCache, crop
+
+
+def test_crop_returns_box_and_center_offset():
+    image = np.zeros((10, 20, 3), dtype=np.uint8)
+    image[2:4, 12:18] = 255
+    cropped, pos = crop(image)
+    assert cropped.shape == (2, 6, 3) and np.all(cropped == 255)
+    assert pos == (5.0, 2.0)                    # right of and above the center
+
+
+def test_crop_of_uniform_image():
+    cropped, pos = crop(np.zeros((4, 4, 4)))
+    assert cropped.shape == (1, 1, 4)
+
+
+def test_save_load_round_trip(tmp_path):
+    cache = StimCache(str(tmp_path))
+    params = {'version': 1, 'winsize': [800, 600]}
+    textures = {'a': (np.arange(24, dtype=np.uint8).reshape(2, 3, 4), (1.5, -2.0)),
+                'b': (np.ones((1, 1, 4), dtype=np.uint8), (0.0, 0.0))}
+    assert cache.load(params) is None
+    cache.save(params, textures)
+    loaded = cache.load(params)
+    assert sorted(loaded) == ['a', 'b']
+    for n in textures:
+        assert np.array_equal(loaded[n][0], textures[n][0])
+        assert loaded[n][1] == textures[n][1]
+    assert cache.load(dict(params, winsize=[1024, 768])) is None
+    assert os.listdir(str(tmp_path)) == [os.path.basename(cache.path(params))]
+
+
+def test_damaged_file_is_a_miss(tmp_path):
+    cache = StimCache(str(tmp_path))
+    params = {'version': 1}
+    with open(cache.path(params), 'wb') as f:
+        f.write(b'not a zip file')
+    assert cache.load(params) is None
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_experiment_saves_and_reuses_targets(simExp, tmp_path, monkeypatch, lazy):
+    cache = StimCache(str(tmp_path))
+    exp = simExp(stimCache=cache, lazyTargets=lazy)
+    if lazy:
+        assert cache.load(cache.params(exp)) is None
+        exp.fullExperiment()                    # builds the targets as they are needed
+    assert all(t is not None for t in exp.visTarget)
+    assert cache.load(cache.params(exp)) is not None
+
+    def fail(*args):
+        raise AssertionError("target built although it is cached")
+    monkeypatch.setattr(ANTExp, '_targetStim', fail)
+    again = simExp(stimCache=cache, lazyTargets=lazy)
+    assert len(again.visTarget) == len(targetNames)
+    assert again.fullExperiment().shape == (48, 11)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from store import SessionStore, trialDtype
+
+
+def _byTime(rows):
+    """fullExperiment returns a block ordered by procedure; the store keeps the order they were run"""
+    return rows[np.argsort(rows[:, 0], kind='stable')]
+
+
+def test_append_load_round_trip(simExp, tmp_path):
+    path = str(tmp_path / 'p01.npy')
+    store = SessionStore(path, nTrials=3*48)
+    exp = simExp(store=store)
+    blocks = [exp.fullExperiment() for b in range(2)]
+    assert np.allclose(store.results(), _byTime(np.concatenate(blocks)), atol=1e-6)
+    store.close()
+
+    trials = SessionStore.load(path)
+    assert trials.dtype == trialDtype
+    assert len(trials) == 2*48
+    assert list(np.unique(trials['block'])) == [0, 1]
+    assert np.array_equal(trials['t0'], _byTime(np.concatenate(blocks))[:, 0])
+    assert np.all(trials['response'] == 1)
+    assert np.allclose(SessionStore(path, mode='r').results(), _byTime(np.concatenate(blocks)), atol=1e-6)
+
+
+def test_continue_writing_after_reopen(simExp, tmp_path):
+    path = str(tmp_path / 'p01.npy')
+    store = SessionStore(path, nTrials=2*48)
+    exp = simExp(store=store)
+    first = exp.fullExperiment()
+    store.close()
+
+    store = SessionStore(path, mode='r+')
+    assert store.n == 48
+    exp.store = store
+    second = exp.fullExperiment()
+    assert np.allclose(store.results(), _byTime(np.concatenate((first, second))), atol=1e-6)
+    with pytest.raises(IndexError):
+        exp.fullExperiment()                    # store is full
+    store.close()
+
+
+def test_rejects_foreign_files_and_modes(tmp_path):
+    path = str(tmp_path / 'other.npy')
+    np.save(path, np.zeros(10))
+    with pytest.raises(ValueError):
+        SessionStore(path, mode='r')
+    with pytest.raises(ValueError):
+        SessionStore(path, mode='a')
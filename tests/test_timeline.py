@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from timeline import blockTimeline, ms2frames
+
+
+def test_ms2frames_rounds_to_at_least_one_frame():
+    assert list(ms2frames([0, 5, 10, 100, 1700], 1/60.0)) == [1, 1, 1, 6, 102]
+    assert ms2frames(100, 1/144.0) == 14
+
+
+@pytest.mark.parametrize('rate', [60, 120, 144, 240])
+def test_block_timeline_is_frame_quantized(rate):
+    frameTime = 1.0 / rate
+    order = np.random.RandomState(0).permutation(48)
+    plan = blockTimeline(order, frameTime, rng=np.random.RandomState(1))
+    assert list(plan['procedure']) == list(order)
+    assert np.all((plan['d1'] >= 400) & (plan['d1'] < 1600) & (plan['d1'] % 10 == 0))
+    assert np.all(np.abs(plan['cue']*frameTime - plan['d1']/1000.0) <= frameTime/2 + 1e-9)
+    assert np.all(plan['fixation'] - plan['cue'] == ms2frames(100, frameTime))
+    assert np.all(plan['target'] - plan['fixation'] == ms2frames(400, frameTime))
+    assert np.all(plan['timeout'] - plan['target'] == ms2frames(1700, frameTime))
+    assert np.all(plan['end'] == np.maximum(ms2frames(4000, frameTime), plan['timeout'] + 1))
+
+
+def test_seeded_timeline_is_reproducible():
+    a = blockTimeline(range(48), 1/60.0, rng=np.random.RandomState(5))
+    b = blockTimeline(range(48), 1/60.0, rng=np.random.RandomState(5))
+    assert np.array_equal(a, b)
+
+
+def test_seeded_sessions_are_reproducible(simExp):
+    blocks = [simExp(rng=np.random.RandomState(11)).fullExperiment() for i in range(2)]
+    assert np.array_equal(blocks[0], blocks[1])
+    other = simExp(rng=np.random.RandomState(12)).fullExperiment()
+    assert not np.array_equal(blocks[0][:, 0], other[:, 0])
+
+
+@pytest.mark.parametrize('rate', [60, 144])
+def test_procedures_follow_the_timeline(simExp, rate):
+    block = simExp(refreshRate=rate).fullExperiment()
+    # Every phase is shown for a whole number of frames
+    assert np.allclose(block[:, 4]*rate, np.rint(block[:, 4]*rate), atol=1e-6)
+    assert np.allclose(block[:, 5], ms2frames(100, 1.0/rate)/float(rate), atol=1e-6)
+    assert np.allclose(block[:, 6], ms2frames(400, 1.0/rate)/float(rate), atol=1e-6)
+    assert np.allclose(block[:, 8], ms2frames(4000, 1.0/rate)/float(rate), atol=1e-6)
@@ -0,0 +1,52 @@
+"""
+Frame quantized, precomputed block timelines
+
+Before a block starts, the timing of every procedure in it (fixation, cue, target, timeout and end
+of trial) is drawn and converted to whole frames at the measured refresh rate, so the run loop
+only has to look up the frame at which to flip next. Frame numbers are counted from the initial
+fixation flip (t0) of each procedure.
+"""
+import numpy as np
+
+timelineDtype = np.dtype([
+    ('procedure', np.int16),        # index of the procedure to run
+    ('d1', np.int16),               # the random fixation time drawn (ms), before quantization
+    ('cue', np.int32),              # frame at which the cue is shown
+    ('fixation', np.int32),         # frame at which the cue is removed again
+    ('target', np.int32),           # frame at which the target is shown
+    ('timeout', np.int32),          # frame at which we stop waiting for a response
+    ('end', np.int32),              # frame ending the procedure
+])
+
+
+def ms2frames(ms, frameTime):
+    """Number of whole frames closest to ms milliseconds (but at least one)"""
+    return np.maximum(np.rint(np.asarray(ms) / (1000.0*frameTime)).astype(np.int32), 1)
+
+
+def blockTimeline(order, frameTime, tD1min=400, tD1max=1600, tCue=100, tNoCue=400, tOut=1700, tExp=4000,
+                  rng=None):
+    """Precompute the frame timing of a block of procedures
+
+    order -- the procedure indices, in the order they are to be run
+    frameTime -- the (measured) duration of a frame in seconds
+    tD1min, tD1max -- range of the random initial fixation time (ms, drawn in steps of 10ms)
+    tCue -- cue duration (ms)
+    tNoCue -- time from the end of the cue until the target (ms)
+    tOut -- time from the target until the response times out (ms)
+    tExp -- total procedure time (ms)
+    rng -- a numpy RandomState to draw from (default is the global numpy random state)
+
+    Returns an array of timelineDtype, one row per procedure
+    """
+    rng = rng if rng is not None else np.random
+    n = len(order)
+    plan = np.zeros(n, dtype=timelineDtype)
+    plan['procedure'] = order
+    plan['d1'] = tD1min + 10*rng.randint(0, (tD1max - tD1min + 9)//10, n)
+    plan['cue'] = ms2frames(plan['d1'], frameTime)
+    plan['fixation'] = plan['cue'] + ms2frames(tCue, frameTime)
+    plan['target'] = plan['fixation'] + ms2frames(tNoCue, frameTime)
+    plan['timeout'] = plan['target'] + ms2frames(tOut, frameTime)
+    plan['end'] = np.maximum(ms2frames(tExp, frameTime), plan['timeout'] + 1)
+    return plan